@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Async read views (see ASYNC_READ_VIEWS in settings)
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+# Persistent connections are per thread, and under ASGI the threads that run
+# database work are not reused the way WSGI worker threads are, so connections
+# would pile up instead of being reused. Close them after every request.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
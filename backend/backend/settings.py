@@ -85,6 +85,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "backend.wsgi.application"
 
+# Serve the feed, photo detail and saved photos from async views. backend/asgi.py
+# turns this on; under WSGI every async view runs in its own event loop, which
+# costs more than it saves.
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "0") == "1"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -97,9 +102,31 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        # Keep connections open between requests (0 closes them after every
+        # request, the default under ASGI, see backend/asgi.py) and check they
+        # are still usable before reusing them
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 300)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read replicas, as comma-separated host[:port] in DB_REPLICA_HOSTS. They share the
+# primary's name and credentials; views wrapped in core.routers.replica_reads
+# send their GET reads to them. Tests read from the primary.
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), start=1):
+    host, _, port = address.strip().partition(":")
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.routers.PrimaryReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -137,6 +164,10 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Local files written by the upload pipeline (staged uploads, offline storage)
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -144,15 +175,30 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 14,  # Load 20 images per request
+    # Per-scope rates of the throttles in core/throttling.py
+    'DEFAULT_THROTTLE_RATES': {
+        'toggle': '120/min',  # likes, saves and follows, per user
+        'comment': '30/min',  # per user
+        'register': '10/hour',  # per IP
+        'password_reset': '10/hour',  # per IP
+        'password_reset_email': '3/hour',  # per email address
+    },
+    # Reverse proxies in front of the app. Client IPs for throttling come from
+    # X-Forwarded-For only behind this many proxies, so clients cannot pick
+    # their own; 0 uses the connection's address.
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES", 0)),
 }
 
+# Cache holding the throttle counters; shared between workers when REDIS_URL is set
+THROTTLE_CACHE_ALIAS = "default"
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -188,4 +234,92 @@ EMAIL_PORT = int(os.getenv("EMAIL_PORT"))
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS")
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
-DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
\ No newline at end of file
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
+
+# Cache
+# Local memory by default; set REDIS_URL to share the cache between workers.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# Cached anonymous feed pages and photo details (see core/caching.py)
+RESPONSE_CACHE_ALIAS = "default"
+RESPONSE_CACHE_TIMEOUT = 300
+# Lifetime of the version keys behind both caches; longer than RESPONSE_CACHE_TIMEOUT
+# and PHOTO_FRAGMENT_CACHE_TIMEOUT, so entries never outlive their version
+RESPONSE_CACHE_VERSION_TIMEOUT = 60 * 60
+
+# Users behind JWTs (see core/authentication.py) are cached in each process for
+# AUTH_USER_CACHE_TIMEOUT seconds, and in the shared cache when one is configured
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TIMEOUT = 30
+AUTH_USER_SHARED_CACHE_ALIAS = "default" if os.getenv("REDIS_URL") else None
+AUTH_USER_SHARED_CACHE_TIMEOUT = 300
+
+# Home timelines (see core/timeline.py). Authors with more followers than
+# TIMELINE_FANOUT_LIMIT are merged in at read time instead of fanned out;
+# TIMELINE_WORKERS = 0 fans out inline.
+# A photo is fanned out only by the worker that saved it, so timelines need a
+# cache that every worker shares. Without REDIS_URL there is none: nothing is
+# fanned out and home feeds are read from the database. Cached timelines are
+# rebuilt after TIMELINE_CACHE_TIMEOUT seconds, so one that missed an update
+# does not stay wrong.
+TIMELINE_CACHE_ALIAS = "default" if os.getenv("REDIS_URL") else None
+TIMELINE_CACHE_TIMEOUT = 60 * 60
+TIMELINE_SIZE = 500
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_WORKERS = int(os.getenv("TIMELINE_WORKERS", 2))
+
+# Trending scores (see core/trending.py) halve every TRENDING_HALF_LIFE seconds;
+# run "manage.py decay_trending_scores" every few minutes
+TRENDING_HALF_LIFE = 12 * 60 * 60
+
+# Photo search (see core/search.py): "fulltext" uses MySQL FULLTEXT indexes,
+# "index" the built-in inverted index, "auto" FULLTEXT whenever the database is MySQL.
+# Run "manage.py rebuild_search_index" after switching to "index".
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+
+# Per-process LRU cache of rendered photos shared by every listing (see core/caching.py)
+PHOTO_FRAGMENT_CACHE_SIZE = 5000
+PHOTO_FRAGMENT_CACHE_TIMEOUT = 300
+
+# Upload pipeline (see core/uploads.py)
+# UPLOAD_WORKERS = 0 runs uploads inline; LocalUploadStorage keeps files under
+# MEDIA_ROOT instead of sending them to Cloudinary. Staged files stay outside
+# MEDIA_ROOT, which is served in DEBUG.
+UPLOAD_STORAGE_BACKEND = os.getenv("UPLOAD_STORAGE_BACKEND", "core.uploads.CloudinaryUploadStorage")
+UPLOAD_STAGING_DIR = Path(os.getenv("UPLOAD_STAGING_DIR", BASE_DIR / "staging"))
+UPLOAD_LOCAL_STORAGE_DIR = MEDIA_ROOT / "uploads"
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 4))
+UPLOAD_MAX_ATTEMPTS = 3
+UPLOAD_RETRY_DELAY = 2  # seconds, doubled after every failed attempt
+
+# Resumable chunked uploads (uploads/chunked/)
+UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_EXPIRY = 24 * 60 * 60  # seconds without a chunk before process_uploads removes a session
+
+# Image derivatives (core/imaging.py) are rendered in a pool of this many
+# processes; 0 renders them in the upload worker itself
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+# Transactional email outbox (see core/outbox.py)
+# OUTBOX_WORKERS = 0 sends inline after commit; run "manage.py send_outbox"
+# periodically (or with --loop) to send retries and anything a restart left behind.
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 1))
+OUTBOX_BATCH_SIZE = 50  # messages sent over one SMTP connection
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60  # seconds, doubled after every failed attempt
+OUTBOX_LEASE = 300  # seconds a claimed message is left to its sender before it is due again
+OUTBOX_RETENTION = 7 * 24 * 60 * 60  # seconds sent and discarded messages are kept
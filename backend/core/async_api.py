@@ -0,0 +1,101 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+# Async read views on top of DRF.
+#
+# DRF's APIView only dispatches synchronously, so under ASGI every @api_view
+# request is handed to a thread. async_api_view gives an async view function the
+# parts of APIView that the read endpoints rely on: a DRF Request, authentication
+# and permission checks, DRF's exception responses and JSON rendering. It
+# supports safe methods only, renders JSON only (no browsable API) and does not
+# throttle.
+#
+# Authenticators with an aauthenticate() coroutine (CachedJWTAuthentication) are
+# awaited; any other is run in a thread. Permission classes are declared with
+# DRF's @permission_classes and must not query the database.
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def async_api_view(view):
+    permission_classes = getattr(view, 'permission_classes', api_settings.DEFAULT_PERMISSION_CLASSES)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            if request.method not in SAFE_METHODS:
+                raise exceptions.MethodNotAllowed(request.method)
+            await authenticate(request)
+            for permission in (permission() for permission in permission_classes):
+                if not permission.has_permission(request, None):
+                    if request.authenticators and not request.successful_authenticator:
+                        raise exceptions.NotAuthenticated()
+                    raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+            response = await view(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            response = handle_exception(request, exc)
+        return finalize_response(request, response)
+
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+async def authenticate(request):
+    # Request._authenticate(), awaiting the authenticators
+    for authenticator in request.authenticators:
+        try:
+            if hasattr(authenticator, 'aauthenticate'):
+                user_auth = await authenticator.aauthenticate(request)
+            else:
+                user_auth = await sync_to_async(authenticator.authenticate)(request)
+        except exceptions.APIException:
+            not_authenticated(request)
+            raise
+        if user_auth is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth
+            return
+    not_authenticated(request)
+
+
+def not_authenticated(request):
+    # Set before DRF looks at them, or it would authenticate synchronously
+    request._authenticator = None
+    request.user, request.auth = api_settings.UNAUTHENTICATED_USER(), None
+
+
+def handle_exception(request, exc):
+    # APIView.handle_exception()
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        # WWW-Authenticate header for 401 responses, else coerce to 403
+        auth_header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        if auth_header:
+            exc.auth_header = auth_header
+        else:
+            exc.status_code = status.HTTP_403_FORBIDDEN
+    response = api_settings.EXCEPTION_HANDLER(exc, {'request': request, 'args': (), 'kwargs': {}})
+    if response is None:
+        raise exc
+    response.exception = True
+    return response
+
+
+def finalize_response(request, response):
+    # APIView.finalize_response(), always rendering JSON
+    if isinstance(response, Response):
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = JSONRenderer.media_type
+        response.renderer_context = {'request': request, 'response': response}
+    if response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED:
+        response['Allow'] = ', '.join(SAFE_METHODS)
+    patch_vary_headers(response, ('Accept',))
+    return response
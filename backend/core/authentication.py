@@ -0,0 +1,158 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import LRUFragmentCache
+from .models import Profile
+
+
+# JWT authentication without a database query per request.
+#
+# The token is verified as usual, but the user it names (with their profile) is
+# read from a bounded in-process LRU cache whose entries live for
+# AUTH_USER_CACHE_TIMEOUT seconds, then from the AUTH_USER_SHARED_CACHE_ALIAS
+# cache when one is configured, and only then from the database.
+#
+# Saving or deleting a user or profile drops the entry from this process's cache
+# and from the shared one (see the receivers in core/models.py), which covers
+# password changes and profile edits. Other processes keep their own copy until
+# it expires, so the local timeout bounds how stale a user can be there.
+#
+# Entries hold field values rather than model instances, so every request gets
+# its own User and Profile objects. Those may be older than the database, so
+# views that change a user or profile read it again first and only save the
+# columns they edit.
+
+local_users = LRUFragmentCache(maxsize=settings.AUTH_USER_CACHE_SIZE, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def get_shared_cache():
+    alias = settings.AUTH_USER_SHARED_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def user_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def dump(instance):
+    # Picklable column values of a model instance
+    return [field.get_prep_value(getattr(instance, field.attname)) for field in instance._meta.concrete_fields]
+
+
+def load(model, values):
+    fields = model._meta.concrete_fields
+    converted = [
+        field.from_db_value(value, None, connection) if value is not None and hasattr(field, "from_db_value") else value
+        for field, value in zip(fields, values)
+    ]
+    return model.from_db(model.objects.db, [field.attname for field in fields], converted)
+
+
+def restore(entry):
+    user_values, profile_values = entry
+    user = load(User, user_values)
+    if profile_values is not None:
+        profile = load(Profile, profile_values)
+        User.profile.related.set_cached_value(user, profile)
+        Profile.user.field.set_cached_value(profile, user)
+    return user
+
+
+def fetch(user_id):
+    # From the primary, so a replica that lags behind a password change cannot
+    # put the old user back in the caches
+    user = User.objects.using(DEFAULT_DB_ALIAS).select_related("profile").filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+    if user is None:
+        return None
+    profile = user.profile if hasattr(user, "profile") else None
+    return dump(user), dump(profile) if profile is not None else None
+
+
+def get_user(user_id):
+    # The user with the given id, from the nearest cache that has them; None if
+    # there is no such user
+    key = user_key(user_id)
+    entry = local_users.get_many([key]).get(key)
+    if entry is None:
+        shared = get_shared_cache()
+        entry = shared.get(key) if shared is not None else None
+        if entry is None:
+            entry = fetch(user_id)
+            if entry is None:
+                return None
+            if shared is not None:
+                shared.set(key, entry, timeout=settings.AUTH_USER_SHARED_CACHE_TIMEOUT)
+        local_users.set_many({key: entry})
+    return restore(entry)
+
+
+async def aget_user(user_id):
+    # get_user() for async views: a hit in this process's cache is served on the
+    # event loop, anything else takes one thread hop
+    key = user_key(user_id)
+    entry = local_users.get_many([key]).get(key)
+    if entry is None:
+        return await sync_to_async(get_user)(user_id)
+    return restore(entry)
+
+
+def invalidate_user(user_id):
+    # Forget now so this request's own follow-up reads miss, and again after
+    # commit so a read that raced the transaction cannot keep the old copy cached
+    key = user_key(user_id)
+
+    def forget():
+        local_users.delete_many([key])
+        shared = get_shared_cache()
+        if shared is not None:
+            shared.delete(key)
+
+    forget()
+    transaction.on_commit(forget)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        # JWTAuthentication.get_user, with the lookup served by get_user above
+        return self.check_user(get_user(self.get_user_id(validated_token)), validated_token)
+
+    async def aauthenticate(self, request):
+        # authenticate() for async views
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user = await aget_user(self.get_user_id(validated_token))
+        return self.check_user(user, validated_token), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,354 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+# Response cache for anonymous reads of the feed and photo detail.
+#
+# Entries are never deleted on writes. Each cached payload is keyed by a version
+# number ("feed" for every feed page, "photo:<id>" for one photo), and writes bump
+# the versions they affect so the old entries simply stop being read and expire.
+# Feed pages are stored as photo ids and filled in from the photo fragments
+# below, so only changes to which photos the feed shows bump "feed"; likes,
+# comments and edits only bump the photo's own version.
+# Versions start from the current time in milliseconds, so a version key that was
+# evicted never restarts at a number that old entries still use. They expire
+# after RESPONSE_CACHE_VERSION_TIMEOUT seconds, after every entry stored under
+# them, and reading a photo only creates one once the photo has been found.
+#
+# The backend is whatever settings.CACHES names under RESPONSE_CACHE_ALIAS:
+# local memory by default, Redis when REDIS_URL is set.
+
+FEED = 'feed'
+PHOTO = 'photo'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def photo_namespace(photo_id):
+    return f'photo:{photo_id}'
+
+
+def get_version(namespace, create=True):
+    # None when the namespace has no version and create is false
+    cache = get_cache()
+    version = cache.get(f'version:{namespace}')
+    if version is None and create:
+        cache.add(f'version:{namespace}', int(time.time() * 1000), timeout=settings.RESPONSE_CACHE_VERSION_TIMEOUT)
+        version = cache.get(f'version:{namespace}')
+    return version
+
+
+def get_last_modified(namespace):
+    timestamp = get_cache().get(f'modified:{namespace}')
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def bump_version(namespace):
+    cache = get_cache()
+    try:
+        cache.incr(f'version:{namespace}')
+    except ValueError:
+        cache.add(f'version:{namespace}', int(time.time() * 1000), timeout=settings.RESPONSE_CACHE_VERSION_TIMEOUT)
+    cache.set(f'modified:{namespace}', int(time.time()), timeout=settings.RESPONSE_CACHE_VERSION_TIMEOUT)
+
+
+def invalidate_photo(photo_id, feed=False):
+    # Bump now so this request's own follow-up reads miss, and again after commit
+    # so a read that raced the transaction cannot keep the old payload cached.
+    # feed is for writes that add a photo to the feed or take one out of it.
+    def bump():
+        if feed:
+            bump_version(FEED)
+        bump_version(photo_namespace(photo_id))
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def query_hash(request):
+    # The host is part of the key because paginated payloads carry absolute links
+    query = (request.get_host(), sorted(request.GET.lists()))
+    return hashlib.md5(repr(query).encode()).hexdigest()
+
+
+def feed_key(request):
+    return f'feed:{get_version(FEED)}:{query_hash(request)}'
+
+
+def photo_key(photo_id, create=True):
+    # None when the photo has no version and create is false
+    version = get_version(photo_namespace(photo_id), create)
+    if version is None:
+        return None
+    return f'photo:{photo_id}:{version}'
+
+
+def get_cached(key, namespace):
+    data = get_cache().get(f'response:{key}')
+    record(namespace, 'hits' if data is not None else 'misses')
+    return data
+
+
+def set_cached(key, data):
+    get_cache().set(f'response:{key}', data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def set_cached_feed(key, data):
+    # Caches a feed page with its photos replaced by their ids (see
+    # serializers.serialize_cached_page) and returns the page's ETag and
+    # Last-Modified
+    ids = [photo['id'] for photo in data['results']]
+    set_cached(key, {**data, 'results': ids})
+    return feed_page_state(key, ids)
+
+
+def get_versions(namespaces):
+    # Bulk get_version(): one round-trip for all namespaces that already exist
+    cache = get_cache()
+    keys = {f'version:{namespace}': namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for namespace in namespaces:
+        if namespace not in versions:
+            versions[namespace] = get_version(namespace)
+    return versions
+
+
+# In-process LRU cache of rendered photo fragments: the viewer-independent part
+# of PhotoSerializer's output, keyed by (photo id, photo version). The version
+# comes from the shared cache, so a write in any worker retires the fragment
+# everywhere. Entries also expire after PHOTO_FRAGMENT_CACHE_TIMEOUT seconds,
+# which bounds how long an edited username or profile photo can stay visible.
+class LRUFragmentCache:
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None or entry[0] < now:
+                    self.misses += 1
+                    continue
+                self.entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, mapping):
+        expires = time.monotonic() + self.timeout
+        with self.lock:
+            for key, value in mapping.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+            }
+
+
+photo_fragments = LRUFragmentCache(
+    maxsize=settings.PHOTO_FRAGMENT_CACHE_SIZE,
+    timeout=settings.PHOTO_FRAGMENT_CACHE_TIMEOUT,
+)
+
+
+def photo_fragment_keys(photo_ids):
+    versions = get_versions([photo_namespace(photo_id) for photo_id in photo_ids])
+    return {photo_id: (photo_id, versions[photo_namespace(photo_id)]) for photo_id in photo_ids}
+
+
+# Hit/miss counters, kept in the cache so every worker reports into the same totals
+STAT_NAMESPACES = (FEED, PHOTO)
+
+
+def record(namespace, outcome):
+    cache = get_cache()
+    key = f'stats:{namespace}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cache_stats():
+    cache = get_cache()
+    stats = {}
+    for namespace in STAT_NAMESPACES:
+        hits = cache.get(f'stats:{namespace}:hits', 0)
+        misses = cache.get(f'stats:{namespace}:misses', 0)
+        total = hits + misses
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 4) if total else None,
+        }
+    # Per-process, unlike the counters above
+    stats['fragments'] = photo_fragments.stats()
+    return stats
+
+
+# ETag/Last-Modified for django.views.decorators.http.condition. They are derived
+# from the version counters, so a conditional request is answered without
+# rendering anything. Only anonymous requests are handled: with an Authorization
+# header the payload carries per-viewer fields.
+#
+# A feed page also changes when a photo on it does, so its validators cover the
+# versions of those photos. They are only known once the page is cached; until
+# then the feed view sets them on the response it renders.
+def is_anonymous(request):
+    return 'HTTP_AUTHORIZATION' not in request.META
+
+
+def feed_page_state(key, ids):
+    # ETag and Last-Modified of the cached feed page under key, showing ids
+    namespaces = [FEED] + [photo_namespace(pk) for pk in ids]
+    found = get_cache().get_many([f'{kind}:{namespace}' for namespace in namespaces for kind in ('version', 'modified')])
+    versions = [found.get(f'version:{namespace}') for namespace in namespaces[1:]]
+    etag = f'"feed-{hashlib.md5(repr((key, versions)).encode()).hexdigest()}"'
+    timestamps = [found[f'modified:{namespace}'] for namespace in namespaces if f'modified:{namespace}' in found]
+    return etag, datetime.fromtimestamp(max(timestamps), tz=timezone.utc) if timestamps else None
+
+
+def feed_state(request, *args, **kwargs):
+    # Read once per request, for both the ETag and Last-Modified
+    if not hasattr(request, '_feed_state'):
+        key = feed_key(request)
+        data = get_cache().get(f'response:{key}')
+        request._feed_state = (None, None) if data is None else feed_page_state(key, data['results'])
+    return request._feed_state
+
+
+def feed_etag(request, *args, **kwargs):
+    if not is_anonymous(request):
+        return None
+    return feed_state(request)[0]
+
+
+def feed_last_modified(request, *args, **kwargs):
+    if not is_anonymous(request):
+        return None
+    return feed_state(request)[1]
+
+
+def set_validators(response, state):
+    # Adds the ETag and Last-Modified of a state tuple to a response
+    etag, modified = state
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified.timestamp())
+
+
+def photo_etag(request, pk, *args, **kwargs):
+    if not is_anonymous(request):
+        return None
+    version = get_version(photo_namespace(pk), create=False)
+    return f'"photo-{pk}-{version}"' if version is not None else None
+
+
+def photo_last_modified(request, pk, *args, **kwargs):
+    if not is_anonymous(request):
+        return None
+    return get_last_modified(photo_namespace(pk))
+
+
+# The key of a cached response and the response, if cached. Async views run
+# these in a thread, with all of their cache round-trips in one hop, rather
+# than through Django's a* cache methods, which take a thread hop per call
+# (aget_many even one per key).
+def get_cached_feed(request):
+    key = feed_key(request)
+    return key, get_cached(key, FEED)
+
+
+def get_cached_photo(photo_id):
+    # A photo without a version may not exist, so none is created for it here.
+    # Rendering the photo, once found, creates one (see photo_fragment_keys) and
+    # the next request caches it.
+    key = photo_key(photo_id, create=False)
+    if key is None:
+        record(PHOTO, 'misses')
+        return None, None
+    return key, get_cached(key, PHOTO)
+
+
+# Conditional GET for the async views: the same ETag and Last-Modified as the
+# functions above, both read in one round-trip.
+def get_state(namespace):
+    # Version and last modification time of a namespace, without creating a version
+    found = get_cache().get_many([f'version:{namespace}', f'modified:{namespace}'])
+    version = found.get(f'version:{namespace}')
+    timestamp = found.get(f'modified:{namespace}')
+    return version, datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp is not None else None
+
+
+def photo_state(request, pk, *args, **kwargs):
+    version, modified = get_state(photo_namespace(pk))
+    return f'"photo-{pk}-{version}"' if version is not None else None, modified
+
+
+def async_condition(state_func):
+    # django.views.decorators.http.condition for async views, which would call
+    # its etag and last-modified functions on the event loop. state_func returns
+    # both, runs in a thread and is only asked about anonymous requests.
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = modified = None
+            if is_anonymous(request):
+                etag, modified = await sync_to_async(state_func)(request, *args, **kwargs)
+            last_modified = int(modified.timestamp()) if modified is not None else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,249 @@
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+
+# Image processing.
+#
+# Every uploaded photo is measured (dimensions, dominant color, blurhash
+# placeholder) and rendered into a fixed set of sizes (longest edge in pixels),
+# each encoded as JPEG plus every modern format this Pillow build can write.
+# Decoding and resizing are CPU bound, so they run in a process pool
+# (IMAGE_WORKERS) instead of the upload threads. Everything here is local; only
+# the resulting files go to the upload storage backend.
+VARIANT_SIZES = {
+    "thumb": 320,
+    "feed": 1080,
+    "full": 2048,
+}
+
+# format -> (file extension, Pillow encoder options)
+FORMATS = {
+    "jpeg": ("jpg", {"quality": 85, "optimize": True, "progressive": True}),
+    "webp": ("webp", {"quality": 80, "method": 4}),
+    "avif": ("avif", {"quality": 60}),
+}
+
+
+# Side of the grayscale grid compared by the perceptual hash (64 bits)
+PHASH_SIZE = 8
+
+# Blurhash components along the long and short edge of the image
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SAMPLE_SIZE = 32
+BASE83_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def available_formats():
+    return ["jpeg"] + [name for name in ("webp", "avif") if features.check(name)]
+
+
+def open_image(source):
+    # source is a path or a binary file object; returns the upright RGB image
+    try:
+        with Image.open(source) as opened:
+            return ImageOps.exif_transpose(opened).convert("RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f"Not a valid image file: {e}")
+
+
+def describe_image(image):
+    # Photo fields that let clients lay out and paint a placeholder before the
+    # image itself arrives
+    sample = image.copy()
+    sample.thumbnail((BLURHASH_SAMPLE_SIZE, BLURHASH_SAMPLE_SIZE), Image.Resampling.BOX)
+    long_edge, short_edge = BLURHASH_COMPONENTS
+    components = (long_edge, short_edge) if image.width >= image.height else (short_edge, long_edge)
+    return {
+        "width": image.width,
+        "height": image.height,
+        "dominant_color": dominant_color(sample),
+        "blurhash": blurhash(sample, *components),
+    }
+
+
+def dominant_color(image):
+    # Most common color of an 8-color palette reduction, as "#rrggbb"
+    quantized = image.quantize(colors=8)
+    count, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def render_variants(image, output_dir, stem, sizes=VARIANT_SIZES, formats=("jpeg",)):
+    # Writes every size/format of image into output_dir and describes them.
+    # Sizes are never upscaled: a size that would come out the same as a
+    # smaller one is skipped.
+    variants = []
+    rendered_sizes = set()
+    for name, longest_edge in sorted(sizes.items(), key=lambda item: item[1]):
+        resized = image.copy()
+        resized.thumbnail((longest_edge, longest_edge), Image.Resampling.LANCZOS)
+        if resized.size in rendered_sizes:
+            continue
+        rendered_sizes.add(resized.size)
+
+        for image_format in formats:
+            extension, options = FORMATS[image_format]
+            path = Path(output_dir) / f"{stem}-{name}.{extension}"
+            resized.save(path, image_format.upper(), **options)
+            variants.append({
+                "name": name,
+                "format": image_format,
+                "path": str(path),
+                "width": resized.width,
+                "height": resized.height,
+                "size": path.stat().st_size,
+            })
+    return variants
+
+
+def process_image(source_path, output_dir, sizes=VARIANT_SIZES, formats=("jpeg",)):
+    # Everything the upload pipeline needs from one decode of the file
+    image = open_image(source_path)
+    return {
+        **describe_image(image),
+        "phash": perceptual_hash(image),
+        "variants": render_variants(image, output_dir, Path(source_path).stem, sizes, formats),
+    }
+
+
+def perceptual_hash(image):
+    # Difference hash: shrink to a 9x8 grayscale grid and record whether each
+    # pixel is brighter than its right neighbour. Resizing, recompression and
+    # small edits flip only a few of the 64 bits.
+    grid = image.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = list(grid.getdata())
+    bits = 0
+    for row in range(PHASH_SIZE):
+        for column in range(PHASH_SIZE):
+            left = pixels[row * (PHASH_SIZE + 1) + column]
+            bits = bits << 1 | (left > pixels[row * (PHASH_SIZE + 1) + column + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(first, second):
+    # Number of differing bits between two perceptual hashes
+    return (int(first, 16) ^ int(second, 16)).bit_count()
+
+
+def measure_image(data):
+    # describe_image() for raw file bytes, as fetched by backfill_photo_metadata
+    return describe_image(open_image(BytesIO(data)))
+
+
+# Blurhash (https://blurha.sh): a few DCT components of the image packed into a
+# short base83 string that clients decode into a blurred placeholder.
+def blurhash(image, x_components, y_components):
+    width, height = image.size
+    pixels = [[srgb_to_linear(channel) for channel in pixel] for pixel in image.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == j == 0 else 2
+            red = green = blue = 0.0
+            for y in range(height):
+                y_basis = math.cos(math.pi * j * y / height)
+                row = pixels[y * width:(y + 1) * width]
+                for x, (r, g, b) in enumerate(row):
+                    basis = math.cos(math.pi * i * x / width) * y_basis
+                    red += basis * r
+                    green += basis * g
+                    blue += basis * b
+            scale = normalisation / (width * height)
+            factors.append((red * scale, green * scale, blue * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = encode_base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, math.floor(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max = 0
+        max_value = 1
+    result += encode_base83(quantised_max, 1)
+
+    red, green, blue = (linear_to_srgb(value) for value in dc)
+    result += encode_base83((red << 16) + (green << 8) + blue, 4)
+    for factor in ac:
+        red, green, blue = (
+            max(0, min(18, math.floor(sign_pow(value / max_value, 0.5) * 9 + 9.5))) for value in factor
+        )
+        result += encode_base83(red * 19 * 19 + green * 19 + blue, 2)
+    return result
+
+
+def srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode_base83(value, length):
+    return "".join(BASE83_DIGITS[value // 83 ** (length - i) % 83] for i in range(1, length + 1))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent runs upload threads and DB connections
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def run_in_pool(function, *args):
+    # Runs function in the process pool and waits for it; IMAGE_WORKERS = 0 runs
+    # it in the calling thread
+    if settings.IMAGE_WORKERS == 0:
+        return function(*args)
+    pool = get_process_pool()
+    try:
+        return pool.submit(function, *args).result()
+    except BrokenProcessPool:
+        discard_process_pool(pool)
+        raise
+
+
+def discard_process_pool(pool):
+    # Drops a pool whose worker died, so the next call starts a new one. Only
+    # that pool: another thread may already have replaced it.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def prepare_image(source_path):
+    # Measures the staged file and renders its variants next to it
+    return run_in_pool(process_image, source_path, Path(source_path).parent, VARIANT_SIZES, available_formats())
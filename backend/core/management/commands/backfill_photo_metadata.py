@@ -0,0 +1,101 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import caching, imaging
+from core.models import Photo, UploadStatus
+
+
+def image_url(photo):
+    # Photos posted by the upload form store Cloudinary's delivery URL as their
+    # public id, with the extension split off into the format
+    value = str(photo.image)
+    if value.startswith(('http://', 'https://')):
+        return f'{value}.{photo.image.format}' if photo.image.format else value
+    return photo.image.build_url(secure=True)
+
+
+def fetch_image(url):
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+
+def measure(photo):
+    # Runs in a worker thread: download, then decode in the image process pool.
+    # A decoder crash breaks the pool; run_in_pool() drops it, so only this
+    # photo fails and the next one gets a new pool.
+    try:
+        return photo.pk, imaging.run_in_pool(imaging.measure_image, fetch_image(image_url(photo))), None
+    except (requests.RequestException, imaging.InvalidImage) as e:
+        return photo.pk, None, str(e)
+    except BrokenProcessPool as e:
+        return photo.pk, None, f'Image worker crashed: {e}'
+
+
+# Fills in width, height, dominant_color and blurhash for photos stored before
+# the upload pipeline measured them. Photos are taken in id order, a batch at a
+# time, with the downloads of a batch running in parallel. The last finished id
+# is written to a checkpoint file after every batch, so an interrupted run
+# continues where it stopped; the file is removed once the backfill completes.
+class Command(BaseCommand):
+    help = 'Backfill image dimensions, dominant color and blurhash for existing photos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of photos processed between checkpoints.')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of images downloaded in parallel.')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'backfill_photo_metadata.json'),
+                            help='File recording the progress of the backfill.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore an existing checkpoint and start from the first photo.')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        last_id = 0 if options['restart'] else self.read_checkpoint(checkpoint)
+        if last_id:
+            self.stdout.write(f'Resuming after photo {last_id}')
+
+        pending = Photo.objects.filter(status=UploadStatus.READY, width__isnull=True).exclude(image='')
+        updated = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                photos = list(pending.filter(pk__gt=last_id).order_by('pk')[:options['batch_size']])
+                if not photos:
+                    break
+
+                for pk, metadata, error in executor.map(measure, photos):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'Photo {pk}: {error}')
+                        continue
+                    Photo.objects.filter(pk=pk).update(**metadata)
+                    caching.invalidate_photo(pk)
+                    updated += 1
+
+                last_id = photos[-1].pk
+                self.write_checkpoint(checkpoint, last_id)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} photos, {failed} failed.'))
+
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)['last_id']
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, path, last_id):
+        # Written to a temporary file first so a crash never leaves half a checkpoint
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'last_id': last_id}, f)
+        os.replace(temporary, path)
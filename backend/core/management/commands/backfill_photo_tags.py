@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core import tags
+from core.models import Mention, Photo, PhotoTag, Tag, UploadStatus
+
+
+# Extracts the hashtags and mentions of existing photos, a batch of photos per
+# transaction. Each batch replaces the PhotoTag and Mention rows of its photos
+# and recounts every tag it touched (ready photos only, see core/tags.py), so
+# the command can be rerun at any time.
+class Command(BaseCommand):
+    help = 'Extract hashtags and mentions from the captions of existing photos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of photos processed per transaction.')
+
+    def handle(self, *args, **options):
+        processed = 0
+        last_id = 0
+        while True:
+            photos = list(
+                Photo.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'caption')[:options['batch_size']]
+            )
+            if not photos:
+                break
+            last_id = photos[-1][0]
+            with transaction.atomic():
+                self.process(photos)
+            processed += len(photos)
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} photos.'))
+
+    def process(self, photos):
+        photo_ids = [pk for pk, _ in photos]
+        photo_tags = {pk: tags.extract_tags(caption) for pk, caption in photos}
+        mentions = {pk: tags.extract_mentions(caption) for pk, caption in photos}
+
+        tag_ids = tags.get_tag_ids(list({name for names in photo_tags.values() for name in names}))
+        user_ids = dict(
+            User.objects.filter(username__in={name for names in mentions.values() for name in names})
+            .values_list('username', 'pk')
+        )
+
+        touched = set(PhotoTag.objects.filter(photo__in=photo_ids).values_list('tag_id', flat=True))
+        touched.update(tag_ids.values())
+        PhotoTag.objects.filter(photo__in=photo_ids).delete()
+        PhotoTag.objects.bulk_create(
+            PhotoTag(photo_id=pk, tag_id=tag_ids[name]) for pk, names in photo_tags.items() for name in names
+        )
+        Mention.objects.filter(photo__in=photo_ids).delete()
+        Mention.objects.bulk_create(
+            Mention(photo_id=pk, user_id=user_ids[name])
+            for pk, names in mentions.items() for name in names if name in user_ids
+        )
+
+        counts = PhotoTag.objects.filter(tag=OuterRef('pk'), photo__status=UploadStatus.READY).values('tag').annotate(total=Count('id')).values('total')
+        Tag.objects.filter(pk__in=touched).update(photo_count=Coalesce(Subquery(counts), 0))
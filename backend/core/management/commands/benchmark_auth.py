@@ -0,0 +1,62 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import authentication
+from core.serializers import UserProfileSerializer
+
+BENCHMARK_USERNAME = 'auth-benchmark'
+
+
+def profile_view(authentication_class):
+    # current_user_profile's GET, authenticated by authentication_class
+    @api_view(['GET'])
+    @authentication_classes([authentication_class])
+    @permission_classes([IsAuthenticated])
+    def view(request):
+        return Response(UserProfileSerializer(request.user).data)
+    return view
+
+
+# Compares requests per second of the profile endpoint authenticated by
+# simplejwt's JWTAuthentication (a user query per request) and by
+# CachedJWTAuthentication. Requests are dispatched in-process, so the numbers
+# leave out the web server and show the cost of authentication itself. A
+# throwaway user is created for the run and deleted afterwards.
+class Command(BaseCommand):
+    help = 'Benchmark JWT authentication with and without the cached user lookup.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Number of requests timed per authentication class.')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=BENCHMARK_USERNAME)
+        try:
+            token = str(RefreshToken.for_user(user).access_token)
+            factory = APIRequestFactory()
+            self.stdout.write(f'{"authentication":<26} {"requests/s":>12} {"queries/request":>16}')
+            for authentication_class in (JWTAuthentication, authentication.CachedJWTAuthentication):
+                view = profile_view(authentication_class)
+                authentication.local_users.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(options['requests']):
+                        response = view(factory.get('/api/profile/me/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+                        assert response.status_code == 200, response.data
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{authentication_class.__name__:<26} {options["requests"] / elapsed:>12.0f} '
+                    f'{len(queries) / options["requests"]:>16.2f}'
+                )
+        finally:
+            user.delete()
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import search
+from core.models import Photo
+
+BENCHMARK_USERNAME = 'search-benchmark'
+VOCABULARY_SIZE = 50000
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Measures photo search latency on a synthetic corpus. Captions are drawn from a
+# vocabulary with Zipf-distributed word frequencies, so common words match a
+# large share of the photos and rare ones only a handful. The corpus is owned by
+# a dedicated user and is topped up to --photos on every run. It is never
+# removed, so run this against a scratch database (e.g. DB_NAME=photos_bench).
+# Each query fetches the first page the search endpoint would return.
+class Command(BaseCommand):
+    help = 'Benchmark photo search on a synthetic corpus of captions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photos', type=int, default=1000000,
+                            help='Size of the synthetic corpus.')
+        parser.add_argument('--queries', type=int, default=50,
+                            help='Number of queries timed per query type.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of photos created per transaction.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = [f'word{rank}' for rank in range(1, VOCABULARY_SIZE + 1)]
+        cum_weights = list(accumulate(1 / rank for rank in range(1, VOCABULARY_SIZE + 1)))
+        self.populate(rng, words, cum_weights, options['photos'], options['batch_size'])
+
+        query_types = {
+            'common word': lambda: rng.choice(words[:10]),
+            'mid-frequency word': lambda: rng.choice(words[100:1000]),
+            'rare word': lambda: rng.choice(words[10000:]),
+            'hashtag': lambda: f'#{rng.choice(words[100:1000])}',
+            'two words': lambda: f'{rng.choice(words[:10])} {rng.choice(words[100:1000])}',
+        }
+        backend = 'fulltext' if search.use_fulltext() else 'index'
+        self.stdout.write(f'{backend} backend, {options["queries"]} queries per type, times in ms')
+        self.stdout.write(f'{"query":<20} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}')
+        for name, make_query in query_types.items():
+            samples = []
+            for _ in range(options['queries']):
+                query = make_query()
+                start = time.perf_counter()
+                list(search.search_photos(query).order_by('-search_rank', '-id')[:20])
+                samples.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{name:<20} {statistics.median(samples):>8.1f} {percentile(samples, 0.95):>8.1f} '
+                f'{percentile(samples, 0.99):>8.1f} {max(samples):>8.1f}'
+            )
+
+    def populate(self, rng, words, cum_weights, size, batch_size):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        existing = Photo.objects.filter(user=user).count()
+        if existing < size:
+            self.stdout.write(f'Creating {size - existing} photos...')
+        while existing < size:
+            count = min(batch_size, size - existing)
+            captions = []
+            for _ in range(count):
+                caption = rng.choices(words, cum_weights=cum_weights, k=rng.randint(4, 12))
+                if rng.random() < 0.3:
+                    caption[-1] = f'#{caption[-1]}'
+                captions.append(' '.join(caption))
+
+            with transaction.atomic():
+                last_id = Photo.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+                # bulk_create skips the post_save receivers, so index the batch
+                # here; MySQL does not return the new ids, so read them back
+                Photo.objects.bulk_create(Photo(user=user, caption=caption, image='benchmark.jpg') for caption in captions)
+                if not search.use_fulltext():
+                    search.index_photos(Photo.objects.filter(user=user, pk__gt=last_id).select_related('user'), batch_size)
+            existing += count
@@ -0,0 +1,67 @@
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import trending
+from core.models import Comment, Like, Photo
+
+# Interactions older than this many half-lives add less than 0.1% and are skipped by --rebuild
+REBUILD_HALF_LIVES = 10
+
+
+# Decays every trending score to the current time, a batch of photos per
+# transaction. Meant to run every few minutes (cron or similar). With
+# --rebuild the scores are instead recomputed from the recent likes and
+# comments, e.g. after the first deploy.
+class Command(BaseCommand):
+    help = 'Decay the trending scores of all photos to now, or rebuild them from likes and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of photos updated per transaction.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute scores from recent likes and comments.')
+
+    def handle(self, *args, **options):
+        now = time.time()
+        if options['rebuild']:
+            self.rebuild(now)
+            return
+
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Photo.objects.filter(pk__gt=last_id, trending_score__gt=0)
+                .order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                updated += trending.decay(Photo.objects.filter(pk__in=ids), now)
+
+        self.stdout.write(self.style.SUCCESS(f'Decayed {updated} trending scores.'))
+
+    def rebuild(self, now):
+        since = datetime.fromtimestamp(now, timezone.utc) - timedelta(
+            seconds=settings.TRENDING_HALF_LIFE * REBUILD_HALF_LIVES
+        )
+        scores = defaultdict(float)
+        for model, weight in ((Like, trending.LIKE_WEIGHT), (Comment, trending.COMMENT_WEIGHT)):
+            rows = model.objects.filter(created_at__gte=since).values_list('photo_id', 'created_at')
+            for photo_id, created_at in rows.iterator():
+                scores[photo_id] += weight * math.exp(-(now - created_at.timestamp()) * trending.decay_rate())
+
+        # One transaction, so the trending listing never shows the scores half rebuilt
+        with transaction.atomic():
+            Photo.objects.filter(trending_score__gt=0).update(trending_score=0.0, trending_at=now)
+            for photo_id, score in scores.items():
+                Photo.objects.filter(pk=photo_id).update(trending_score=score, trending_at=now)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt trending scores of {len(scores)} photos.'))
@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core.imaging import hash_distance
+from core.models import ImageAsset, Photo
+
+
+# Burkhard-Keller tree over perceptual hashes under the Hamming distance. Children
+# are keyed by their distance to the parent, so by the triangle inequality a
+# search within radius r only descends into children keyed d - r .. d + r.
+class BKTree:
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        if self.root is None:
+            self.root = node
+            return
+        parent = self.root
+        while True:
+            distance = hash_distance(value, parent[0])
+            child = parent[2].get(distance)
+            if child is None:
+                parent[2][distance] = node
+                return
+            parent = child
+
+    def search(self, value, radius):
+        # Items within radius of value
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hash_distance(value, node_value)
+            if distance <= radius:
+                found.append(item)
+            stack.extend(child for key, child in children.items() if distance - radius <= key <= distance + radius)
+        return found
+
+
+# Reports groups of stored images whose perceptual hashes are within
+# --threshold bits of each other: resized, recompressed or lightly edited
+# copies that exact (SHA-256) deduplication cannot catch. Images are grouped
+# transitively, so a cluster may span more than the threshold end to end.
+class Command(BaseCommand):
+    help = 'Report clusters of near-duplicate photos by perceptual hash.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=6,
+                            help='Maximum number of differing hash bits between neighbours (of 64).')
+
+    def handle(self, *args, **options):
+        hashes = dict(ImageAsset.objects.values_list('pk', 'phash'))
+        tree = BKTree()
+        for pk, value in hashes.items():
+            tree.add(value, pk)
+
+        # Union-find over the neighbours found for every image
+        parents = {pk: pk for pk in hashes}
+
+        def find(pk):
+            while parents[pk] != pk:
+                parents[pk] = parents[parents[pk]]
+                pk = parents[pk]
+            return pk
+
+        for pk, value in hashes.items():
+            for neighbour in tree.search(value, options['threshold']):
+                parents[find(neighbour)] = find(pk)
+
+        clusters = defaultdict(list)
+        for pk in hashes:
+            clusters[find(pk)].append(pk)
+        clusters = sorted((sorted(members) for members in clusters.values() if len(members) > 1), key=len, reverse=True)
+
+        photos = defaultdict(list)
+        asset_ids = [pk for members in clusters for pk in members]
+        for asset_id, photo_id in Photo.objects.filter(asset__in=asset_ids).order_by('pk').values_list('asset', 'pk'):
+            photos[asset_id].append(photo_id)
+
+        for members in clusters:
+            self.stdout.write(f'Cluster of {len(members)} images:')
+            for asset_id in members:
+                photo_ids = ', '.join(str(photo_id) for photo_id in photos[asset_id]) or 'none'
+                self.stdout.write(f'  asset {asset_id} (phash {hashes[asset_id]}): photos {photo_ids}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Found {len(clusters)} clusters of near-duplicates among {len(hashes)} images.'
+        ))
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# HTTP load generator for comparing the API served over WSGI and over ASGI.
+#
+# Start the same code under both servers with the same number of processes and
+# point one --target at each, for example:
+#
+#   gunicorn backend.wsgi -b 127.0.0.1:8001 -w 1 -k gthread --threads 32
+#   uvicorn backend.asgi:application --port 8002 --workers 1
+#   manage.py loadtest --target wsgi=http://127.0.0.1:8001/api/photos/feed/ \
+#                      --target asgi=http://127.0.0.1:8002/api/photos/feed/ --concurrency 256
+#
+# Every client keeps one connection open and sends its requests back to back,
+# so --concurrency is the number of requests in flight. Latency is measured
+# from sending a request to reading the end of its response. Targets are run
+# one after another, each after --warmup requests that are not counted.
+class Command(BaseCommand):
+    help = 'Load test HTTP endpoints and compare throughput and latency percentiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help='Endpoint to load, repeatable.')
+        parser.add_argument('--concurrency', type=int, default=100,
+                            help='Number of connections sending requests at once.')
+        parser.add_argument('--requests', type=int, default=10000,
+                            help='Number of requests counted per target.')
+        parser.add_argument('--warmup', type=int, default=500,
+                            help='Number of requests sent per target before counting.')
+        parser.add_argument('--header', action='append', default=[], metavar='NAME:VALUE',
+                            help='Header sent with every request, repeatable (e.g. "Authorization: Bearer ...").')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Seconds to wait for one response.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep or urlsplit(url).scheme != 'http':
+                raise CommandError(f'Expected NAME=http://host:port/path, got "{target}"')
+            targets.append((name, url))
+        headers = []
+        for header in options['header']:
+            name, sep, value = header.partition(':')
+            if not sep:
+                raise CommandError(f'Expected NAME:VALUE, got "{header}"')
+            headers.append((name.strip(), value.strip()))
+
+        self.stdout.write(
+            f'{"target":<12} {"requests/s":>11} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9} {"errors":>7}'
+        )
+        for name, url in targets:
+            load = Load(url, headers, options['timeout'])
+            asyncio.run(load.run(options['warmup'], options['concurrency']))
+            load = Load(url, headers, options['timeout'])
+            elapsed = asyncio.run(load.run(options['requests'], options['concurrency']))
+            latencies = sorted(load.latencies) or [0]
+            self.stdout.write(
+                f'{name:<12} {len(load.latencies) / elapsed:>11.0f} {percentile(latencies, 50):>9.1f} '
+                f'{percentile(latencies, 90):>9.1f} {percentile(latencies, 99):>9.1f} '
+                f'{latencies[-1] * 1000:>9.1f} {load.errors:>7}'
+            )
+            if load.statuses:
+                self.stdout.write(f'{"":<12} non-2xx responses: {dict(load.statuses)}')
+
+
+def percentile(latencies, percent):
+    # Nearest-rank percentile of sorted latencies in seconds, in milliseconds
+    index = max(0, -(-len(latencies) * percent // 100) - 1)
+    return latencies[int(index)] * 1000
+
+
+class Load:
+    def __init__(self, url, headers, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        lines = [f'GET {path} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in headers]
+        self.request = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+        self.timeout = timeout
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    async def run(self, count, concurrency):
+        self.remaining = count
+        start = time.perf_counter()
+        await asyncio.gather(*(self.client() for _ in range(min(concurrency, count))))
+        return time.perf_counter() - start
+
+    async def client(self):
+        reader = writer = None
+        while self.remaining > 0:
+            self.remaining -= 1
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                sent = time.perf_counter()
+                writer.write(self.request)
+                status, keep_alive = await asyncio.wait_for(read_response(reader), self.timeout)
+                self.latencies.append(time.perf_counter() - sent)
+                if not 200 <= status < 300:
+                    self.statuses[status] = self.statuses.get(status, 0) + 1
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                self.errors += 1
+                if writer is not None:
+                    writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+
+async def read_response(reader):
+    # Reads one response; returns its status and whether the connection stays open
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
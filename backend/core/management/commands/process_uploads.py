@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import uploads
+from core.models import UploadJob, UploadSession, UploadStatus
+
+
+# Finishes uploads whose worker went away (deploys, crashes) before storing them.
+# Only jobs untouched for --stale-after seconds are taken, so uploads that a live
+# worker is still retrying are left alone. Chunked uploads that were abandoned
+# (no chunk for UPLOAD_SESSION_EXPIRY seconds, never finalized) are removed.
+class Command(BaseCommand):
+    help = 'Process upload jobs that are still waiting to be pushed to storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Only pick up jobs not updated for this many seconds.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['stale_after'])
+        job_ids = list(
+            UploadJob.objects.filter(status=UploadStatus.PROCESSING, updated_at__lte=cutoff)
+            .order_by('created_at')
+            .values_list('pk', flat=True)
+        )
+
+        counts = {UploadStatus.READY: 0, UploadStatus.FAILED: 0}
+        for job_id in job_ids:
+            job = uploads.process_upload(job_id)
+            counts[job.status] = counts.get(job.status, 0) + 1
+            self.stdout.write(f'Upload {job.pk}: {job.status}')
+
+        expired = UploadSession.objects.filter(
+            job__isnull=True, updated_at__lte=timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY)
+        )
+        expired_count = 0
+        for session in expired:
+            uploads.discard_staged_file(session.staged_path)
+            session.delete()
+            expired_count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(job_ids)} uploads: {counts[UploadStatus.READY]} ready, "
+            f"{counts[UploadStatus.FAILED]} failed. Removed {expired_count} abandoned chunked uploads."
+        ))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from core import caching
+from core.models import Bookmark, Comment, Like, Photo
+
+# Counter column on Photo -> child model it counts
+COUNTERS = {
+    'like_count': Like,
+    'comment_count': Comment,
+    'bookmark_count': Bookmark,
+}
+
+
+def actual_count(model):
+    rows = model.objects.filter(photo=OuterRef('pk')).values('photo').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+# Recomputes Photo.like_count, comment_count and bookmark_count from the child
+# tables and rewrites the rows that have drifted, one UPDATE per batch.
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized like/comment/bookmark counters on Photo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of photos checked per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted photos without updating them.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        annotations = {f'actual_{field}': actual_count(model) for field, model in COUNTERS.items()}
+        drifted = Q()
+        for field in COUNTERS:
+            drifted |= ~Q(**{field: F(f'actual_{field}')})
+
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Photo.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            checked += len(ids)
+
+            with transaction.atomic():
+                drifted_ids = list(
+                    Photo.objects.filter(pk__in=ids).annotate(**annotations).filter(drifted).values_list('pk', flat=True)
+                )
+                fixed += len(drifted_ids)
+                if dry_run:
+                    for pk in drifted_ids:
+                        self.stdout.write(f"Photo {pk} has drifted")
+                    continue
+                # The counts are taken by the UPDATE itself, so a like or comment
+                # committed since the check above is neither lost nor counted twice
+                Photo.objects.filter(pk__in=drifted_ids).update(
+                    **{field: actual_count(model) for field, model in COUNTERS.items()}
+                )
+                for pk in drifted_ids:
+                    caching.invalidate_photo(pk)
+
+        verb = 'would be rebuilt' if dry_run else 'rebuilt'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} photos, {fixed} {verb}.'))
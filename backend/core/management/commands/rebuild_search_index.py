@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import search
+from core.models import Comment, Photo, SearchPosting
+
+
+# Rebuilds the built-in search index (core/search.py) from every caption,
+# comment and username, a batch of photos per transaction. Needed once for the
+# photos posted before the index existed, after switching SEARCH_BACKEND to
+# "index", and to pick up renamed users.
+class Command(BaseCommand):
+    help = 'Rebuild the built-in search index from captions, comments and usernames.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of photos indexed per transaction.')
+
+    def handle(self, *args, **options):
+        indexed = 0
+        last_id = 0
+        while True:
+            photos = list(Photo.objects.filter(pk__gt=last_id).select_related('user').order_by('pk')[:options['batch_size']])
+            if not photos:
+                break
+            last_id = photos[-1].pk
+            photo_ids = [photo.pk for photo in photos]
+            with transaction.atomic():
+                SearchPosting.objects.filter(photo__in=photo_ids).delete()
+                search.index_photos(photos)
+                search.index_comments(Comment.objects.filter(photo__in=photo_ids).only('pk', 'photo_id', 'text'))
+            indexed += len(photos)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} photos.'))
@@ -0,0 +1,52 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from core import outbox
+from core.models import OutboxStatus
+
+# Seconds between purges of old messages with --loop
+PURGE_INTERVAL = 60 * 60
+
+
+# Sends the queued emails that are due: retries, and messages whose sender
+# thread went away (deploys, crashes) before sending them. With --loop it keeps
+# polling and can run as the outbox's sender on its own, with OUTBOX_WORKERS set
+# to a non-zero value only where the web process should also send. Old sent and
+# discarded messages are purged on every run, and hourly with --loop.
+class Command(BaseCommand):
+    help = 'Send queued outbox emails that are due.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Messages sent per SMTP connection (default OUTBOX_BATCH_SIZE).')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for due messages until interrupted.')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        total = Counter()
+        purged_at = None
+        try:
+            while True:
+                if purged_at is None or time.monotonic() - purged_at >= PURGE_INTERVAL:
+                    purged = outbox.purge()
+                    if purged:
+                        self.stdout.write(f'Purged {purged} old emails')
+                    purged_at = time.monotonic()
+                outcomes = outbox.send_pending(options['batch_size'])
+                if outcomes:
+                    self.stdout.write(', '.join(f'{count} {status}' for status, count in sorted(outcomes.items())))
+                total.update(outcomes)
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {total[OutboxStatus.SENT]} emails, discarded {total[OutboxStatus.DISCARDED]}, "
+            f"{total[OutboxStatus.FAILED]} failed for good."
+        ))
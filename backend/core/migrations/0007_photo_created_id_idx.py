@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 14:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_bookmark_delete_savedphoto_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['created_at', 'id'], name='photo_created_id_idx'),
+        ),
+    ]
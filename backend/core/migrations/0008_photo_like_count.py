@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 14:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_count(apps, schema_editor):
+    Photo = apps.get_model('core', 'Photo')
+    Like = apps.get_model('core', 'Like')
+    likes = Like.objects.filter(photo=OuterRef('pk')).values('photo').annotate(total=Count('id')).values('total')
+    Photo.objects.update(like_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_photo_created_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='photo_user_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['like_count', 'created_at', 'id'], name='photo_popular_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 14:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Photo = apps.get_model('core', 'Photo')
+    Comment = apps.get_model('core', 'Comment')
+    Bookmark = apps.get_model('core', 'Bookmark')
+
+    def count_for(model):
+        rows = model.objects.filter(photo=OuterRef('pk')).values('photo').annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(rows), 0)
+
+    Photo.objects.update(comment_count=count_for(Comment), bookmark_count=count_for(Bookmark))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_photo_like_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 14:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_photo_comment_count_bookmark_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['photo', 'created_at', 'id'], name='like_photo_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 14:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_like_photo_created_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['photo', 'created_at', 'id'], name='comment_photo_created_id_idx'),
+        ),
+    ]
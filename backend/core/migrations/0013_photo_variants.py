@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 14:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_upload_pipeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('thumb', 'Thumbnail'), ('feed', 'Feed'), ('full', 'Full size')], max_length=20)),
+                ('format', models.CharField(max_length=10)),
+                ('url', models.CharField(max_length=500)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='core.photo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('photo', 'name', 'format'), name='unique_photo_variant')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 14:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_follows'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='trending_at',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['trending_score', 'id'], name='photo_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# FULLTEXT indexes for core/search.py's MySQL backend; other databases use the
+# built-in index (SearchPosting) instead
+def create_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('CREATE FULLTEXT INDEX photo_caption_ft ON core_photo (caption)')
+        schema_editor.execute('CREATE FULLTEXT INDEX comment_text_ft ON core_comment (text)')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX photo_caption_ft ON core_photo')
+        schema_editor.execute('DROP INDEX comment_text_ft ON core_comment')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_photo_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.comment')),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.photo')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'photo', 'weight'], name='searchposting_term_idx')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
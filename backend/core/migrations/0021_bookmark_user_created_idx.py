@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 14:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_tags_and_mentions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookmark',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='bookmark_user_created_idx'),
+        ),
+    ]
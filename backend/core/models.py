@@ -1,15 +1,22 @@
 from django.db import models
+from django.utils import timezone
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from django.contrib.auth.models import User
 from cloudinary.models import CloudinaryField
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
+from . import caching
+
 # The Profile model represents a user's profile, including their bio and profile photo.
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     bio = models.TextField(blank=True)
     profile_photo = CloudinaryField("profile_photo", blank=True, null=True)
+    # Denormalized Follow counts, kept in step by the follow endpoint
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Profile of {self.user.username}"
@@ -22,12 +29,95 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
     instance.profile.save()
 
+# Number of newest comments embedded in each serialized photo
+COMMENT_PREVIEW_SIZE = 3
+
+
+# Loads the newest comments of many photos in one query, into photo.recent_comments
+def comment_preview_prefetch():
+    recent_comments = Comment.objects.select_related("user__profile").order_by("-created_at", "-id")
+    return Prefetch(
+        "comments",
+        queryset=recent_comments[:COMMENT_PREVIEW_SIZE],
+        to_attr="recent_comments",
+    )
+
+
+# Queryset helpers for loading photos together with everything PhotoSerializer reads
+class PhotoQuerySet(models.QuerySet):
+    def visible(self):
+        # Photos whose upload has finished
+        return self.filter(status=UploadStatus.READY)
+
+    def visible_to(self, user):
+        # Visible photos, and for their owner also those still processing or
+        # whose upload failed
+        if not user.is_authenticated:
+            return self.visible()
+        return self.filter(models.Q(status=UploadStatus.READY) | models.Q(user=user))
+
+    def with_owner(self):
+        return self.select_related("user__profile")
+
+    def with_related(self):
+        # One query for the photos (with user and profile joined in), one for the
+        # newest comments and one for the image variants of every photo,
+        # regardless of how many are loaded.
+        return self.with_owner().prefetch_related(comment_preview_prefetch(), "variants")
+
+    def with_viewer_state(self, user):
+        # Whether the viewing user liked/saved each photo, answered by an indexed
+        # EXISTS lookup inside the photo query itself
+        if not user.is_authenticated:
+            return self.annotate(liked_by_me=Value(False), saved_by_me=Value(False))
+        return self.annotate(
+            liked_by_me=Exists(Like.objects.filter(photo=OuterRef("pk"), user=user)),
+            saved_by_me=Exists(Bookmark.objects.filter(photo=OuterRef("pk"), user=user)),
+        )
+
+
+# State of a file pushed to remote storage by the upload pipeline (core/uploads.py)
+class UploadStatus(models.TextChoices):
+    PROCESSING = "processing", "Processing"
+    READY = "ready", "Ready"
+    FAILED = "failed", "Failed"
+
+
 # The Photo model represents a photo uploaded by a user.
 class Photo(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="photos")
     caption = models.TextField(blank=True)
-    image = CloudinaryField("image")
+    # Empty while the upload pipeline is still pushing the file to storage
+    image = CloudinaryField("image", blank=True)
+    status = models.CharField(max_length=20, choices=UploadStatus.choices, default=UploadStatus.READY)
+    # Measured by the upload pipeline (or backfill_photo_metadata) so clients can
+    # reserve space and paint a placeholder before the image loads
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True)
+    blurhash = models.CharField(max_length=64, blank=True)
+    # Stored file this photo's image came from, shared by re-uploads of the same bytes
+    asset = models.ForeignKey("ImageAsset", on_delete=models.SET_NULL, null=True, blank=True, related_name="photos")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized counters, kept in step with the child tables by the views that
+    # write them and rebuilt by the rebuild_photo_counters command
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    bookmark_count = models.PositiveIntegerField(default=0)
+    # Time-decayed popularity as of trending_at (unix seconds), see core/trending.py
+    trending_score = models.FloatField(default=0)
+    trending_at = models.FloatField(default=0)
+
+    objects = PhotoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Back the keyset-paginated orderings used by the feed and photo listings
+            models.Index(fields=["created_at", "id"], name="photo_created_id_idx"),
+            models.Index(fields=["user", "created_at", "id"], name="photo_user_created_id_idx"),
+            models.Index(fields=["like_count", "created_at", "id"], name="photo_popular_idx"),
+            models.Index(fields=["trending_score", "id"], name="photo_trending_idx"),
+        ]
 
     def __str__(self):
         return f"Photo by {self.user.username}"
@@ -39,6 +129,12 @@ class Comment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Backs the keyset-paginated comments listing and preview of a photo
+            models.Index(fields=["photo", "created_at", "id"], name="comment_photo_created_id_idx"),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user.username} on Photo {self.photo.id}"
 
@@ -50,6 +146,10 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ("user", "photo")  # One like per user per photo
+        indexes = [
+            # Backs the keyset-paginated likers listing of a photo
+            models.Index(fields=["photo", "created_at", "id"], name="like_photo_created_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} liked Photo {self.photo.id}"
@@ -65,6 +165,312 @@ class Bookmark(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['user', 'photo'], name='unique_user_bookmark')
         ]
+        indexes = [
+            # Backs the keyset-paginated saved photos listing, newest save first
+            models.Index(fields=['user', 'created_at', 'id'], name='bookmark_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} bookmarked {self.photo.id}"
+
+
+# The PhotoVariant model is one resized/re-encoded rendition of a photo's image,
+# produced by the upload pipeline (core/imaging.py) and served through srcset.
+class PhotoVariant(models.Model):
+    THUMB = "thumb"
+    FEED = "feed"
+    FULL = "full"
+    NAME_CHOICES = [
+        (THUMB, "Thumbnail"),
+        (FEED, "Feed"),
+        (FULL, "Full size"),
+    ]
+
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="variants")
+    name = models.CharField(max_length=20, choices=NAME_CHOICES)
+    format = models.CharField(max_length=10)  # jpeg, webp, avif
+    url = models.CharField(max_length=500)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()  # bytes
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["photo", "name", "format"], name="unique_photo_variant")
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.format} of photo {self.photo_id} ({self.width}x{self.height})"
+
+
+# The ImageAsset model indexes every original stored by the upload pipeline by
+# content: sha256 finds exact re-uploads, which reuse the stored file instead
+# of being uploaded again, and phash (a 64-bit difference hash, as 16 hex
+# digits) lets find_similar_photos group near-duplicates.
+class ImageAsset(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    phash = models.CharField(max_length=16, db_index=True)
+    image = CloudinaryField("image")
+    size = models.PositiveIntegerField()  # bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Image asset {self.sha256[:12]}"
+
+
+# The UploadJob model tracks a file staged on local disk until the upload
+# pipeline has pushed it to storage and attached it to a photo or profile.
+class UploadJob(models.Model):
+    KIND_PHOTO = "photo"
+    KIND_PROFILE_PHOTO = "profile_photo"
+    KIND_CHOICES = [
+        (KIND_PHOTO, "Photo"),
+        (KIND_PROFILE_PHOTO, "Profile photo"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_jobs")
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, null=True, blank=True, related_name="upload_jobs")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    staged_path = models.CharField(max_length=500)
+    sha256 = models.CharField(max_length=64, blank=True)  # of the staged file
+    status = models.CharField(max_length=20, choices=UploadStatus.choices, default=UploadStatus.PROCESSING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Lets the process_uploads command find unfinished jobs
+            models.Index(fields=["status", "updated_at"], name="uploadjob_status_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} upload {self.pk} by {self.user.username} ({self.status})"
+
+
+# Delivery state of an OutboxEmail
+class OutboxStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
+    DISCARDED = "discarded", "Discarded"  # nothing to send, e.g. a reset for an unknown address
+
+
+# The OutboxEmail model is an email waiting to be sent by core/outbox.py. Only
+# the kind and recipient are stored; the message is rendered when it is sent.
+class OutboxEmail(models.Model):
+    KIND_PASSWORD_RESET = "password_reset"
+    KIND_CHOICES = [
+        (KIND_PASSWORD_RESET, "Password reset"),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    recipient = models.EmailField()
+    status = models.CharField(max_length=20, choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Not sent before this; pushed ahead while a sender holds the message and on retries
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Lets senders find the messages that are due
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} email to {self.recipient} ({self.status})"
+
+
+# The Follow model records that follower sees followee's photos in their home
+# timeline (core/timeline.py).
+class Follow(models.Model):
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["follower", "followee"], name="unique_follow"),
+            models.CheckConstraint(condition=~models.Q(follower=models.F("followee")), name="no_self_follow"),
+        ]
+        indexes = [
+            # Fan-out reads the followers of a photo's author
+            models.Index(fields=["followee", "follower"], name="follow_followee_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.follower.username} follows {self.followee.username}"
+
+
+# The UploadSession model is a resumable chunked upload in progress: chunks are
+# appended to staged_path until offset reaches size, and finalizing hands the
+# file to the upload pipeline as an UploadJob.
+class UploadSession(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions")
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)  # bytes received so far
+    staged_path = models.CharField(max_length=500)
+    job = models.OneToOneField(UploadJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="session")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload session {self.pk} by {self.user.username} ({self.offset}/{self.size} bytes)"
+
+
+# The Tag model is a hashtag used in captions (core/tags.py), stored case-folded
+class Tag(models.Model):
+    name = models.CharField(max_length=64, unique=True)
+    # Denormalized PhotoTag count, kept in step by core/tags.py
+    photo_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"#{self.name}"
+
+
+# The PhotoTag model links a photo to a hashtag in its caption.
+class PhotoTag(models.Model):
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="photo_tags")
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="photo_tags")
+
+    class Meta:
+        constraints = [
+            # Also backs tag pages, which list a tag's photos newest (highest id) first
+            models.UniqueConstraint(fields=["tag", "photo"], name="unique_photo_tag"),
+        ]
+
+    def __str__(self):
+        return f"Photo {self.photo_id} tagged #{self.tag.name}"
+
+
+# The Mention model records a user mentioned as @username in a photo's caption.
+class Mention(models.Model):
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="mentions")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="mentions")
+
+    class Meta:
+        constraints = [
+            # Also backs listing the photos that mention a user
+            models.UniqueConstraint(fields=["user", "photo"], name="unique_mention"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} mentioned in Photo {self.photo_id}"
+
+
+# The SearchPosting model is one term of the built-in search index (core/search.py):
+# the term occurs in the caption or owner's username of photo, or in comment when
+# set, and weight is its number of occurrences times the weight of that field.
+class SearchPosting(models.Model):
+    term = models.CharField(max_length=64)
+    photo = models.ForeignKey(Photo, on_delete=models.CASCADE, related_name="+")
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # Covers search queries, which sum the weights of every photo with a term
+            # straight from the index
+            models.Index(fields=["term", "photo", "weight"], name="searchposting_term_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in Photo {self.photo_id}"
+
+
+# Drop cached authenticated users when they or their profile change
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    from . import authentication
+    authentication.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_cached_user_for_profile(sender, instance, **kwargs):
+    from . import authentication
+    authentication.invalidate_user(instance.user_id)
+
+
+# Invalidate cached feed pages and photo payloads when anything they show changes.
+# Feed pages only go when a photo may have joined or left the feed.
+@receiver(post_save, sender=Photo)
+def invalidate_photo_cache(sender, instance, created, update_fields=None, **kwargs):
+    feed = created or update_fields is None or "status" in update_fields
+    caching.invalidate_photo(instance.pk, feed=feed)
+
+
+@receiver(post_delete, sender=Photo)
+def invalidate_photo_cache_on_delete(sender, instance, **kwargs):
+    caching.invalidate_photo(instance.pk, feed=True)
+
+
+# Push photos into their followers' home timelines once they become visible,
+# either when created ready or when the upload pipeline finishes them
+@receiver(post_save, sender=Photo)
+def fan_out_photo(sender, instance, created, update_fields=None, **kwargs):
+    if instance.status != UploadStatus.READY:
+        return
+    if created or (update_fields is not None and "status" in update_fields):
+        from . import timeline
+        timeline.enqueue_fan_out(instance)
+
+
+# Parse hashtags and mentions out of captions as they are saved
+@receiver(post_save, sender=Photo)
+def extract_photo_tags(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and "caption" not in update_fields:
+        return
+    from . import tags
+    tags.update_photo(instance)
+
+
+# Count a photo's tags once the upload pipeline marks it ready
+@receiver(post_save, sender=Photo)
+def count_photo_tags(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and "status" in update_fields and instance.status == UploadStatus.READY:
+        from . import tags
+        tags.count_photo(instance)
+
+
+# Drop an image asset with its last photo, so a later upload of the same bytes
+# stores them again instead of pointing at an image that may have been removed
+@receiver(post_delete, sender=Photo)
+def delete_orphaned_asset(sender, instance, **kwargs):
+    if instance.asset_id is not None:
+        ImageAsset.objects.filter(pk=instance.asset_id, photos__isnull=True).delete()
+
+
+@receiver(pre_delete, sender=Photo)
+def remove_photo_tags(sender, instance, **kwargs):
+    from . import tags
+    tags.remove_photo(instance)
+
+
+# Keep the built-in search index in step with captions and comments. Usernames
+# are indexed with the photo; rebuild_search_index picks up renamed users.
+@receiver(post_save, sender=Photo)
+def index_photo(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and "caption" not in update_fields:
+        return
+    from . import search
+    if not search.use_fulltext():
+        search.index_photo(instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    from . import search
+    if not search.use_fulltext():
+        search.index_comment(instance)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Bookmark)
+def invalidate_photo_cache_for_child(sender, instance, **kwargs):
+    caching.invalidate_photo(instance.photo_id)
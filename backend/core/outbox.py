@@ -0,0 +1,179 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import OutboxEmail, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+
+# Transactional email outbox.
+#
+# Views record an OutboxEmail in their own transaction instead of talking to the
+# mail server, so the request never waits on SMTP and the email exists exactly
+# when the change that caused it was committed. After commit a sender thread
+# (OUTBOX_WORKERS, 0 sends inline) claims due messages in batches of
+# OUTBOX_BATCH_SIZE and sends each batch over one SMTP connection.
+#
+# Claiming a message counts an attempt and pushes its next_attempt_at
+# OUTBOX_LEASE seconds ahead, so other senders skip it while it is being sent
+# and it comes due again if its sender dies. A failed send is retried after
+# OUTBOX_RETRY_DELAY seconds, doubled every attempt, up to OUTBOX_MAX_ATTEMPTS.
+# Retries and messages left behind by a restart are sent by
+# "manage.py send_outbox", run periodically or with --loop as a worker, which
+# also deletes sent and discarded messages older than OUTBOX_RETENTION seconds.
+
+FRONTEND_BASE = "http://localhost:5173"
+
+
+# Renderers build the message for a kind of email from its recipient, or
+# return None when there is nothing to send
+def render_password_reset(email):
+    user = User.objects.filter(email=email).order_by("pk").first()
+    if user is None:
+        return None
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    reset_url = f"{FRONTEND_BASE}/reset-password/{uid}/{token}/"
+    return EmailMessage(
+        subject="Password Reset Request",
+        body=f"Click the link to reset your password:\n{reset_url}",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+
+
+RENDERERS = {
+    OutboxEmail.KIND_PASSWORD_RESET: render_password_reset,
+}
+
+
+def queue_email(kind, recipient):
+    message = OutboxEmail.objects.create(kind=kind, recipient=recipient)
+    transaction.on_commit(kick)
+    return message
+
+
+def claim(batch_size):
+    # Due messages, leased to this sender
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxStatus.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=ids).update(
+            attempts=F("attempts") + 1, next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE)
+        )
+    return list(OutboxEmail.objects.filter(pk__in=ids).order_by("pk"))
+
+
+def deliver(message, connection):
+    try:
+        email = RENDERERS[message.kind](message.recipient)
+        if email is None:
+            message.status = OutboxStatus.DISCARDED
+        else:
+            connection.open()  # no-op while the connection is up
+            email.connection = connection
+            email.send()
+            message.status = OutboxStatus.SENT
+            message.sent_at = timezone.now()
+        message.error = ""
+    except Exception as e:
+        logger.warning("Sending email %s failed (attempt %s): %s", message.pk, message.attempts, e)
+        # Reconnect for the next message in case the connection is what broke
+        connection.close()
+        message.error = str(e)
+        if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.status = OutboxStatus.FAILED
+        else:
+            delay = settings.OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1)
+            message.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    message.save(update_fields=["status", "error", "next_attempt_at", "sent_at"])
+    return message.status
+
+
+def send_batch(batch_size=None):
+    # Sends one batch of due messages over a single connection; returns the
+    # number of messages per resulting status
+    messages = claim(batch_size or settings.OUTBOX_BATCH_SIZE)
+    outcomes = Counter()
+    if not messages:
+        return outcomes
+    connection = get_connection()
+    try:
+        for message in messages:
+            outcomes[deliver(message, connection)] += 1
+    finally:
+        connection.close()
+    return outcomes
+
+
+def send_pending(batch_size=None):
+    # Sends batches until no message is due
+    outcomes = Counter()
+    while True:
+        batch = send_batch(batch_size)
+        if not batch:
+            return outcomes
+        outcomes.update(batch)
+
+
+def purge(batch_size=1000):
+    # Deletes sent and discarded messages past OUTBOX_RETENTION, a batch at a
+    # time so no delete holds its locks for long; returns how many went
+    cutoff = timezone.now() - timedelta(seconds=settings.OUTBOX_RETENTION)
+    expired = OutboxEmail.objects.filter(
+        status__in=[OutboxStatus.SENT, OutboxStatus.DISCARDED], created_at__lt=cutoff
+    )
+    deleted = 0
+    while True:
+        ids = list(expired.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += OutboxEmail.objects.filter(pk__in=ids).delete()[0]
+
+
+def run_sender():
+    # Entry point for the sender thread, which needs its own DB connection
+    close_old_connections()
+    try:
+        send_pending()
+    except Exception:
+        logger.exception("Sending queued emails failed")
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.OUTBOX_WORKERS, thread_name_prefix="outbox")
+        return _executor
+
+
+def kick():
+    if settings.OUTBOX_WORKERS == 0:
+        send_pending()
+    else:
+        get_executor().submit(run_sender)
@@ -0,0 +1,179 @@
+import base64
+import json
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Keyset (cursor) pagination over a fixed, unique ordering.
+#
+# Each page is fetched with "WHERE (ordering) < (last row seen) LIMIT n", so the
+# cost of a page does not depend on how deep the client has scrolled, no COUNT(*)
+# is issued, and rows inserted at the head of the list never shift later pages.
+# The ordering must end with a unique column (usually "id") and should be backed
+# by a composite index with the same columns.
+class KeysetPagination(BasePagination):
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 50
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # paginate_queryset() for async views
+        return self.set_page([obj async for obj in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+
+        # Fetch one extra row to know whether there is a next page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_keyset_filter(self, position):
+        # (a, b, c) < (x, y, z)  ==  a < x OR (a = x AND b < y) OR (a = x AND b = y AND c < z)
+        keyset = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            keyset |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return keyset
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            value = attrgetter(field.lstrip('-').replace('__', '.'))(obj)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def get_cursor_for(self, obj):
+        # Cursor for the page that starts right after obj
+        return self.encode_cursor(self.get_position(obj))
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset=None):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursors come from clients, so every value is checked against its column
+        try:
+            position = [
+                self.get_ordering_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_ordering_field(self, queryset, name):
+        # The model field or annotation behind an ordering column
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        model = queryset.model
+        *path, name = name.split('__')
+        for related in path:
+            model = model._meta.get_field(related).related_model
+        return model._meta.get_field(name)
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_cursor_for(self.page[-1])
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(remove_query_param(url, 'offset'), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.get_next_cursor(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+# Keyset pagination over a precomputed list of ids, newest first, such as a
+# home timeline. The cursor is the last id handed out, so ids that no longer
+# resolve to a photo never stall the next page.
+class IdListPagination(KeysetPagination):
+    ordering = ('-id',)
+
+    def paginate_ids(self, fetch, request):
+        # fetch(before, limit) returns up to limit ids below before (None for
+        # the first page), newest first
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        ids = fetch(position[0] if position else None, self.page_size + 1)
+        self.has_next = len(ids) > self.page_size
+        self.page = ids[:self.page_size]
+        return self.page
+
+    def get_ordering_field(self, queryset, name):
+        return models.BigIntegerField()
+
+    def get_position(self, obj):
+        return [obj]
@@ -0,0 +1,101 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Read replica routing.
+#
+# Reads go to the primary ("default") unless they run inside a view wrapped in
+# replica_reads, which sends the reads of GET and HEAD requests to one of the
+# DATABASE_REPLICAS, picked at random once per request so its reads agree with
+# each other. Within such a request the reads go back to the primary for good as
+# soon as anything is written, and reads inside a transaction on the primary
+# stay there, so a request always sees its own writes.
+#
+# Requests that follow a write are not pinned: a replica that lags behind may
+# still serve them the old data. Views whose readers expect to see their own
+# changes from an earlier request should stay on the primary. Whatever is
+# cached under a version that writes bump (anonymous pages, photo fragments, see
+# core/caching.py) is read inside primary_reads, so a lagging replica cannot
+# store the old data under the new version.
+#
+# The state lives in context variables, so it is per request on WSGI threads and
+# under ASGI alike, and threads started by the request (upload, timeline and
+# outbox workers) read from the primary.
+
+_replica = ContextVar("replica", default=None)
+
+
+def get_replica():
+    # The replica this request reads from, None when reads go to the primary
+    alias = _replica.get()
+    if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    return alias
+
+
+def pin_to_primary():
+    _replica.set(None)
+
+
+@contextmanager
+def primary_reads():
+    # Sends the reads inside the block to the primary
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def replica_reads(view):
+    # Lets the safe requests of a view, sync or async, read from a replica
+    def uses_replica(request):
+        return request.method in ("GET", "HEAD") and settings.DATABASE_REPLICAS
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not uses_replica(request):
+                return await view(request, *args, **kwargs)
+            # The async ORM runs queries in a thread with a copy of this context
+            token = _replica.set(random.choice(settings.DATABASE_REPLICAS))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica.reset(token)
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not uses_replica(request):
+            return view(request, *args, **kwargs)
+        token = _replica.set(random.choice(settings.DATABASE_REPLICAS))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica.reset(token)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return get_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,166 @@
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, F, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Photo, SearchPosting
+
+
+# Full-text search over captions, comments and usernames.
+#
+# Two backends answer the same query:
+#
+# - "fulltext" ranks with MATCH ... AGAINST over the FULLTEXT indexes on
+#   core_photo.caption and core_comment.text (MySQL only, see migration 0019).
+# - "index" is a built-in inverted index: every caption, comment and owner
+#   username is tokenized into SearchPosting rows (term, photo, weight), written
+#   as photos and comments are saved. A query matches the photos that have a
+#   posting for every term and ranks them by the sum of those postings' weights.
+#
+# SEARCH_BACKEND = "auto" uses FULLTEXT on MySQL and the built-in index anywhere
+# else. Either way search_photos returns a Photo queryset annotated with
+# search_rank, to be paginated on ("-search_rank", "-id").
+
+# Weight of one occurrence of a term in each field
+CAPTION_WEIGHT = 3
+COMMENT_WEIGHT = 1
+USERNAME_WEIGHT = 5
+
+# Terms past this many are ignored, which bounds the cost of one query
+MAX_QUERY_TERMS = 8
+
+# Words, optionally prefixed by "#" for hashtags; SearchPosting.term holds 64 characters
+TOKEN_RE = re.compile(r"#?\w+")
+MAX_TERM_LENGTH = 64
+
+
+def use_fulltext():
+    if settings.SEARCH_BACKEND == "auto":
+        return connection.vendor == "mysql"
+    return settings.SEARCH_BACKEND == "fulltext"
+
+
+def tokenize(text):
+    # Terms of an indexed text. A hashtag is indexed both as "#tag" and as
+    # "tag", so searching for the bare word also finds it.
+    terms = []
+    for token in TOKEN_RE.findall(text.casefold()):
+        word = token.lstrip("#")
+        if not word:
+            continue
+        if token.startswith("#"):
+            terms.append(f"#{word}"[:MAX_TERM_LENGTH])
+        terms.append(word[:MAX_TERM_LENGTH])
+    return terms
+
+
+def query_terms(query):
+    # Distinct terms of a search query; "#tag" only matches the hashtag
+    terms = []
+    for token in TOKEN_RE.findall(query.casefold()):
+        word = token.lstrip("#")
+        term = (f"#{word}" if token.startswith("#") else word)[:MAX_TERM_LENGTH]
+        if word and term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def postings(photo_id, text, weight, comment_id=None):
+    return [
+        SearchPosting(term=term, photo_id=photo_id, comment_id=comment_id, weight=count * weight)
+        for term, count in Counter(tokenize(text)).items()
+    ]
+
+
+def photo_postings(photo, username):
+    return postings(photo.pk, photo.caption, CAPTION_WEIGHT) + postings(photo.pk, username, USERNAME_WEIGHT)
+
+
+def index_photo(photo):
+    # Replaces the caption and username postings of a photo
+    SearchPosting.objects.filter(photo_id=photo.pk, comment__isnull=True).delete()
+    SearchPosting.objects.bulk_create(photo_postings(photo, photo.user.username))
+
+
+def index_comment(comment):
+    # Replaces the postings of a comment; deleting the comment deletes them too
+    SearchPosting.objects.filter(comment_id=comment.pk).delete()
+    SearchPosting.objects.bulk_create(postings(comment.photo_id, comment.text, COMMENT_WEIGHT, comment.pk))
+
+
+def index_photos(photos, batch_size=1000):
+    # Bulk variant of index_photo for photos that have no postings yet; photos
+    # must have their user loaded
+    SearchPosting.objects.bulk_create(
+        [posting for photo in photos for posting in photo_postings(photo, photo.user.username)],
+        batch_size=batch_size,
+    )
+
+
+def index_comments(comments, batch_size=1000):
+    SearchPosting.objects.bulk_create(
+        [posting for comment in comments for posting in postings(comment.photo_id, comment.text, COMMENT_WEIGHT, comment.pk)],
+        batch_size=batch_size,
+    )
+
+
+# MATCH (column) AGAINST (query IN NATURAL LANGUAGE MODE), MySQL's relevance
+# of a row to a query; positive when the row matches
+class Match(Func):
+    output_field = FloatField()
+
+    def __init__(self, column, query):
+        super().__init__(F(column), Value(query))
+
+    def as_sql(self, compiler, connection):
+        column, query = self.get_source_expressions()
+        column_sql, column_params = compiler.compile(column)
+        query_sql, query_params = compiler.compile(query)
+        return f"MATCH ({column_sql}) AGAINST ({query_sql} IN NATURAL LANGUAGE MODE)", (*column_params, *query_params)
+
+
+def fulltext_search(photos, query, terms):
+    comment_rank = (
+        Comment.objects.filter(photo=OuterRef("pk"))
+        .annotate(relevance=Match("text", query))
+        .filter(relevance__gt=0)
+        .values("photo")
+        .annotate(total=Sum("relevance"))
+        .values("total")
+    )
+    commented = Comment.objects.annotate(relevance=Match("text", query)).filter(relevance__gt=0).values("photo")
+    return photos.annotate(
+        caption_rank=Match("caption", query),
+        search_rank=(
+            F("caption_rank") * CAPTION_WEIGHT
+            + Coalesce(Subquery(comment_rank, output_field=FloatField()), 0.0) * COMMENT_WEIGHT
+            + Case(When(user__username__in=terms, then=Value(float(USERNAME_WEIGHT))), default=Value(0.0))
+        ),
+    ).filter(Q(caption_rank__gt=0) | Q(pk__in=commented) | Q(user__username__in=terms))
+
+
+def index_search(photos, terms):
+    matching = SearchPosting.objects.filter(term__in=terms)
+    # Photos with a posting for every term
+    matched = (
+        matching.values("photo")
+        .annotate(matched_terms=Count("term", distinct=True))
+        .filter(matched_terms=len(terms))
+        .values("photo")
+    )
+    rank = matching.filter(photo=OuterRef("pk")).values("photo").annotate(total=Sum("weight")).values("total")
+    return photos.filter(pk__in=matched).annotate(search_rank=Subquery(rank, output_field=IntegerField()))
+
+
+def search_photos(query, photos=None):
+    # photos (all visible photos by default) that match query, annotated with search_rank
+    photos = Photo.objects.visible() if photos is None else photos
+    terms = query_terms(query)
+    if not terms:
+        return photos.none()
+    if use_fulltext():
+        return fulltext_search(photos, query, [term.lstrip("#") for term in terms])
+    return index_search(photos, terms)
@@ -1,6 +1,12 @@
+from asgiref.sync import sync_to_async
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Photo, Comment, Like, Profile
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import prefetch_related_objects
+from django.conf import settings
+from .models import COMMENT_PREVIEW_SIZE, Photo, Comment, Like, Profile, UploadJob, UploadSession, UploadStatus, comment_preview_prefetch
+from .pagination import KeysetPagination
+from . import caching, routers
 from rest_framework.validators import UniqueValidator
 
 # Profile Serializer for handiling profile data
@@ -51,42 +57,212 @@ class LikeSerializer(serializers.ModelSerializer):
 # Photo Serializer for handling photo data
 class PhotoSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True) 
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
+    comments_cursor = serializers.SerializerMethodField()
     likes_count = serializers.SerializerMethodField()
-    likes = serializers.SerializerMethodField()
-    bookmarks = serializers.SerializerMethodField() 
+    comments_count = serializers.IntegerField(source='comment_count', read_only=True)
+    bookmarks_count = serializers.IntegerField(source='bookmark_count', read_only=True)
+    liked_by_me = serializers.SerializerMethodField()
+    saved_by_me = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     first_name = serializers.CharField(source='user.first_name', read_only=True)
     last_name = serializers.CharField(source='user.last_name', read_only=True)
 
     class Meta:
         model = Photo
+        read_only_fields = ["status", "width", "height", "dominant_color", "blurhash"]
         fields = [
             "id",
             "user",
             "image",
             "caption",
+            "status",
+            "width",
+            "height",
+            "dominant_color",
+            "blurhash",
             "created_at",
             "comments",
+            "comments_cursor",
             "likes_count",
-            "likes",
-            "bookmarks",  
+            "comments_count",
+            "bookmarks_count",
+            "liked_by_me",
+            "saved_by_me",
+            "srcset",
             "first_name",
             "last_name",
         ]
 
+    # Only the newest comments are embedded, oldest first. The rest are served
+    # by the comments endpoint, starting from comments_cursor.
+    def get_comments(self, obj):
+        return CommentSerializer(reversed(self.recent_comments(obj)), many=True).data
+
+    def get_comments_cursor(self, obj):
+        recent = self.recent_comments(obj)
+        if not recent or obj.comment_count <= len(recent):
+            return None
+        return KeysetPagination().get_cursor_for(recent[-1])
+
+    def recent_comments(self, obj):
+        # Filled by Photo.objects.with_related(), loaded here otherwise
+        if not hasattr(obj, 'recent_comments'):
+            comments = obj.comments.select_related('user__profile').order_by('-created_at', '-id')
+            obj.recent_comments = list(comments[:COMMENT_PREVIEW_SIZE])
+        return obj.recent_comments
+
     def get_likes_count(self, obj):
-        return obj.likes.count()
+        return obj.like_count
+
+    def update(self, instance, validated_data):
+        # Only the edited columns are written, so counters, trending scores and
+        # upload state changed since the photo was loaded are kept
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+    # One srcset string per encoded format, e.g. {"webp": "<url> 320w, <url> 1080w"}.
+    # Empty for photos whose image was not processed by the upload pipeline.
+    def get_srcset(self, obj):
+        candidates = {}
+        for variant in sorted(obj.variants.all(), key=lambda variant: variant.width):
+            candidates.setdefault(variant.format, []).append(f"{variant.url} {variant.width}w")
+        return {image_format: ", ".join(entries) for image_format, entries in candidates.items()}
+
+    # Fields that depend on who is asking; everything else is the same for all
+    # viewers and can be cached per photo (see serialize_photos).
+    VIEWER_FIELDS = ('liked_by_me', 'saved_by_me')
+
+    def get_viewer_fields(self, obj):
+        return {'liked_by_me': self.get_liked_by_me(obj), 'saved_by_me': self.get_saved_by_me(obj)}
+
+    # These read the annotations from Photo.objects.with_viewer_state() when
+    # present, and fall back to a per-photo query otherwise.
+    def get_liked_by_me(self, obj):
+        return self.viewer_flag(obj, 'liked_by_me', obj.likes)
+
+    def get_saved_by_me(self, obj):
+        return self.viewer_flag(obj, 'saved_by_me', obj.bookmarks)
+
+    def viewer_flag(self, obj, name, related):
+        value = getattr(obj, name, None)
+        if value is not None:
+            return value
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        return related.filter(user=request.user).exists()
+
+
+# Upload Job Serializer for reporting the state of an upload
+class UploadJobSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadJob
+        fields = ["id", "kind", "status", "photo", "attempts", "error", "url", "created_at", "updated_at"]
+
+    def get_url(self, obj):
+        # Stored image id once the upload is ready, in the same form as Photo.image
+        if obj.status != UploadStatus.READY:
+            return None
+        if obj.kind == UploadJob.KIND_PHOTO:
+            return str(obj.photo.image)
+        return str(obj.user.profile.profile_photo)
+
+
+# Upload Session Serializer for starting and resuming chunked uploads
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+    upload_id = serializers.IntegerField(source="job_id", read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "filename", "size", "offset", "chunk_size", "upload_id", "created_at"]
+        read_only_fields = ["offset"]
+
+    def get_chunk_size(self, obj):
+        # Largest chunk the server accepts in one PUT
+        return settings.UPLOAD_CHUNK_MAX_SIZE
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("File is empty.")
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files can be at most {settings.UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+
+# Serializes photos through the fragment cache: cached fragments are reused, only
+# the misses are rendered (with their comment previews and image variants fetched
+# in one query each), and the viewer-specific fields are laid over every item.
+def serialize_photos(photos, request):
+    photos = list(photos)
+    serializer = PhotoSerializer(context={'request': request})
+    keys = caching.photo_fragment_keys([photo.pk for photo in photos])
+    fragments = caching.photo_fragments.get_many(keys.values())
+
+    misses = [photo for photo in photos if keys[photo.pk] not in fragments]
+    if misses:
+        fragments.update(render_fragments(misses, keys, request))
+
+    return [{**fragments[keys[photo.pk]], **serializer.get_viewer_fields(photo)} for photo in photos]
+
+
+# Fragments are cached under the photo's current version, which a write may have
+# bumped before a lagging replica caught up, so they are rendered from the
+# primary: photos loaded from a replica are read again. One that is gone from
+# the primary is rendered as loaded but not cached.
+def render_fragments(photos, keys, request):
+    with routers.primary_reads():
+        from_replica = [photo.pk for photo in photos if photo._state.db != DEFAULT_DB_ALIAS]
+        if from_replica:
+            primary = (
+                Photo.objects.using(DEFAULT_DB_ALIAS).with_owner().with_viewer_state(request.user).in_bulk(from_replica)
+            )
+            photos = [primary.get(photo.pk, photo) for photo in photos]
+        prefetch_related_objects(photos, comment_preview_prefetch(), 'variants')
+        rendered = {}
+        for photo, data in zip(photos, PhotoSerializer(photos, many=True, context={'request': request}).data):
+            rendered[keys[photo.pk]] = {
+                name: value for name, value in data.items() if name not in PhotoSerializer.VIEWER_FIELDS
+            }
+    caching.photo_fragments.set_many({
+        keys[photo.pk]: rendered[keys[photo.pk]] for photo in photos if photo._state.db == DEFAULT_DB_ALIAS
+    })
+    return rendered
+
+
+# Fills in a feed page cached by caching.set_cached_feed() for an anonymous
+# viewer: photos come from their fragments, and only the photos without one
+# are loaded. Photos that are no longer visible are left out.
+def serialize_cached_page(data, request):
+    ids = data['results']
+    keys = caching.photo_fragment_keys(ids)
+    fragments = caching.photo_fragments.get_many(keys.values())
+
+    misses = [pk for pk in ids if keys[pk] not in fragments]
+    if misses:
+        photos = Photo.objects.using(DEFAULT_DB_ALIAS).visible().with_owner().in_bulk(misses)
+        fragments.update(render_fragments(list(photos.values()), keys, request))
+
+    viewer_fields = dict.fromkeys(PhotoSerializer.VIEWER_FIELDS, False)
+    return {**data, 'results': [{**fragments[keys[pk]], **viewer_fields} for pk in ids if keys[pk] in fragments]}
 
-    def get_likes(self, obj):
-        return obj.likes.values_list('user_id', flat=True)
 
-    def get_bookmarks(self, obj):
-        return obj.bookmarks.values_list('user_id', flat=True)
+# serialize_photos() for async views, in one thread hop for its version lookup
+# and, on misses, the queries and rendering
+aserialize_photos = sync_to_async(serialize_photos)
+aserialize_cached_page = sync_to_async(serialize_cached_page)
 
 
 # User Profile Serializer for handling user profile information
 class UserProfileSerializer(serializers.ModelSerializer):
     posts_count = serializers.SerializerMethodField()
+    followers_count = serializers.IntegerField(source='profile.followers_count', read_only=True)
+    following_count = serializers.IntegerField(source='profile.following_count', read_only=True)
 
     bio = serializers.CharField(source='profile.bio', allow_blank=True, required=False)
     profile_photo = serializers.ImageField(source='profile.profile_photo', required=False)
@@ -111,6 +287,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
             'bio',
             'profile_photo',
             'posts_count',
+            'followers_count',
+            'following_count',
         ]
 
     def get_posts_count(self, obj):
@@ -120,15 +298,16 @@ class UserProfileSerializer(serializers.ModelSerializer):
         # Pop profile data first
         profile_data = validated_data.pop('profile', {})
 
-        # Update User fields
+        # Update User fields. Only the edited columns are written, so counters
+        # and the password hash are never overwritten from an older copy.
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        instance.save(update_fields=list(validated_data))
 
         # Update related Profile fields
         profile = instance.profile
         for attr, value in profile_data.items():
             setattr(profile, attr, value)
-        profile.save()
+        profile.save(update_fields=list(profile_data))
 
         return instance
\ No newline at end of file
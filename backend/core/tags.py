@@ -0,0 +1,91 @@
+import re
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+
+from .models import Mention, Photo, PhotoTag, Tag, UploadStatus
+
+
+# Hashtags and mentions in captions.
+#
+# "#Tag" and "@username" are parsed out of a photo's caption whenever it is
+# saved and stored as PhotoTag and Mention rows. Tag names are case-folded, so
+# #Sunset and #sunset are the same tag; mentions of usernames that do not exist
+# are dropped. Tag.photo_count is kept in step here, in the same transaction, so
+# tag pages never count their photos. It counts ready photos only, as tag pages
+# list them: a photo's tags are counted once its upload finishes. Every change
+# to the counts locks the photo's row first, so edits, the upload pipeline and
+# deletes take turns with each photo.
+
+# Not preceded by a word character, so "a#b" and "me@example.com" are neither
+TAG_RE = re.compile(r"(?<!\w)#(\w+)")
+MENTION_RE = re.compile(r"(?<![\w@])@([\w.+-]+)")
+MAX_TAG_LENGTH = 64
+
+
+def normalize_tag(name):
+    return name.lstrip("#").casefold()[:MAX_TAG_LENGTH]
+
+
+def extract_tags(text):
+    # Distinct tag names in order of first use
+    return list(dict.fromkeys(normalize_tag(name) for name in TAG_RE.findall(text)))
+
+
+def extract_mentions(text):
+    # Distinct mentioned usernames; a trailing full stop ends the sentence, not the name
+    return list(dict.fromkeys(name.rstrip(".") for name in MENTION_RE.findall(text) if name.rstrip(".")))
+
+
+def get_tag_ids(names):
+    # Ids of the named tags, creating the missing ones
+    if not names:
+        return {}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    return dict(Tag.objects.filter(name__in=names).values_list("name", "pk"))
+
+
+def locked_status(photo):
+    # The photo's upload status, read with its row locked; None once it is deleted
+    return Photo.objects.select_for_update().filter(pk=photo.pk).values_list("status", flat=True).first()
+
+
+@transaction.atomic
+def update_photo(photo):
+    # Brings a photo's tags and mentions in line with its caption
+    status = locked_status(photo)
+    if status is None:
+        return
+    counted = status == UploadStatus.READY
+    wanted = set(get_tag_ids(extract_tags(photo.caption)).values())
+    current = set(PhotoTag.objects.filter(photo=photo).values_list("tag_id", flat=True))
+    removed, added = current - wanted, wanted - current
+    if removed:
+        PhotoTag.objects.filter(photo=photo, tag__in=removed).delete()
+        if counted:
+            Tag.objects.filter(pk__in=removed).update(photo_count=F("photo_count") - 1)
+    if added:
+        PhotoTag.objects.bulk_create([PhotoTag(photo=photo, tag_id=tag_id) for tag_id in added])
+        if counted:
+            Tag.objects.filter(pk__in=added).update(photo_count=F("photo_count") + 1)
+
+    wanted = set(User.objects.filter(username__in=extract_mentions(photo.caption)).values_list("pk", flat=True))
+    current = set(Mention.objects.filter(photo=photo).values_list("user_id", flat=True))
+    if current - wanted:
+        Mention.objects.filter(photo=photo, user__in=current - wanted).delete()
+    Mention.objects.bulk_create([Mention(photo=photo, user_id=user_id) for user_id in wanted - current])
+
+
+def count_photo(photo):
+    # Adds a photo whose upload just finished to its tags' counts. Runs in the
+    # transaction that saved the status, which holds the photo's row lock.
+    Tag.objects.filter(photo_tags__photo=photo).update(photo_count=F("photo_count") + 1)
+
+
+def remove_photo(photo):
+    # Takes a photo that is about to be deleted out of its tags' counts; the
+    # PhotoTag and Mention rows go with it by cascade. Runs in the delete's
+    # transaction.
+    if locked_status(photo) == UploadStatus.READY:
+        Tag.objects.filter(photo_tags__photo=photo).update(photo_count=F("photo_count") - 1)
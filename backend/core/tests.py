@@ -1,13 +1,40 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.db import connection, router, transaction
+from django.test.utils import CaptureQueriesContext
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.db.models import F
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APIRequestFactory, APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from core.models import Photo, Comment, Like, Bookmark
+from core.models import Photo, Comment, Like, Bookmark, Follow, ImageAsset, Mention, OutboxEmail, OutboxStatus, PhotoTag, Profile, SearchPosting, Tag, UploadJob, UploadSession, UploadStatus
+from core.pagination import KeysetPagination
+from core.throttling import RegisterThrottle, SlidingWindowThrottle
+from core import authentication, caching, imaging, outbox, routers, search, serializers, tags, timeline, trending, uploads, views
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core import mail
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils import timezone
+from django.core.management import call_command
+from io import BytesIO, StringIO
 from unittest.mock import patch
 import cloudinary.uploader
+from PIL import Image, ImageDraw
 
 class AuthenticationTests(APITestCase):
     def setUp(self):
@@ -45,6 +72,1334 @@ class PhotoTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_unfinished_uploads_are_only_shown_to_their_owner(self):
+        cache.clear()
+        processing = Photo.objects.create(user=self.user, image='', status=UploadStatus.PROCESSING)
+        url = reverse('photo-detail', args=[processing.id])
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response.data['status']), (200, 'processing'))
+
+        other = User.objects.create_user(username='other', password='TestPass123!')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.put(reverse('photo-like', args=[processing.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Like.objects.exists())
+        response = self.client.post(reverse('comment-create'), {'photo': processing.id, 'text': 'Hi'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(self.client.get(reverse('photo-likers', args=[processing.id])).status_code, 404)
+
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        Bookmark.objects.create(user=other, photo=processing)
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(reverse('saved-photos')).data['results'], [])
+
+class PhotoQueryCountTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+
+    def create_photos(self, count):
+        for i in range(count):
+            photo = Photo.objects.create(user=self.other, caption=f'Photo {i}', image='test_image.jpg', like_count=1)
+            Comment.objects.create(user=self.user, photo=photo, text='Nice')
+            Comment.objects.create(user=self.other, photo=photo, text='Thanks')
+            Like.objects.create(user=self.user, photo=photo)
+            Bookmark.objects.create(user=self.user, photo=photo)
+
+    def test_feed_query_count_is_constant(self):
+        self.create_photos(3)
+        # photos (with the viewer's like/save state), comments, image variants
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('photo-feed'))
+        self.assertEqual(len(response.data['results']), 3)
+
+        self.create_photos(10)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('photo-feed'))
+        self.assertEqual(len(response.data['results']), 13)
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
+        self.assertTrue(response.data['results'][0]['liked_by_me'])
+        self.assertTrue(response.data['results'][0]['saved_by_me'])
+
+    def test_list_detail_and_saved_query_counts(self):
+        self.create_photos(5)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('photo-list-create'), {'sort_by': 'popular'})
+        self.assertEqual(len(response.data['results']), 5)
+
+        # The listing above rendered these photos, so the fragment cache covers
+        # them and their comment previews and variants are not fetched again
+        photo = Photo.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('photo-detail', args=[photo.id]))
+        self.assertEqual(len(response.data['comments']), 2)
+
+        # Photos joined to their bookmarks, the fragments are cached
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('saved-photos'))
+        self.assertEqual(len(response.data['results']), 5)
+
+class PhotoBatchTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+        cache.clear()
+        caching.photo_fragments.clear()
+
+    def test_keeps_order_and_reports_missing_ids(self):
+        photos = [Photo.objects.create(user=self.user, caption=f'Photo {i}', image='test_image.jpg') for i in range(3)]
+        ids = [photos[2].id, 999, photos[0].id, photos[2].id, photos[1].id]
+        response = self.client.get(reverse('photo-batch'), {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data['results']], [photos[2].id, photos[0].id, photos[1].id])
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_unfinished_uploads_are_missing(self):
+        ready = Photo.objects.create(user=self.user, image='test_image.jpg')
+        processing = Photo.objects.create(user=self.user, image='', status=UploadStatus.PROCESSING)
+        failed = Photo.objects.create(user=self.user, image='', status=UploadStatus.FAILED)
+        response = self.client.get(reverse('photo-batch'), {'ids': f'{ready.id},{processing.id},{failed.id}'})
+        self.assertEqual([p['id'] for p in response.data['results']], [ready.id])
+        self.assertEqual(response.data['missing'], [processing.id, failed.id])
+
+    def test_query_count_is_constant(self):
+        photos = []
+        for i in range(20):
+            photo = Photo.objects.create(user=self.user, caption=f'Photo {i}', image='test_image.jpg')
+            Comment.objects.create(user=self.user, photo=photo, text='Nice')
+            photos.append(photo)
+        # photos (with the viewer's like/save state), comments, image variants
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('photo-batch'), {'ids': ','.join(str(p.id) for p in photos)})
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(len(response.data['results'][0]['comments']), 1)
+
+    def test_invalid_ids(self):
+        for ids in ('', '1,x', '0', '-1', '99999999999999999999999', ','.join(str(i) for i in range(1, 102))):
+            response = self.client.get(reverse('photo-batch'), {'ids': ids})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ViewerStateTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        self.photo = Photo.objects.create(user=self.other, caption='Test photo', image='test_image.jpg')
+        Like.objects.create(user=self.other, photo=self.photo)
+
+    def test_payload_has_viewer_flags_instead_of_id_lists(self):
+        url = reverse('photo-detail', args=[self.photo.id])
+        response = self.client.get(url)
+        self.assertNotIn('likes', response.data)
+        self.assertNotIn('bookmarks', response.data)
+        self.assertFalse(response.data['liked_by_me'])
+
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(url)
+        self.assertTrue(response.data['liked_by_me'])
+        self.assertFalse(response.data['saved_by_me'])
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(url)
+        self.assertFalse(response.data['liked_by_me'])
+
+    def test_likers_are_paginated(self):
+        Like.objects.create(user=self.user, photo=self.photo)
+        url = reverse('photo-likers', args=[self.photo.id])
+        response = self.client.get(url, {'limit': 1})
+        self.assertEqual(response.data['results'][0]['user']['username'], 'testuser')
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['user']['username'], 'otheruser')
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(reverse('photo-likers', args=[self.photo.id + 100]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class PhotoListTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('photo-list-create')
+
+    def test_user_listing_is_paginated(self):
+        photos = [Photo.objects.create(user=self.user, image='test_image.jpg') for _ in range(3)]
+        Photo.objects.create(user=self.other, image='test_image.jpg')
+
+        response = self.client.get(self.url, {'user_id': self.user.id, 'limit': 2})
+        self.assertEqual([p['id'] for p in response.data['results']], [photos[2].id, photos[1].id])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([p['id'] for p in response.data['results']], [photos[0].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_post_requires_an_image(self):
+        for data in ({'caption': 'No image'}, {'caption': 'No image', 'image': ' '}):
+            response = self.client.post(self.url, data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('image', response.data)
+        self.assertFalse(Photo.objects.exists())
+
+        response = self.client.post(self.url, {'caption': 'Hosted', 'image': 'sample.jpg'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_popular_uses_stored_like_count(self):
+        quiet = Photo.objects.create(user=self.other, image='test_image.jpg')
+        liked = Photo.objects.create(user=self.other, image='test_image.jpg')
+        self.client.post(reverse('like-toggle', args=[liked.id]))
+        liked.refresh_from_db()
+        self.assertEqual(liked.like_count, 1)
+
+        response = self.client.get(self.url, {'sort_by': 'popular', 'limit': 1})
+        self.assertEqual(response.data['results'][0]['id'], liked.id)
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['id'], quiet.id)
+
+        self.client.post(reverse('like-toggle', args=[liked.id]))
+        liked.refresh_from_db()
+        self.assertEqual(liked.like_count, 0)
+
+class FeedCursorPaginationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.photos = [
+            Photo.objects.create(user=self.user, caption=f'Photo {i}', image='test_image.jpg')
+            for i in range(5)
+        ]
+
+    def test_pages_are_stable_while_new_photos_arrive(self):
+        url = reverse('photo-feed')
+        response = self.client.get(url, {'limit': 2})
+        self.assertNotIn('count', response.data)
+        self.assertEqual([p['id'] for p in response.data['results']], [self.photos[4].id, self.photos[3].id])
+
+        # A new upload lands at the head of the feed between page requests
+        Photo.objects.create(user=self.user, caption='New', image='test_image.jpg')
+
+        response = self.client.get(url, {'limit': 2, 'cursor': response.data['next_cursor']})
+        self.assertEqual([p['id'] for p in response.data['results']], [self.photos[2].id, self.photos[1].id])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([p['id'] for p in response.data['results']], [self.photos[0].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_photos_with_same_timestamp_are_not_skipped(self):
+        Photo.objects.update(created_at=self.photos[0].created_at)
+        url = reverse('photo-feed')
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(url, params)
+            seen += [p['id'] for p in response.data['results']]
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [p.id for p in reversed(self.photos)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('photo-feed'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor_values(self):
+        paginator = KeysetPagination()
+        for position in (['bogus', 1], ['2020-01-01T00:00:00+00:00', 'abc'], [None, None], [[], {}]):
+            response = self.client.get(reverse('photo-feed'), {'cursor': paginator.encode_cursor(position)})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('home-feed'), {'cursor': paginator.encode_cursor(['abc'])})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_offset_mode_still_supported(self):
+        response = self.client.get(reverse('photo-feed'), {'limit': 2, 'offset': 2})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+
+class PhotoCounterTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+        self.photo = Photo.objects.create(user=self.user, caption='Test photo', image='test_image.jpg')
+
+    def test_writes_keep_counters_current(self):
+        response = self.client.post(reverse('comment-create'), {'photo': self.photo.id, 'text': 'Hi'}, format='json')
+        self.client.post(reverse('save-toggle', args=[self.photo.id]))
+        self.client.post(reverse('like-toggle', args=[self.photo.id]))
+        self.photo.refresh_from_db()
+        self.assertEqual((self.photo.like_count, self.photo.comment_count, self.photo.bookmark_count), (1, 1, 1))
+
+        self.client.delete(reverse('comment-delete', args=[response.data['id']]))
+        self.client.post(reverse('save-toggle', args=[self.photo.id]))
+        self.photo.refresh_from_db()
+        self.assertEqual((self.photo.comment_count, self.photo.bookmark_count), (0, 0))
+
+    def test_edit_keeps_counters_changed_after_load(self):
+        get = Photo.objects.get
+
+        def get_then_like(**kwargs):
+            # A like lands between the edit's lookup and its save
+            found = get(**kwargs)
+            Photo.objects.filter(pk=found.pk).update(like_count=F('like_count') + 5)
+            return found
+
+        with patch.object(Photo.objects, 'get', side_effect=get_then_like):
+            response = self.client.patch(
+                reverse('photo-update-delete', args=[self.photo.id]), {'caption': 'Edited'}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.photo.refresh_from_db()
+        self.assertEqual((self.photo.caption, self.photo.like_count), ('Edited', 5))
+
+    def test_concurrent_comment_deletes_decrement_once(self):
+        comment = Comment.objects.create(user=self.user, photo=self.photo, text='Hi')
+        Photo.objects.filter(pk=self.photo.pk).update(comment_count=1)
+        get = Comment.objects.get
+
+        def get_then_lose_race(**kwargs):
+            # Another request deletes the comment between our lookup and delete
+            found = get(**kwargs)
+            Comment.objects.filter(pk=found.pk).delete()
+            Photo.objects.filter(pk=found.photo_id).update(comment_count=F('comment_count') - 1)
+            return found
+
+        with patch.object(Comment.objects, 'get', side_effect=get_then_lose_race):
+            response = self.client.delete(reverse('comment-delete', args=[comment.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.comment_count, 0)
+
+    def test_rebuild_command_fixes_drift(self):
+        Like.objects.create(user=self.user, photo=self.photo)
+        Comment.objects.create(user=self.user, photo=self.photo, text='Hi')
+        Photo.objects.filter(pk=self.photo.pk).update(bookmark_count=5)
+
+        out = StringIO()
+        call_command('rebuild_photo_counters', stdout=out)
+        self.assertIn('1 rebuilt', out.getvalue())
+        self.photo.refresh_from_db()
+        self.assertEqual((self.photo.like_count, self.photo.comment_count, self.photo.bookmark_count), (1, 1, 0))
+
+class CommentPaginationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.photo = Photo.objects.create(user=self.user, caption='Test photo', image='test_image.jpg', comment_count=5)
+        self.comments = [
+            Comment.objects.create(user=self.user, photo=self.photo, text=f'Comment {i}') for i in range(5)
+        ]
+
+    def test_photo_embeds_only_newest_comments(self):
+        response = self.client.get(reverse('photo-detail', args=[self.photo.id]))
+        self.assertEqual([c['text'] for c in response.data['comments']], ['Comment 2', 'Comment 3', 'Comment 4'])
+        self.assertIsNotNone(response.data['comments_cursor'])
+
+        # The cursor continues with the older comments
+        response = self.client.get(
+            reverse('photo-comments', args=[self.photo.id]), {'cursor': response.data['comments_cursor']}
+        )
+        self.assertEqual([c['text'] for c in response.data['results']], ['Comment 1', 'Comment 0'])
+        self.assertIsNone(response.data['next'])
+
+    def test_comments_endpoint_pages_with_one_query_per_page(self):
+        url = reverse('photo-comments', args=[self.photo.id])
+        # photo exists check, comments joined with users and profiles
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'limit': 2})
+        self.assertEqual([c['id'] for c in response.data['results']], [self.comments[4].id, self.comments[3].id])
+        self.assertEqual(response.data['results'][0]['user']['username'], 'testuser')
+
+        response = self.client.get(reverse('photo-comments', args=[self.photo.id + 100]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.photo = Photo.objects.create(user=self.user, caption='Test photo', image='test_image.jpg')
+        self.feed_url = reverse('photo-feed')
+        self.detail_url = reverse('photo-detail', args=[self.photo.id])
+
+    def test_anonymous_feed_is_cached_until_a_photo_joins_it(self):
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.feed_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        # A comment only re-renders its photo
+        Comment.objects.create(user=self.user, photo=self.photo, text='Hi')
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['comments'][0]['text'], 'Hi')
+
+        new = Photo.objects.create(user=self.user, caption='New photo', image='test_image.jpg')
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([p['id'] for p in response.data['results']], [new.id, self.photo.id])
+
+    def test_likes_leave_the_feed_page_cached(self):
+        response = self.client.get(self.feed_url)
+        etag = response['ETag']
+
+        liker = APIClient()
+        liker.force_authenticate(user=self.user)
+        liker.put(reverse('photo-like', args=[self.photo.id]))
+
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
+        self.assertFalse(response.data['results'][0]['liked_by_me'])
+        # The page's validators follow the photos on it
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get(self.feed_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_photo_detail_is_invalidated_by_likes(self):
+        self.client.get(self.detail_url)
+        self.assertEqual(self.client.get(self.detail_url)['X-Cache'], 'HIT')
+
+        liker = APIClient()
+        liker.force_authenticate(user=self.user)
+        liker.put(reverse('photo-like', args=[self.photo.id]))
+
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['likes_count'], 1)
+
+    def test_versions_are_only_created_for_photos_that_exist(self):
+        missing_url = reverse('photo-detail', args=[self.photo.id + 100])
+        self.assertEqual(self.client.get(missing_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(missing_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(cache.get(f'version:{caching.photo_namespace(self.photo.id + 100)}'))
+
+        # A photo whose version expired gets one once it has been found
+        key = f'version:{caching.photo_namespace(self.photo.id)}'
+        with patch('time.time', return_value=time.time() + settings.RESPONSE_CACHE_VERSION_TIMEOUT + 1):
+            self.assertIsNone(cache.get(key))
+        cache.delete(key)
+        self.assertEqual(self.client.get(self.detail_url).status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(cache.get(key))
+        self.assertEqual(self.client.get(self.detail_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.detail_url)['X-Cache'], 'HIT')
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(self.feed_url)
+        response = self.client.get(self.feed_url)
+        self.assertNotIn('X-Cache', response)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.detail_url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Photo.objects.filter(pk=self.photo.pk).first().save()
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_stats(self):
+        self.client.get(self.feed_url)
+        self.client.get(self.feed_url)
+        admin = User.objects.create_superuser(username='admin', password='TestPass123!')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.data['feed'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertIn('evictions', response.data['fragments'])
+
+class PhotoFragmentCacheTests(APITestCase):
+    def setUp(self):
+        caching.photo_fragments.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        self.photos = [Photo.objects.create(user=self.other, image='test_image.jpg') for _ in range(3)]
+        Like.objects.create(user=self.user, photo=self.photos[0])
+
+    def test_fragments_are_shared_between_viewers_and_listings(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('photo-feed'))
+        self.assertTrue(response.data['results'][2]['liked_by_me'])
+        self.assertEqual(caching.photo_fragments.stats()['misses'], 3)
+
+        # Another viewer reuses the fragments but gets their own flags
+        self.client.force_authenticate(user=self.other)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('photo-list-create'))
+        self.assertFalse(response.data['results'][2]['liked_by_me'])
+        self.assertEqual(caching.photo_fragments.stats()['hits'], 3)
+
+    def test_writes_retire_fragments(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('photo-feed'))
+        Comment.objects.create(user=self.user, photo=self.photos[1], text='Hi')
+
+        response = self.client.get(reverse('photo-feed'))
+        self.assertEqual(response.data['results'][1]['comments'][0]['text'], 'Hi')
+        self.assertEqual(caching.photo_fragments.stats()['hits'], 2)
+
+    def test_photos_from_a_replica_are_rendered_from_the_primary(self):
+        # A replica that has not seen the latest caption yet
+        photo = Photo.objects.with_owner().get(pk=self.photos[0].pk)
+        photo.caption = 'Old caption'
+        photo._state.db = 'replica1'
+        request = RequestFactory().get('/api/')
+        request.user = self.user
+
+        data = serializers.serialize_photos([photo], request)
+        self.assertEqual(data[0]['caption'], self.photos[0].caption)
+        self.assertTrue(data[0]['liked_by_me'])
+        self.assertEqual(caching.photo_fragments.stats()['size'], 1)
+
+    def test_lru_bound_and_evictions(self):
+        fragments = caching.LRUFragmentCache(maxsize=2, timeout=60)
+        fragments.set_many({'a': 1, 'b': 2})
+        fragments.get_many(['a'])
+        fragments.set_many({'c': 3})
+        self.assertEqual(fragments.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+        self.assertEqual(fragments.stats()['evictions'], 1)
+        self.assertEqual(fragments.stats()['size'], 2)
+
+# Fake storage backends for the upload pipeline tests
+class FlakyUploadStorage:
+    failures = 0
+    stored = 0
+
+    def store(self, path):
+        if FlakyUploadStorage.failures:
+            FlakyUploadStorage.failures -= 1
+            raise ConnectionError('storage unavailable')
+        FlakyUploadStorage.stored += 1
+        return f'fake/{os.path.basename(path)}'
+
+    def url(self, stored):
+        return f'https://cdn.test/{stored}'
+
+
+def make_image_file(name='photo.jpg', size=(400, 300), color='red'):
+    data = BytesIO()
+    Image.new('RGB', size, color).save(data, 'JPEG')
+    return SimpleUploadedFile(name, data.getvalue(), content_type='image/jpeg')
+
+
+def make_pattern(size=(256, 256), seed=0):
+    # Image with enough structure for perceptual hashing
+    image = Image.radial_gradient('L').resize(size).convert('RGB')
+    ImageDraw.Draw(image).rectangle((seed * 20, 40, seed * 20 + 90, 150), fill=(250, 250, 250))
+    return image
+
+
+class UploadPipelineTests(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            UPLOAD_STAGING_DIR=os.path.join(self.media_root, 'staging'),
+            UPLOAD_LOCAL_STORAGE_DIR=os.path.join(self.media_root, 'uploads'),
+            UPLOAD_STORAGE_BACKEND='core.tests.FlakyUploadStorage',
+            UPLOAD_WORKERS=0,
+            UPLOAD_RETRY_DELAY=0,
+            IMAGE_WORKERS=0,
+            TIMELINE_WORKERS=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        FlakyUploadStorage.failures = 0
+        FlakyUploadStorage.stored = 0
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+
+    def test_photo_upload_returns_before_storing(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse('photo-list-create'), {'caption': 'Hi', 'image': make_image_file()}, format='multipart'
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'processing')
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'staging'))), 1)
+
+        # Processing photos stay out of the feed
+        self.assertEqual(self.client.get(reverse('photo-feed')).data['results'], [])
+
+        # Run the queued job
+        for callback in callbacks:
+            callback()
+        status_response = self.client.get(reverse('upload-status', args=[response.data['upload_id']]))
+        self.assertEqual(status_response.data['status'], 'ready')
+        self.assertTrue(status_response.data['url'])
+        photo = Photo.objects.get(pk=response.data['id'])
+        self.assertEqual(photo.status, 'ready')
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'staging')), [])
+        self.assertEqual(len(self.client.get(reverse('photo-feed')).data['results']), 1)
+
+    def test_retries_then_succeeds(self):
+        FlakyUploadStorage.failures = 2
+        with self.assertLogs('core.uploads', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('photo-list-create'), {'image': make_image_file()}, format='multipart'
+            )
+        job = UploadJob.objects.get(pk=response.data['upload_id'])
+        self.assertEqual((job.status, job.attempts), ('ready', 3))
+
+    def test_gives_up_after_max_attempts(self):
+        FlakyUploadStorage.failures = 5
+        with self.assertLogs('core.uploads', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('photo-list-create'), {'image': make_image_file()}, format='multipart'
+            )
+        job = UploadJob.objects.get(pk=response.data['upload_id'])
+        self.assertEqual((job.status, job.attempts, job.error), ('failed', 3, 'storage unavailable'))
+        self.assertEqual(job.photo.status, 'failed')
+
+    @override_settings(UPLOAD_STORAGE_BACKEND='core.uploads.LocalUploadStorage')
+    def test_profile_photo_upload_with_local_storage(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('update_profile_photo'), {'profile_photo': make_image_file('me.png')}, format='multipart'
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.get(reverse('upload-status', args=[response.data['upload_id']]))
+        self.assertEqual(response.data['status'], 'ready')
+        self.user.profile.refresh_from_db()
+        self.assertTrue(response.data['url'].startswith('uploads/'))
+        self.assertEqual(str(self.user.profile.profile_photo), response.data['url'])
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'uploads'))), 1)
+
+    def test_process_uploads_command_resumes_stale_jobs(self):
+        staged = os.path.join(self.media_root, 'leftover.jpg')
+        with open(staged, 'wb') as f:
+            f.write(make_image_file().read())
+        photo = Photo.objects.create(user=self.user, status='processing')
+        job = UploadJob.objects.create(user=self.user, photo=photo, kind='photo', staged_path=staged)
+
+        call_command('process_uploads', stale_after=0, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'ready')
+        self.assertFalse(os.path.exists(staged))
+
+    def test_photo_upload_stores_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('photo-list-create'), {'image': make_image_file(size=(1600, 1200))}, format='multipart'
+            )
+        photo = Photo.objects.get(pk=response.data['id'])
+        sizes = {(v.name, v.format): (v.width, v.height) for v in photo.variants.all()}
+        self.assertEqual(sizes[('thumb', 'jpeg')], (320, 240))
+        self.assertEqual(sizes[('feed', 'jpeg')], (1080, 810))
+        self.assertEqual(sizes[('full', 'jpeg')], (1600, 1200))
+        self.assertEqual((photo.width, photo.height), (1600, 1200))
+        self.assertTrue(photo.blurhash)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'staging')), [])
+
+        response = self.client.get(reverse('photo-detail', args=[photo.id]))
+        thumb = photo.variants.get(name='thumb', format='jpeg')
+        self.assertTrue(response.data['srcset']['jpeg'].startswith(f'{thumb.url} 320w, '))
+        self.assertTrue(response.data['srcset']['jpeg'].endswith(' 1600w'))
+        self.assertEqual(set(response.data['srcset']), set(imaging.available_formats()))
+        self.assertEqual((response.data['width'], response.data['height']), (1600, 1200))
+        self.assertEqual(response.data['dominant_color'], photo.dominant_color)
+        self.assertEqual(response.data['blurhash'], photo.blurhash)
+
+    def test_undecodable_image_fails_without_retrying(self):
+        upload = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('photo-list-create'), {'image': upload}, format='multipart')
+        job = UploadJob.objects.get(pk=response.data['upload_id'])
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+        self.assertTrue(job.error.startswith('Not a valid image file'))
+
+    def test_exact_duplicate_reuses_stored_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(reverse('photo-list-create'), {'image': make_image_file()}, format='multipart')
+        stored = FlakyUploadStorage.stored
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.client.post(reverse('photo-list-create'), {'image': make_image_file()}, format='multipart')
+        self.assertEqual(FlakyUploadStorage.stored, stored)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'staging')), [])
+
+        original = Photo.objects.get(pk=first.data['id'])
+        duplicate = Photo.objects.get(pk=second.data['id'])
+        self.assertEqual(duplicate.status, 'ready')
+        self.assertEqual(str(duplicate.image), str(original.image))
+        self.assertEqual(duplicate.asset_id, original.asset_id)
+        self.assertEqual((duplicate.width, duplicate.blurhash), (original.width, original.blurhash))
+        self.assertEqual(
+            sorted(duplicate.variants.values_list('name', 'format', 'url')),
+            sorted(original.variants.values_list('name', 'format', 'url')),
+        )
+        self.assertEqual(ImageAsset.objects.count(), 1)
+
+        # Different bytes are stored on their own
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('photo-list-create'), {'image': make_image_file(color='blue')}, format='multipart')
+        self.assertGreater(FlakyUploadStorage.stored, stored)
+        self.assertEqual(ImageAsset.objects.count(), 2)
+
+    def test_reupload_after_delete_stores_the_image_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(reverse('photo-list-create'), {'image': make_image_file()}, format='multipart')
+        Photo.objects.get(pk=first.data['id']).delete()
+        self.assertEqual(ImageAsset.objects.count(), 0)
+        stored = FlakyUploadStorage.stored
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.client.post(reverse('photo-list-create'), {'image': make_image_file()}, format='multipart')
+        self.assertGreater(FlakyUploadStorage.stored, stored)
+        photo = Photo.objects.get(pk=second.data['id'])
+        self.assertEqual(photo.status, 'ready')
+        self.assertEqual(str(photo.asset.image), str(photo.image))
+
+    def test_orphaned_asset_takes_the_new_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(reverse('photo-list-create'), {'image': make_image_file()}, format='multipart')
+        asset = Photo.objects.get(pk=first.data['id']).asset
+        # Left behind as if a delete had raced the last photo's
+        Photo.objects.filter(pk=first.data['id']).update(asset=None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.client.post(reverse('photo-list-create'), {'image': make_image_file()}, format='multipart')
+        photo = Photo.objects.get(pk=second.data['id'])
+        self.assertEqual(photo.asset_id, asset.pk)
+        self.assertNotEqual(str(photo.image), str(asset.image))
+        self.assertEqual(str(photo.asset.image), str(photo.image))
+
+    def put_chunk(self, session_id, data, offset, checksum=None):
+        checksum = checksum or base64.b64encode(hashlib.sha256(data).digest()).decode()
+        return self.client.put(
+            reverse('chunked-upload-detail', args=[session_id]), data,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_UPLOAD_CHECKSUM=f'sha256 {checksum}',
+        )
+
+    def test_chunked_upload(self):
+        data = make_image_file(size=(800, 600)).read()
+        response = self.client.post(reverse('chunked-upload-create'), {'filename': 'big.jpg', 'size': len(data)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        session_id = response.data['id']
+        self.assertEqual(response.data['offset'], 0)
+
+        half = len(data) // 2
+        response = self.put_chunk(session_id, data[:half], 0)
+        self.assertEqual(response.data['offset'], half)
+
+        # Not done yet
+        response = self.client.post(reverse('chunked-upload-finalize', args=[session_id]))
+        self.assertEqual((response.status_code, response.data['offset']), (409, half))
+
+        # A client resuming after a dropped connection asks where to continue
+        response = self.client.get(reverse('chunked-upload-detail', args=[session_id]))
+        self.assertEqual(response.data['offset'], half)
+        self.put_chunk(session_id, data[half:], half)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('chunked-upload-finalize', args=[session_id]), {'caption': 'Large'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        photo = Photo.objects.get(pk=response.data['id'])
+        self.assertEqual((photo.caption, photo.status, photo.width), ('Large', 'ready', 800))
+        self.assertEqual(UploadJob.objects.get(pk=response.data['upload_id']).sha256, hashlib.sha256(data).hexdigest())
+
+        response = self.client.post(reverse('chunked-upload-finalize', args=[session_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.put_chunk(session_id, b'x', len(data)).status_code, status.HTTP_409_CONFLICT)
+
+    def test_rejected_chunks_are_not_kept(self):
+        response = self.client.post(reverse('chunked-upload-create'), {'filename': 'big.jpg', 'size': 10})
+        session = UploadSession.objects.get(pk=response.data['id'])
+
+        bad_checksum = base64.b64encode(hashlib.sha256(b'other').digest()).decode()
+        response = self.put_chunk(session.pk, b'12345', 0, checksum=bad_checksum)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(os.path.getsize(session.staged_path), 0)
+
+        self.put_chunk(session.pk, b'12345', 0)
+        response = self.put_chunk(session.pk, b'12345', 0)
+        self.assertEqual((response.status_code, response.data['offset']), (409, 5))
+        response = self.put_chunk(session.pk, b'123456', 5)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.put(reverse('chunked-upload-detail', args=[session.pk]), b'67890',
+                                         content_type='application/offset+octet-stream',
+                                         HTTP_UPLOAD_OFFSET='5').status_code, status.HTTP_400_BAD_REQUEST)
+        with open(session.staged_path, 'rb') as f:
+            self.assertEqual(f.read(), b'12345')
+
+        other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.put_chunk(session.pk, b'67890', 5).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_chunk_that_loses_a_race_is_not_added(self):
+        response = self.client.post(reverse('chunked-upload-create'), {'filename': 'big.jpg', 'size': 10})
+        session = UploadSession.objects.get(pk=response.data['id'])
+        write_chunk = uploads.write_chunk
+
+        def write_then_lose_race(*args):
+            received = write_chunk(*args)
+            # Another PUT for the same offset finishes first
+            UploadSession.objects.filter(pk=session.pk).update(offset=5)
+            return received
+
+        with patch('core.uploads.write_chunk', side_effect=write_then_lose_race):
+            response = self.put_chunk(session.pk, b'12345', 0)
+        self.assertEqual((response.status_code, response.data['offset']), (409, 5))
+        self.assertEqual(os.path.getsize(session.staged_path), 0)
+        # The received part is removed
+        self.assertEqual(os.listdir(os.path.dirname(session.staged_path)), [os.path.basename(session.staged_path)])
+
+    def test_chunked_upload_size_limit(self):
+        with override_settings(UPLOAD_MAX_SIZE=100):
+            response = self.client.post(reverse('chunked-upload-create'), {'filename': 'big.jpg', 'size': 101})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('size', response.data)
+
+    def test_process_uploads_removes_abandoned_sessions(self):
+        response = self.client.post(reverse('chunked-upload-create'), {'filename': 'big.jpg', 'size': 10})
+        session = UploadSession.objects.get(pk=response.data['id'])
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(days=2))
+
+        call_command('process_uploads', stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(session.staged_path))
+
+    def test_status_of_someone_elses_upload(self):
+        other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        job = UploadJob.objects.create(user=other, kind='profile_photo', staged_path='/nonexistent')
+        response = self.client.get(reverse('upload-status', args=[job.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ImageProcessingTests(TestCase):
+    def test_small_images_are_not_upscaled(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        variants = imaging.render_variants(Image.new('RGB', (500, 250)), directory, 'small', formats=['jpeg'])
+        self.assertEqual(
+            [(v['name'], v['width'], v['height']) for v in variants],
+            [('thumb', 320, 160), ('feed', 500, 250)],
+        )
+        with Image.open(variants[0]['path']) as thumb:
+            self.assertEqual(thumb.size, (320, 160))
+
+    def test_describe_image(self):
+        image = Image.new('RGB', (300, 600), (0, 0, 255))
+        image.paste((255, 0, 0), (0, 0, 300, 100))
+        metadata = imaging.describe_image(image)
+        self.assertEqual((metadata['width'], metadata['height']), (300, 600))
+        self.assertEqual(metadata['dominant_color'], '#0000ff')
+        # Portrait images get 3x4 components: size flag 2 + 3 * 9 = 29 -> 'T'
+        self.assertEqual(metadata['blurhash'][0], 'T')
+        self.assertEqual(len(metadata['blurhash']), 6 + 2 * 11)
+
+    def test_perceptual_hash_survives_resizing_and_recompression(self):
+        original = make_pattern()
+        data = BytesIO()
+        original.resize((180, 180)).save(data, 'JPEG', quality=40)
+        copy = imaging.open_image(BytesIO(data.getvalue()))
+
+        phash = imaging.perceptual_hash(original)
+        self.assertEqual(len(phash), 16)
+        self.assertLessEqual(imaging.hash_distance(phash, imaging.perceptual_hash(copy)), 4)
+        self.assertGreater(imaging.hash_distance(phash, imaging.perceptual_hash(make_pattern(seed=8))), 6)
+
+    def test_decompression_bombs_are_invalid(self):
+        data = make_image_file(size=(200, 100)).read()
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 5000):
+            with self.assertRaises(imaging.InvalidImage):
+                imaging.open_image(BytesIO(data))
+
+    def test_blurhash_of_solid_color(self):
+        # Reference value from the blurhash reference implementation
+        self.assertEqual(imaging.blurhash(Image.new('RGB', (8, 8), (255, 255, 255)), 1, 1), '00TSUA')
+
+
+@override_settings(IMAGE_WORKERS=0)
+class BackfillPhotoMetadataTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.photos = [
+            Photo.objects.create(user=self.user, image=f'https://res.cloudinary.com/demo/image/upload/v1/p{i}.jpg')
+            for i in range(3)
+        ]
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.checkpoint = os.path.join(directory, 'checkpoint.json')
+
+    def backfill(self, fetch_image, **options):
+        with patch('core.management.commands.backfill_photo_metadata.fetch_image', side_effect=fetch_image) as fetch:
+            call_command(
+                'backfill_photo_metadata', batch_size=2, checkpoint=self.checkpoint,
+                stdout=StringIO(), stderr=StringIO(), **options,
+            )
+        return [call.args[0] for call in fetch.call_args_list]
+
+    def test_fills_in_metadata(self):
+        fetched = self.backfill(lambda url: make_image_file(size=(200, 100)).read())
+        self.assertEqual(sorted(fetched), [f'https://res.cloudinary.com/demo/image/upload/v1/p{i}.jpg' for i in range(3)])
+        for photo in Photo.objects.all():
+            self.assertEqual((photo.width, photo.height), (200, 100))
+            self.assertTrue(photo.blurhash)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        # Nothing left to do on a second run
+        self.assertEqual(self.backfill(lambda url: self.fail('fetched again')), [])
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'last_id': self.photos[1].pk}, f)
+        fetched = self.backfill(lambda url: make_image_file().read())
+        self.assertEqual(fetched, ['https://res.cloudinary.com/demo/image/upload/v1/p2.jpg'])
+        self.assertIsNone(Photo.objects.get(pk=self.photos[0].pk).width)
+
+        self.assertEqual(len(self.backfill(lambda url: make_image_file().read(), restart=True)), 2)
+
+    def test_undecodable_images_are_skipped(self):
+        self.backfill(lambda url: b'not an image')
+        self.assertFalse(Photo.objects.filter(width__isnull=False).exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_oversized_images_are_skipped(self):
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 5000):
+            self.backfill(lambda url: make_image_file(size=(200, 100)).read())
+        self.assertFalse(Photo.objects.filter(width__isnull=False).exists())
+
+    @override_settings(IMAGE_WORKERS=1)
+    def test_crashed_image_worker_only_fails_its_photo(self):
+        pools = []
+
+        # Runs inline; the first pool behaves as if its worker had died
+        class FakeProcessPool:
+            def __init__(self, **kwargs):
+                pools.append(self)
+
+            def submit(self, function, *args):
+                future = Future()
+                if self is pools[0]:
+                    future.set_exception(BrokenProcessPool('worker died'))
+                else:
+                    future.set_result(function(*args))
+                return future
+
+            def shutdown(self, wait=True):
+                pass
+
+        self.addCleanup(setattr, imaging, '_pool', None)
+        with patch('core.imaging.ProcessPoolExecutor', FakeProcessPool):
+            self.backfill(lambda url: make_image_file(size=(200, 100)).read(), workers=1)
+        self.assertEqual(len(pools), 2)
+        self.assertEqual(Photo.objects.filter(width=200).count(), 2)
+        self.assertIsNone(Photo.objects.get(pk=self.photos[0].pk).width)
+
+
+class FindSimilarPhotosTests(TestCase):
+    def test_reports_near_duplicate_clusters(self):
+        user = User.objects.create_user(username='testuser', password='TestPass123!')
+        phashes = {
+            'a': 'ff00ff00ff00ff00',
+            'b': 'ff00ff00ff00ff03',  # 2 bits from a
+            'c': 'ff00ff00ff00ff0f',  # 2 bits from b, 4 from a
+            'd': '00ff00ff00ff00ff',  # far from everything
+        }
+        assets = {}
+        for name, phash in phashes.items():
+            assets[name] = ImageAsset.objects.create(sha256=name * 64, phash=phash, image=f'{name}.jpg', size=1)
+        photo = Photo.objects.create(user=user, image='a.jpg', asset=assets['a'])
+
+        out = StringIO()
+        call_command('find_similar_photos', threshold=2, stdout=out)
+        output = out.getvalue()
+        self.assertIn('Cluster of 3 images:', output)
+        self.assertIn(f"asset {assets['a'].pk} (phash ff00ff00ff00ff00): photos {photo.pk}", output)
+        self.assertNotIn(f"asset {assets['d'].pk} ", output)
+        self.assertIn('Found 1 clusters of near-duplicates among 4 images.', output)
+
+        out = StringIO()
+        call_command('find_similar_photos', threshold=1, stdout=out)
+        self.assertIn('Found 0 clusters', out.getvalue())
+
+
+@override_settings(TIMELINE_WORKERS=0, TIMELINE_CACHE_ALIAS='default')
+class HomeTimelineTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.alice = User.objects.create_user(username='alice', password='TestPass123!')
+        self.bob = User.objects.create_user(username='bob', password='TestPass123!')
+        self.carol = User.objects.create_user(username='carol', password='TestPass123!')
+        self.client.force_authenticate(user=self.alice)
+
+    def post(self, user, caption):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Photo.objects.create(user=user, caption=caption, image='test_image.jpg')
+
+    def follow(self, user, method='put'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(reverse('user-follow', args=[user.pk]))
+
+    def home(self, **params):
+        return self.client.get(reverse('home-feed'), params)
+
+    def captions(self, response):
+        return [photo['caption'] for photo in response.data['results']]
+
+    def test_follow_is_idempotent(self):
+        response = self.follow(self.bob)
+        self.assertEqual(response.data, {'following': True, 'followers_count': 1})
+        response = self.follow(self.bob)
+        self.assertEqual(response.data, {'following': True, 'followers_count': 1})
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(Profile.objects.get(user=self.alice).following_count, 1)
+
+        response = self.follow(self.bob, 'delete')
+        self.assertEqual(response.data, {'following': False, 'followers_count': 0})
+        response = self.follow(self.bob, 'delete')
+        self.assertEqual(response.data, {'following': False, 'followers_count': 0})
+
+        self.assertEqual(self.follow(self.alice).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.put(reverse('user-follow', args=[999])).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_home_feed_shows_own_and_followed_photos(self):
+        self.post(self.bob, 'bob 1')
+        self.post(self.carol, 'carol 1')
+        self.post(self.alice, 'alice 1')
+        self.follow(self.bob)
+        self.assertEqual(self.captions(self.home()), ['alice 1', 'bob 1'])
+
+        # Fanned out into the cached timeline as they are posted
+        self.post(self.bob, 'bob 2')
+        self.post(self.carol, 'carol 2')
+        self.assertEqual(
+            [photo_id for photo_id, _ in cache.get(timeline.timeline_key(self.alice.pk))],
+            list(Photo.objects.filter(caption__in=['bob 2', 'alice 1', 'bob 1']).order_by('-id').values_list('pk', flat=True)),
+        )
+        self.assertEqual(self.captions(self.home()), ['bob 2', 'alice 1', 'bob 1'])
+
+        # Following merges in earlier photos, unfollowing takes them out
+        self.follow(self.carol)
+        self.assertEqual(self.captions(self.home()), ['carol 2', 'bob 2', 'alice 1', 'carol 1', 'bob 1'])
+        self.follow(self.bob, 'delete')
+        self.assertEqual(self.captions(self.home()), ['carol 2', 'alice 1', 'carol 1'])
+
+    def test_home_feed_pages(self):
+        self.follow(self.bob)
+        self.home()
+        for i in range(5):
+            self.post(self.bob, f'bob {i}')
+        # Still listed in the cached timeline, skipped when the page is loaded
+        Photo.objects.filter(caption='bob 2').delete()
+
+        first = self.home(limit=2)
+        self.assertEqual(self.captions(first), ['bob 4', 'bob 3'])
+        second = self.home(limit=2, cursor=first.data['next_cursor'])
+        self.assertEqual(self.captions(second), ['bob 1'])
+        third = self.home(limit=2, cursor=second.data['next_cursor'])
+        self.assertEqual(self.captions(third), ['bob 0'])
+        self.assertIsNone(third.data['next_cursor'])
+
+    def test_popular_authors_are_pulled_on_read(self):
+        Follow.objects.create(follower=self.carol, followee=self.bob)
+        Profile.objects.filter(user=self.bob).update(followers_count=1)
+        self.follow(self.bob)
+        self.home()
+
+        with override_settings(TIMELINE_FANOUT_LIMIT=1):
+            photo = self.post(self.bob, 'bob 1')
+            self.assertNotIn(photo.pk, [entry[0] for entry in cache.get(timeline.timeline_key(self.alice.pk))])
+            self.assertEqual(self.captions(self.home()), ['bob 1'])
+
+    def test_cached_timelines_expire(self):
+        self.post(self.alice, 'alice 1')
+        self.home()
+        key = timeline.timeline_key(self.alice.pk)
+        self.assertIsNotNone(cache.get(key))
+        with patch('time.time', return_value=time.time() + settings.TIMELINE_CACHE_TIMEOUT + 1):
+            self.assertIsNone(cache.get(key))
+
+    def test_no_timeline_cache_reads_from_database(self):
+        self.follow(self.bob)
+        with override_settings(TIMELINE_CACHE_ALIAS=None):
+            self.post(self.bob, 'bob 1')
+            self.assertEqual(self.captions(self.home()), ['bob 1'])
+            self.post(self.alice, 'alice 1')
+            self.assertEqual(self.captions(self.home()), ['alice 1', 'bob 1'])
+        self.assertIsNone(cache.get(timeline.timeline_key(self.alice.pk)))
+
+    def test_lock_held_elsewhere_is_not_released(self):
+        lock = f'{timeline.timeline_key(self.alice.pk)}:lock'
+        cache.add(lock, 1, timeout=5)
+        with patch('core.timeline.time.sleep'):
+            with timeline.locked(self.alice.pk):
+                pass
+        self.assertTrue(cache.has_key(lock))
+        cache.delete(lock)
+
+        with timeline.locked(self.alice.pk):
+            self.assertTrue(cache.has_key(lock))
+        self.assertFalse(cache.has_key(lock))
+
+    def test_home_feed_requires_login(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.home().status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TrendingTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+        self.photo = Photo.objects.create(user=self.user, caption='Test photo', image='test_image.jpg')
+
+    def score(self, photo=None):
+        return Photo.objects.get(pk=(photo or self.photo).pk).trending_score
+
+    def age(self, photo, seconds):
+        # Moves a photo's score and interactions back in time
+        Photo.objects.filter(pk=photo.pk).update(trending_at=F('trending_at') - seconds)
+        for model in (Like, Comment):
+            model.objects.filter(photo=photo).update(created_at=F('created_at') - timedelta(seconds=seconds))
+
+    def test_likes_and_comments_update_the_score(self):
+        self.client.put(reverse('photo-like', args=[self.photo.id]))
+        self.assertAlmostEqual(self.score(), trending.LIKE_WEIGHT, places=3)
+        self.client.put(reverse('photo-like', args=[self.photo.id]))
+        self.assertAlmostEqual(self.score(), trending.LIKE_WEIGHT, places=3)
+
+        response = self.client.post(reverse('comment-create'), {'photo': self.photo.id, 'text': 'Nice'})
+        self.assertAlmostEqual(self.score(), trending.LIKE_WEIGHT + trending.COMMENT_WEIGHT, places=3)
+        self.client.delete(reverse('comment-delete', args=[response.data['id']]))
+        self.assertAlmostEqual(self.score(), trending.LIKE_WEIGHT, places=3)
+
+    def test_removing_an_old_like_takes_off_what_is_left_of_it(self):
+        self.client.post(reverse('like-toggle', args=[self.photo.id]))
+        self.age(self.photo, settings.TRENDING_HALF_LIFE)
+        other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        Like.objects.create(user=other, photo=self.photo)
+        trending.add(self.photo.pk, trending.LIKE_WEIGHT)
+        self.assertAlmostEqual(self.score(), 1.5, places=3)
+
+        self.client.post(reverse('like-toggle', args=[self.photo.id]))
+        self.assertAlmostEqual(self.score(), 1.0, places=3)
+
+    def test_decay_command(self):
+        fading = Photo.objects.create(user=self.user, image='test_image.jpg')
+        trending.add(self.photo.pk, 4)
+        trending.add(fading.pk, 0.015)
+        self.age(self.photo, settings.TRENDING_HALF_LIFE)
+        self.age(fading, settings.TRENDING_HALF_LIFE)
+
+        call_command('decay_trending_scores', stdout=StringIO())
+        self.assertAlmostEqual(self.score(), 2, places=3)
+        self.assertEqual(self.score(fading), 0)
+
+    def test_rebuild(self):
+        other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        Like.objects.create(user=other, photo=self.photo)
+        Comment.objects.create(user=other, photo=self.photo, text='Nice')
+        self.age(self.photo, settings.TRENDING_HALF_LIFE)
+        stale = Photo.objects.create(user=self.user, image='test_image.jpg', trending_score=5, trending_at=time.time())
+
+        call_command('decay_trending_scores', rebuild=True, stdout=StringIO())
+        self.assertAlmostEqual(self.score(), (trending.LIKE_WEIGHT + trending.COMMENT_WEIGHT) / 2, places=3)
+        self.assertEqual(self.score(stale), 0)
+
+    def test_trending_listing(self):
+        old = self.photo
+        for i in range(3):
+            liker = User.objects.create_user(username=f'liker{i}', password='TestPass123!')
+            self.client.force_authenticate(user=liker)
+            self.client.put(reverse('photo-like', args=[old.id]))
+        self.age(old, 2 * settings.TRENDING_HALF_LIFE)
+        call_command('decay_trending_scores', stdout=StringIO())
+
+        new = Photo.objects.create(user=self.user, caption='New', image='test_image.jpg')
+        self.client.put(reverse('photo-like', args=[new.id]))
+        Photo.objects.create(user=self.user, caption='Unseen', image='test_image.jpg')
+
+        self.client.force_authenticate(user=None)
+        first = self.client.get(reverse('trending-photos'), {'limit': 1})
+        self.assertEqual([p['id'] for p in first.data['results']], [new.id])
+        second = self.client.get(reverse('trending-photos'), {'limit': 1, 'cursor': first.data['next_cursor']})
+        self.assertEqual([p['id'] for p in second.data['results']], [old.id])
+        self.assertIsNone(second.data['next_cursor'])
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.other = User.objects.create_user(username='sunsetfan', password='TestPass123!')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('photo-search'), {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def ids(self, response):
+        return [photo['id'] for photo in response.data['results']]
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize('Golden #Sunset, over the sea!'), ['golden', '#sunset', 'sunset', 'over', 'the', 'sea'])
+        self.assertEqual(search.query_terms('#sunset SUNSET sunset'), ['#sunset', 'sunset'])
+
+    def test_ranks_caption_and_comment_matches(self):
+        commented = Photo.objects.create(user=self.user, caption='At the beach', image='test_image.jpg')
+        Comment.objects.create(user=self.other, photo=commented, text='What a sunset')
+        captioned = Photo.objects.create(user=self.user, caption='Sunset at the beach', image='test_image.jpg')
+        Photo.objects.create(user=self.user, caption='Mountains', image='test_image.jpg')
+
+        self.assertEqual(self.ids(self.search('sunset')), [captioned.id, commented.id])
+        # Every term has to match
+        self.assertEqual(self.ids(self.search('beach sunset')), [captioned.id, commented.id])
+        self.assertEqual(self.ids(self.search('sunset mountains')), [])
+
+    def test_hashtags_and_usernames(self):
+        tagged = Photo.objects.create(user=self.user, caption='Evening #sunset', image='test_image.jpg')
+        plain = Photo.objects.create(user=self.user, caption='Evening sunset', image='test_image.jpg')
+        owned = Photo.objects.create(user=self.other, caption='Lake', image='test_image.jpg')
+
+        self.assertEqual(self.ids(self.search('#sunset')), [tagged.id])
+        self.assertEqual(set(self.ids(self.search('sunset'))), {tagged.id, plain.id})
+        self.assertEqual(self.ids(self.search('sunsetfan')), [owned.id])
+
+    def test_index_follows_edits_and_deletes(self):
+        photo = Photo.objects.create(user=self.user, caption='Sunset', image='test_image.jpg')
+        comment = Comment.objects.create(user=self.other, photo=photo, text='Lovely colours')
+        self.assertEqual(self.ids(self.search('colours')), [photo.id])
+
+        comment.delete()
+        self.assertEqual(self.ids(self.search('colours')), [])
+        photo.caption = 'Sunrise'
+        photo.save()
+        self.assertEqual(self.ids(self.search('sunset')), [])
+        self.assertEqual(self.ids(self.search('sunrise')), [photo.id])
+
+    def test_pagination_and_visibility(self):
+        photos = [Photo.objects.create(user=self.user, caption='Sunset', image='test_image.jpg') for _ in range(3)]
+        Photo.objects.create(user=self.user, caption='Sunset', image='', status=UploadStatus.PROCESSING)
+
+        first = self.search('sunset', limit=2)
+        self.assertEqual(self.ids(first), [photos[2].id, photos[1].id])
+        second = self.search('sunset', limit=2, cursor=first.data['next_cursor'])
+        self.assertEqual(self.ids(second), [photos[0].id])
+        self.assertIsNone(second.data['next_cursor'])
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('photo-search'), {'q': ' #! '})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command(self):
+        photo = Photo.objects.create(user=self.user, caption='Sunset', image='test_image.jpg')
+        Comment.objects.create(user=self.other, photo=photo, text='Lovely colours')
+        SearchPosting.objects.all().delete()
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.ids(self.search('sunset colours')), [photo.id])
+
+    @override_settings(SEARCH_BACKEND='fulltext')
+    def test_fulltext_query(self):
+        sql = str(search.search_photos('sunset').query)
+        self.assertIn('MATCH ("core_photo"."caption") AGAINST (sunset IN NATURAL LANGUAGE MODE)', sql)
+        self.assertIn('MATCH (U0."text") AGAINST', sql)
+
+
+class TagTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.other = User.objects.create_user(username='other.user', password='TestPass123!')
+
+    def tag_page(self, name, **params):
+        return self.client.get(reverse('tag-photos', args=[name]), params)
+
+    def test_extraction(self):
+        caption = '#Sunset with @other.user. #sunset #beach_day mail me@example.com, no a#b'
+        self.assertEqual(tags.extract_tags(caption), ['sunset', 'beach_day'])
+        self.assertEqual(tags.extract_mentions(caption), ['other.user'])
+
+    def test_tags_and_mentions_follow_the_caption(self):
+        photo = Photo.objects.create(user=self.user, caption='#Sunset by @other.user and @nobody', image='test_image.jpg')
+        self.assertEqual(Tag.objects.get(name='sunset').photo_count, 1)
+        self.assertEqual(list(Mention.objects.values_list('photo', 'user')), [(photo.id, self.other.id)])
+
+        photo.caption = '#beach'
+        photo.save()
+        self.assertEqual(dict(Tag.objects.values_list('name', 'photo_count')), {'sunset': 0, 'beach': 1})
+        self.assertFalse(Mention.objects.exists())
+
+        photo.delete()
+        self.assertEqual(Tag.objects.get(name='beach').photo_count, 0)
+        self.assertFalse(PhotoTag.objects.exists())
+
+    def test_only_ready_photos_are_counted(self):
+        processing = Photo.objects.create(user=self.user, caption='#sunset', image='', status=UploadStatus.PROCESSING)
+        failed = Photo.objects.create(user=self.user, caption='#sunset', image='', status=UploadStatus.PROCESSING)
+        tag = Tag.objects.get(name='sunset')
+        self.assertEqual(tag.photo_count, 0)
+
+        # An edit while processing moves no counts
+        processing.caption = '#sunset #beach'
+        processing.save(update_fields=['caption'])
+        self.assertEqual(dict(Tag.objects.values_list('name', 'photo_count')), {'sunset': 0, 'beach': 0})
+
+        processing.status = UploadStatus.READY
+        processing.save(update_fields=['status'])
+        failed.status = UploadStatus.FAILED
+        failed.save(update_fields=['status'])
+        self.assertEqual(dict(Tag.objects.values_list('name', 'photo_count')), {'sunset': 1, 'beach': 1})
+        self.assertEqual(self.tag_page('sunset').data['photo_count'], 1)
+
+        failed.delete()
+        processing.delete()
+        self.assertEqual(dict(Tag.objects.values_list('name', 'photo_count')), {'sunset': 0, 'beach': 0})
+
+    def test_tag_page(self):
+        photos = [Photo.objects.create(user=self.user, caption=f'Day {i} #sunset', image='test_image.jpg') for i in range(3)]
+        Photo.objects.create(user=self.user, caption='#beach', image='test_image.jpg')
+
+        first = self.tag_page('Sunset', limit=2)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['name'], 'sunset')
+        self.assertEqual(first.data['photo_count'], 3)
+        self.assertEqual([p['id'] for p in first.data['results']], [photos[2].id, photos[1].id])
+        second = self.tag_page('sunset', limit=2, cursor=first.data['next_cursor'])
+        self.assertEqual([p['id'] for p in second.data['results']], [photos[0].id])
+        self.assertIsNone(second.data['next_cursor'])
+
+        self.assertEqual(self.tag_page('unknown').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_backfill_command(self):
+        photo = Photo.objects.create(user=self.user, caption='#sunset @other.user', image='test_image.jpg')
+        Photo.objects.create(user=self.user, caption='#sunset', image='test_image.jpg')
+        Photo.objects.create(user=self.user, caption='#sunset', image='', status=UploadStatus.PROCESSING)
+        PhotoTag.objects.all().delete()
+        Mention.objects.all().delete()
+        Tag.objects.update(photo_count=7)
+
+        call_command('backfill_photo_tags', batch_size=1, stdout=StringIO())
+        self.assertEqual(Tag.objects.get(name='sunset').photo_count, 2)
+        self.assertEqual(PhotoTag.objects.count(), 3)
+        self.assertEqual(list(Mention.objects.values_list('photo', 'user')), [(photo.id, self.other.id)])
+
+
 class CommentTests(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -90,6 +1445,87 @@ class LikeTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['status'], 'unliked')
 
+class IdempotentLikeSaveTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+        self.photo = Photo.objects.create(user=self.user, caption='Test photo', image='test_image.jpg')
+
+    def test_put_and_delete_like_are_idempotent(self):
+        url = reverse('photo-like', args=[self.photo.id])
+        for _ in range(2):
+            response = self.client.put(url)
+            self.assertEqual(response.data, {'status': 'liked', 'liked': True, 'likes_count': 1})
+        for _ in range(2):
+            response = self.client.delete(url)
+            self.assertEqual(response.data, {'status': 'unliked', 'liked': False, 'likes_count': 0})
+        self.assertFalse(Like.objects.exists())
+
+    def test_put_and_delete_save_are_idempotent(self):
+        url = reverse('photo-save', args=[self.photo.id])
+        self.client.put(url)
+        response = self.client.put(url)
+        self.assertEqual(response.data['bookmarks_count'], 1)
+        self.assertEqual(Bookmark.objects.count(), 1)
+        self.client.delete(url)
+        response = self.client.delete(url)
+        self.assertEqual(response.data, {'status': 'unsaved', 'saved': False, 'bookmarks_count': 0})
+
+    def test_missing_photo(self):
+        for name in ('photo-like', 'photo-save', 'like-toggle'):
+            url = reverse(name, args=[self.photo.id + 100])
+            method = self.client.post if name == 'like-toggle' else self.client.put
+            self.assertEqual(method(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Bookmark.objects.exists())
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentLikeTests(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 10
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='TestPass123!') for i in range(self.THREADS)
+        ]
+        self.photo = Photo.objects.create(user=self.users[0], image='test_image.jpg')
+
+    def hammer(self, user, barrier, errors):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse('photo-like', args=[self.photo.id])
+        toggle_url = reverse('like-toggle', args=[self.photo.id])
+        try:
+            barrier.wait()
+            for i in range(self.ROUNDS):
+                for method in (client.put, client.put, client.delete, client.post, client.put):
+                    response = method(toggle_url) if method == client.post else method(url)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_likes_keep_counter_exact(self):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+        threads = [
+            threading.Thread(target=self.hammer, args=(user, barrier, errors))
+            for user in self.users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.photo.refresh_from_db()
+        # Each user ends every round liked: put, put, delete, toggle (on), put
+        self.assertEqual(Like.objects.filter(photo=self.photo).count(), self.THREADS)
+        self.assertEqual(self.photo.like_count, self.THREADS)
+
 class BookmarkTests(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -114,8 +1550,106 @@ class BookmarkTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['status'], 'unsaved')
 
+class SavedPhotosTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+
+    def test_newest_save_first_with_cursor(self):
+        photos = [Photo.objects.create(user=self.user, caption=f'Photo {i}', image='test_image.jpg') for i in range(3)]
+        other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        for photo in photos:
+            Bookmark.objects.create(user=other, photo=photo)
+        # Saved in a different order than posted, two in the same instant
+        now = timezone.now()
+        for photo in photos:
+            Bookmark.objects.create(user=self.user, photo=photo)
+        Bookmark.objects.filter(user=self.user, photo=photos[1]).update(created_at=now - timedelta(hours=1))
+        Bookmark.objects.filter(user=self.user).exclude(photo=photos[1]).update(created_at=now)
+
+        first = self.client.get(reverse('saved-photos'), {'limit': 2})
+        self.assertEqual([p['id'] for p in first.data['results']], [photos[2].id, photos[0].id])
+        self.assertTrue(all(p['saved_by_me'] for p in first.data['results']))
+        second = self.client.get(reverse('saved-photos'), {'limit': 2, 'cursor': first.data['next_cursor']})
+        self.assertEqual([p['id'] for p in second.data['results']], [photos[1].id])
+        self.assertIsNone(second.data['next_cursor'])
+
+
+# The async versions of the read endpoints (ASYNC_READ_VIEWS), called directly
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_users.clear()
+        caching.photo_fragments.clear()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.photo = Photo.objects.create(user=self.user, caption='Caption', image='test_image.jpg')
+        Bookmark.objects.create(user=self.user, photo=self.photo)
+        self.token = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+
+    async def call(self, view, *args, method='get', **headers):
+        request = getattr(AsyncRequestFactory(), method)('/api/', headers=headers)
+        response = await view(request, *args)
+        return response.render() if hasattr(response, 'render') else response
+
+    async def test_anonymous_feed_is_cached_and_conditional(self):
+        first = await self.call(views.photo_feed_async)
+        self.assertEqual((first.status_code, first['X-Cache']), (200, 'MISS'))
+        self.assertEqual([p['id'] for p in first.data['results']], [self.photo.id])
+        second = await self.call(views.photo_feed_async)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        unchanged = await self.call(views.photo_feed_async, if_none_match=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+    async def test_same_payloads_as_the_sync_views(self):
+        for sync_view, async_view, args in [
+            (views.photo_feed, views.photo_feed_async, ()),
+            (views.photo_detail, views.photo_detail_async, (self.photo.pk,)),
+            (views.saved_photos, views.saved_photos_async, ()),
+        ]:
+            expected = await sync_to_async(sync_view)(RequestFactory().get('/api/', HTTP_AUTHORIZATION=self.token), *args)
+            response = await self.call(async_view, *args, authorization=self.token)
+            self.assertEqual((response.status_code, response.data), (expected.status_code, expected.data))
+
+    async def test_saved_photos_read_from_the_replica(self):
+        # The replica picked for the request, whatever the test transaction
+        # makes of it
+        replicas = []
+
+        def record():
+            replicas.append(routers._replica.get())
+
+        with patch('core.routers.get_replica', record), override_settings(DATABASE_REPLICAS=['replica1']):
+            response = await self.call(views.saved_photos_async, authorization=self.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('replica1', replicas)
+
+    async def test_errors_match_drf(self):
+        missing = await self.call(views.photo_detail_async, self.photo.pk + 1)
+        self.assertEqual(missing.status_code, 404)
+        anonymous = await self.call(views.saved_photos_async)
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(anonymous['WWW-Authenticate'], 'Bearer realm="api"')
+        invalid = await self.call(views.saved_photos_async, authorization='Bearer nonsense')
+        self.assertEqual((invalid.status_code, invalid.data['code']), (401, 'token_not_valid'))
+        post = await self.call(views.photo_feed_async, method='post')
+        self.assertEqual(post.status_code, 405)
+
+    async def test_cached_user_is_authenticated_without_a_query(self):
+        auth = authentication.CachedJWTAuthentication()
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=self.token)
+        user, _ = await auth.aauthenticate(request)
+        self.assertEqual(user.pk, self.user.pk)
+        with patch('core.authentication.fetch') as fetch:
+            user, _ = await auth.aauthenticate(request)
+        fetch.assert_not_called()
+        self.assertEqual(user.profile.pk, self.user.profile.pk)
+
+
 class PasswordResetTests(APITestCase):
     def setUp(self):
+        cache.clear()  # throttle counters
         self.client = APIClient()
         self.user = User.objects.create_user(
             username='testuser',
@@ -123,6 +1657,449 @@ class PasswordResetTests(APITestCase):
             password='TestPass123!'
         )
 
+    def request_reset(self, email):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('password_reset'), {'email': email})
+
+    @override_settings(OUTBOX_WORKERS=0)
+    def test_reset_email_is_sent_from_the_outbox(self):
+        response = self.request_reset('test@example.com')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertIn('/reset-password/', mail.outbox[0].body)
+        message = OutboxEmail.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxStatus.SENT, 1))
+        self.assertIsNotNone(message.sent_at)
+
+    @override_settings(OUTBOX_WORKERS=0)
+    def test_unknown_address_gets_the_same_response_and_no_email(self):
+        known = self.request_reset('test@example.com')
+        unknown = self.request_reset('nobody@example.com')
+        self.assertEqual(unknown.status_code, known.status_code)
+        self.assertEqual(unknown.json(), known.json())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboxEmail.objects.get(recipient='nobody@example.com').status, OutboxStatus.DISCARDED)
+
+    def test_request_does_not_send_or_look_up_the_user(self):
+        # Nothing runs before commit: one insert, whoever the address belongs to
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('password_reset'), {'email': 'test@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([q['sql'].split()[0] for q in queries], ['INSERT'])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_invalid_email_is_rejected(self):
+        response = self.client.post(reverse('password_reset'), {'email': 'not-an-email'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    @override_settings(OUTBOX_WORKERS=0, OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_DELAY=60)
+    def test_failed_sends_are_retried_with_backoff(self):
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('refused')), \
+                self.assertLogs('core.outbox', 'WARNING'):
+            self.request_reset('test@example.com')
+        message = OutboxEmail.objects.get()
+        self.assertEqual((message.status, message.attempts, message.error), (OutboxStatus.PENDING, 1, 'refused'))
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        # Not due yet
+        self.assertEqual(outbox.send_pending(), {})
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('refused')), \
+                self.assertLogs('core.outbox', 'WARNING'):
+            outbox.send_pending()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxStatus.FAILED, 2))
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(OUTBOX_BATCH_SIZE=2)
+    def test_batches_share_one_connection(self):
+        for _ in range(5):
+            outbox.queue_email(OutboxEmail.KIND_PASSWORD_RESET, 'test@example.com')
+        with patch('core.outbox.get_connection', wraps=outbox.get_connection) as get_connection:
+            outcomes = outbox.send_pending()
+        self.assertEqual(outcomes, {OutboxStatus.SENT: 5})
+        self.assertEqual(get_connection.call_count, 3)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_old_sent_and_discarded_messages_are_purged(self):
+        statuses = [OutboxStatus.SENT, OutboxStatus.DISCARDED, OutboxStatus.FAILED, OutboxStatus.PENDING, OutboxStatus.SENT]
+        messages = [
+            OutboxEmail.objects.create(kind=OutboxEmail.KIND_PASSWORD_RESET, recipient='test@example.com', status=s)
+            for s in statuses
+        ]
+        OutboxEmail.objects.exclude(pk=messages[-1].pk).update(created_at=timezone.now() - timedelta(days=8))
+
+        out = StringIO()
+        with override_settings(OUTBOX_RETENTION=7 * 24 * 60 * 60):
+            call_command('send_outbox', stdout=out)
+        self.assertIn('Purged 2 old emails', out.getvalue())
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list('pk', flat=True)), [m.pk for m in messages[2:]]
+        )
+
+    def test_claimed_messages_are_skipped_until_the_lease_ends(self):
+        outbox.queue_email(OutboxEmail.KIND_PASSWORD_RESET, 'test@example.com')
+        self.assertEqual(len(outbox.claim(10)), 1)
+        self.assertEqual(outbox.claim(10), [])
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(len(outbox.claim(10)), 1)
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_users.clear()
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get_profile(self):
+        response = self.client.get(reverse('current-user-profile'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_user_is_cached_between_requests(self):
+        # user with profile, posts count
+        with self.assertNumQueries(2):
+            self.get_profile()
+        # posts count only
+        with self.assertNumQueries(1):
+            response = self.get_profile()
+        self.assertEqual(response.data['username'], 'testuser')
+
+    def test_profile_update_and_password_change_invalidate(self):
+        self.get_profile()
+        response = self.client.patch(reverse('current-user-profile'), {'bio': 'Hello', 'username': 'renamed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.get_profile()
+        self.assertEqual((response.data['username'], response.data['bio']), ('renamed', 'Hello'))
+
+        response = self.client.post(reverse('change-password'), {
+            'current_password': 'TestPass123!', 'new_password': 'NewPass456!',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(2):
+            self.get_profile()
+        self.assertTrue(authentication.get_user(self.user.pk).check_password('NewPass456!'))
+
+    def test_writes_do_not_save_a_stale_cached_user(self):
+        self.get_profile()
+        # Changed by another worker whose invalidation this process has not seen
+        User.objects.filter(pk=self.user.pk).update(password=make_password('NewPass456!'))
+        Profile.objects.filter(user=self.user).update(followers_count=3)
+
+        response = self.client.patch(reverse('current-user-profile'), {'bio': 'Hello'})
+        self.assertEqual((response.status_code, response.data['followers_count']), (200, 3))
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        self.assertTrue(user.check_password('NewPass456!'))
+        self.assertEqual((user.profile.bio, user.profile.followers_count), ('Hello', 3))
+
+        # A password the cached copy still has no longer works
+        self.get_profile()
+        User.objects.filter(pk=self.user.pk).update(password=make_password('Third000!'))
+        response = self.client.post(reverse('change-password'), {
+            'current_password': 'NewPass456!', 'new_password': 'Other789!',
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_inactive_and_deleted_users_are_rejected(self):
+        self.get_profile()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('current-user-profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse('current-user-profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_each_request_gets_its_own_instances(self):
+        first = authentication.get_user(self.user.pk)
+        first.profile.bio = 'Changed in memory'
+        second = authentication.get_user(self.user.pk)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.profile.bio, '')
+        self.assertIs(second.profile.user, second)
+
+    @override_settings(AUTH_USER_SHARED_CACHE_ALIAS='default')
+    def test_shared_cache_tier(self):
+        self.get_profile()
+        authentication.local_users.clear()
+        with self.assertNumQueries(1):
+            self.get_profile()
+
+        Profile.objects.get(user=self.user).save()
+        self.assertIsNone(cache.get(authentication.user_key(self.user.pk)))
+
+
+# Stand-in for Redis in the throttling tests: nothing but atomic add/get/incr
+# with expiry, like the commands RedisCache maps them to. Django creates a cache
+# object per thread, so the values live outside it, as they would in Redis.
+_atomic_counter_values = {}
+_atomic_counter_lock = threading.Lock()
+
+
+class AtomicCounterCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.values = _atomic_counter_values.setdefault(location, {})
+        self.lock = _atomic_counter_lock
+
+    def get_live(self, key):
+        value, expires = self.values.get(key, (None, 0))
+        return value if expires > time.monotonic() else None
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        with self.lock:
+            if self.get_live(key) is not None:
+                return False
+            self.values[key] = (value, time.monotonic() + self.get_backend_timeout(timeout))
+            return True
+
+    def get(self, key, default=None, version=None):
+        with self.lock:
+            value = self.get_live(self.make_key(key, version))
+        return default if value is None else value
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        with self.lock:
+            value = self.get_live(key)
+            if value is None:
+                raise ValueError(f"Key '{key}' not found")
+            self.values[key] = (value + delta, self.values[key][1])
+            return value + delta
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+THROTTLE_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'throttle': {'BACKEND': 'core.tests.AtomicCounterCache', 'LOCATION': 'throttle'},
+}
+
+
+def throttle_rates(**rates):
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates}}
+
+
+@override_settings(CACHES=THROTTLE_CACHES, THROTTLE_CACHE_ALIAS='throttle')
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='TestPass123!')
+        self.client.force_authenticate(user=self.user)
+        self.photo = Photo.objects.create(user=self.user, caption='Test photo', image='test_image.jpg')
+
+    def like(self):
+        return self.client.put(reverse('photo-like', args=[self.photo.id]))
+
+    def test_limit_and_retry_after(self):
+        # Pinned clock, so the requests cannot straddle a window boundary
+        with override_settings(REST_FRAMEWORK=throttle_rates(toggle='5/min')), \
+                patch.object(SlidingWindowThrottle, 'timer', return_value=630.0):
+            for _ in range(5):
+                self.assertEqual(self.like().status_code, status.HTTP_200_OK)
+            # Turned away before the view, without touching the database
+            with self.assertNumQueries(0):
+                response = self.like()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+
+        # Other users have their own budget
+        other = User.objects.create_user(username='otheruser', password='TestPass123!')
+        self.client.force_authenticate(user=other)
+        with override_settings(REST_FRAMEWORK=throttle_rates(toggle='5/min')):
+            self.assertEqual(self.like().status_code, status.HTTP_200_OK)
+
+    def test_window_slides(self):
+        start = 600.0  # start of a one-minute window
+        with override_settings(REST_FRAMEWORK=throttle_rates(toggle='5/min')):
+            with patch.object(SlidingWindowThrottle, 'timer', return_value=start):
+                for _ in range(5):
+                    self.like()
+                response = self.like()
+                self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+                # Room for one 12s into the next window, where the 5 count as 4
+                self.assertEqual(response['Retry-After'], '72')
+            # Halfway through the next window the previous 5 count as 2.5
+            with patch.object(SlidingWindowThrottle, 'timer', return_value=start + 90):
+                statuses = [self.like().status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_password_reset_is_limited_per_ip_and_per_address(self):
+        self.client.force_authenticate(user=None)
+        attempts = [
+            ('10.0.0.1', 'test@example.com'),
+            ('10.0.0.2', 'test@example.com'),
+            ('10.0.0.3', 'test@example.com'),  # third email to the address, from a new IP
+            ('10.0.0.1', 'other@example.com'),
+            ('10.0.0.1', ' Other@Example.com'),  # the same address
+            ('10.0.0.1', 'third@example.com'),  # fourth request from the IP
+        ]
+        with override_settings(REST_FRAMEWORK=throttle_rates(password_reset='3/hour', password_reset_email='2/hour')):
+            statuses = [
+                self.client.post(reverse('password_reset'), {'email': email}, REMOTE_ADDR=address).status_code
+                for address, email in attempts
+            ]
+        self.assertEqual(statuses, [200, 200, 429, 200, 200, 429])
+        self.assertEqual(OutboxEmail.objects.filter(recipient='test@example.com').count(), 2)
+
+    def test_forwarded_for_is_only_trusted_behind_proxies(self):
+        self.client.force_authenticate(user=None)
+
+        def statuses(**rest_framework):
+            caches['throttle'].clear()
+            with override_settings(REST_FRAMEWORK={**throttle_rates(password_reset='2/hour'), **rest_framework}):
+                return [
+                    self.client.post(reverse('password_reset'), {'email': 'test@example.com'},
+                                     REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}').status_code
+                    for i in range(3)
+                ]
+
+        self.assertEqual(statuses(), [200, 200, 429])
+        self.assertEqual(statuses(NUM_PROXIES=1), [200, 200, 200])
+
+    def test_register_is_limited_per_ip(self):
+        self.client.force_authenticate(user=None)
+        with override_settings(REST_FRAMEWORK=throttle_rates(register='1/hour')):
+            response = self.client.post(reverse('register'), {
+                'username': 'newuser', 'email': 'new@example.com', 'password': 'TestPass123!',
+            })
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.client.post(reverse('register'), {
+                'username': 'newuser2', 'email': 'new2@example.com', 'password': 'TestPass123!',
+            })
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(User.objects.filter(username='newuser2').count(), 0)
+
+    def test_concurrent_requests_never_exceed_the_limit(self):
+        # 8 clients behind one IP race 400 requests against a limit of 100, on
+        # both cache backends
+        request = APIRequestFactory().post('/api/register/', REMOTE_ADDR='10.0.0.9')
+        for alias in ('default', 'throttle'):
+            caches[alias].clear()
+            allowed = []
+            with override_settings(THROTTLE_CACHE_ALIAS=alias, REST_FRAMEWORK=throttle_rates(register='100/hour')):
+                def client():
+                    for _ in range(50):
+                        allowed.append(RegisterThrottle().allow_request(request, None))
+
+                threads = [threading.Thread(target=client) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            self.assertEqual(sum(allowed), 100, alias)
+
+    def test_write_load_is_bounded(self):
+        # 200 back-to-back likes and unlikes reach the database only 20 times
+        with override_settings(REST_FRAMEWORK=throttle_rates(toggle='20/min')):
+            with CaptureQueriesContext(connection) as queries:
+                statuses = [self.client.post(reverse('like-toggle', args=[self.photo.id])).status_code for _ in range(200)]
+        self.assertEqual(statuses.count(status.HTTP_200_OK), 20)
+        self.assertEqual(statuses.count(status.HTTP_429_TOO_MANY_REQUESTS), 180)
+        # The same as 20 unthrottled toggles
+        with override_settings(REST_FRAMEWORK=throttle_rates(toggle=None)):
+            with CaptureQueriesContext(connection) as unthrottled:
+                for _ in range(20):
+                    self.client.post(reverse('like-toggle', args=[self.photo.id]))
+        self.assertEqual(len(queries), len(unthrottled))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def route(self, method, write=False):
+        # Where a view's reads go before and after it writes
+        @routers.replica_reads
+        def view(request):
+            before = router.db_for_read(Photo)
+            if write:
+                router.db_for_write(Like)
+            return before, router.db_for_read(Photo)
+        return view(getattr(RequestFactory(), method)('/api/photos/'))
+
+    def test_safe_requests_read_from_a_replica(self):
+        before, after = self.route('get')
+        self.assertIn(before, ['replica1', 'replica2'])
+        self.assertEqual(after, before)
+        self.assertEqual(router.db_for_read(Photo), 'default')
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        self.assertEqual(self.route('get', write=True)[1], 'default')
+        # Nothing carries over to the next request
+        self.assertIn(self.route('get')[0], ['replica1', 'replica2'])
+
+    def test_unsafe_requests_read_from_the_primary(self):
+        self.assertEqual(self.route('post'), ('default', 'default'))
+
+    def test_no_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.route('get'), ('default', 'default'))
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(router.allow_migrate('default', 'core'))
+        self.assertFalse(router.allow_migrate('replica1', 'core'))
+
+
+# Outside a test transaction, so reads are not pinned to the primary by it
+@override_settings(TIMELINE_WORKERS=0)
+class ReplicaRoutingViewTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='TestPass123!')
+        self.photo = Photo.objects.create(user=self.user, image='test_image.jpg', caption='Caption')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def routed_reads(self, request):
+        # Where the request's reads are routed, with the primary standing in as
+        # the replica (not for the whole test, or the flush after it skips it)
+        replicas = []
+        get_replica = routers.get_replica
+
+        def record():
+            replicas.append(get_replica())
+            return replicas[-1]
+
+        with patch('core.routers.get_replica', record), override_settings(DATABASE_REPLICAS=['default']):
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return replicas
+
+    def test_read_views_use_the_replica(self):
+        Bookmark.objects.create(user=self.user, photo=self.photo)
+        for url in (reverse('photo-feed'), reverse('photo-detail', args=[self.photo.pk]), reverse('saved-photos')):
+            # Once the photo's fragment is cached; rendering it reads from the primary
+            self.client.get(url)
+            self.assertEqual(set(self.routed_reads(lambda: self.client.get(url))), {'default'})
+
+    def test_cached_responses_are_read_from_the_primary(self):
+        self.client.force_authenticate(user=None)
+        for url in (reverse('photo-feed'), reverse('photo-detail', args=[self.photo.pk])):
+            # Right after a write to the photo
+            cache.clear()
+            caching.photo_fragments.clear()
+            caching.bump_version(caching.photo_namespace(self.photo.pk))
+            self.assertEqual(set(self.routed_reads(lambda: self.client.get(url))), {None})
+
+    def test_writes_read_from_the_primary(self):
+        reads = self.routed_reads(lambda: self.client.put(reverse('photo-like', args=[self.photo.pk])))
+        self.assertEqual(set(reads), {None})
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_reads_in_a_transaction_use_the_primary(self):
+        @routers.replica_reads
+        def view(request):
+            with transaction.atomic():
+                inside = router.db_for_read(Photo)
+            return inside, router.db_for_read(Photo)
+        self.assertEqual(view(RequestFactory().get('/api/photos/')), ('default', 'replica1'))
+
+
 class ProfileTests(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -0,0 +1,116 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+# Request throttling for writes and unauthenticated endpoints.
+#
+# Each throttle counts requests in fixed windows of the rate's period with the
+# cache's atomic add/incr, and estimates the count over the sliding window that
+# ends now as the current window's count plus the previous window's count scaled
+# by how much of it still overlaps. That takes two cache keys per client and
+# scope however high the rate, and behaves the same on local memory and on Redis,
+# where incr is a single INCR. Rejected requests are taken back off the count, so
+# a client that keeps retrying is let in again once its earlier requests age out.
+#
+# Rates are configured per scope in REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]; the
+# counters live in the THROTTLE_CACHE_ALIAS cache. A throttled request gets a 429
+# with Retry-After before the view runs, so it never reaches the database.
+
+# Per client IP unless a subclass identifies clients by something else
+class SlidingWindowThrottle(SimpleRateThrottle):
+    def get_rate(self):
+        # Read at request time, unlike SimpleRateThrottle, so settings overrides apply
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_ident_key(self, request):
+        return f"ip:{self.get_ident(request)}"
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return None
+        return f"throttle:{self.scope}:{ident}"
+
+    def allow_request(self, request, view):
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        now = self.timer()
+        window = int(now // self.duration)
+        current_key = f"{self.key}:{window}"
+        # Kept for two periods, so it can serve as the previous window next period
+        if not cache.add(current_key, 1, timeout=2 * self.duration):
+            count = cache.incr(current_key)
+        else:
+            count = 1
+        self.previous = cache.get(f"{self.key}:{window - 1}", 0)
+        self.elapsed = now - window * self.duration
+
+        if self.previous * (1 - self.elapsed / self.duration) + count <= self.num_requests:
+            return True
+        try:
+            self.current = cache.decr(current_key)
+        except ValueError:  # expired in between
+            self.current = count - 1
+        return False
+
+    def wait(self):
+        # Seconds until the estimate leaves room for one more request, assuming no
+        # other requests arrive in the meantime
+        room = self.num_requests - 1
+        if self.current <= room and self.previous > 0:
+            # Within this window, once enough of the previous one has slid out
+            wait = self.duration * (1 - (room - self.current) / self.previous) - self.elapsed
+            if self.elapsed + wait <= self.duration:
+                return max(wait, 0)
+        # In the next window, with this window's count as the previous one
+        overlap = self.duration * (1 - room / self.current) if self.current > 0 else 0
+        return self.duration - self.elapsed + max(overlap, 0)
+
+
+# Per user when authenticated, per client IP otherwise
+class UserOrIPThrottle(SlidingWindowThrottle):
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return super().get_ident_key(request)
+
+
+# Like, save and follow toggles
+class ToggleThrottle(UserOrIPThrottle):
+    scope = "toggle"
+
+
+class CommentThrottle(UserOrIPThrottle):
+    scope = "comment"
+
+
+class RegisterThrottle(SlidingWindowThrottle):
+    scope = "register"
+
+
+class PasswordResetThrottle(SlidingWindowThrottle):
+    scope = "password_reset"
+
+
+# Reset emails sent to one address, from whatever IPs they are asked for, so an
+# inbox cannot be flooded by rotating addresses; PasswordResetThrottle limits
+# each IP on its own
+class PasswordResetEmailThrottle(SlidingWindowThrottle):
+    scope = "password_reset_email"
+
+    def get_ident_key(self, request):
+        email = request.data.get("email")
+        if not isinstance(email, str) or not email:
+            return None
+        return f"email:{hashlib.sha256(email.strip().lower().encode()).hexdigest()}"
@@ -0,0 +1,221 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+
+from .models import Follow, Photo, Profile
+
+logger = logging.getLogger(__name__)
+
+
+# Home timelines.
+#
+# Fan-out on write: when a photo becomes visible its id is pushed into the
+# timeline of its author and of every follower, so reading a home feed is a
+# slice of one cached list plus a primary-key lookup of that page of photos.
+# Each timeline is a list of [photo_id, author_id] pairs, newest first, capped
+# at TIMELINE_SIZE and kept in the TIMELINE_CACHE_ALIAS cache for
+# TIMELINE_CACHE_TIMEOUT seconds; a timeline that is missing (new user,
+# evicted, expired) is rebuilt from the database on first read. With no
+# timeline cache configured nothing is fanned out and every read is a rebuild.
+#
+# Authors with more than TIMELINE_FANOUT_LIMIT followers are not fanned out;
+# their followers pull their recent photos at read time instead and merge them
+# in, which keeps one popular upload from writing millions of timelines.
+
+def get_cache():
+    alias = settings.TIMELINE_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def timeline_key(user_id):
+    return f"timeline:{user_id}"
+
+
+@contextmanager
+def locked(user_id):
+    # Serializes read-modify-write updates of one timeline across processes.
+    # cache.add is atomic; the lock expires on its own if a holder dies.
+    cache = get_cache()
+    lock = f"{timeline_key(user_id)}:lock"
+    for _ in range(100):
+        acquired = cache.add(lock, 1, timeout=5)
+        if acquired:
+            break
+        time.sleep(0.01)
+    else:
+        logger.warning("Timeline lock for user %s not acquired, updating anyway", user_id)
+    try:
+        yield
+    finally:
+        # Never release a lock that another process holds
+        if acquired:
+            cache.delete(lock)
+
+
+def pulled_authors(user_id):
+    # Followees whose photos are read at request time instead of fanned out
+    return list(
+        Follow.objects.filter(follower_id=user_id, followee__profile__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT)
+        .values_list("followee_id", flat=True)
+    )
+
+
+def rebuild(user_id):
+    # Newest photos of the user and of their fanned-out followees
+    followees = Follow.objects.filter(
+        follower_id=user_id, followee__profile__followers_count__lte=settings.TIMELINE_FANOUT_LIMIT
+    ).values("followee_id")
+    photos = (
+        Photo.objects.visible()
+        .filter(Q(user_id=user_id) | Q(user_id__in=followees))
+        .order_by("-id")
+        .values_list("pk", "user_id")[:settings.TIMELINE_SIZE]
+    )
+    entries = [list(entry) for entry in photos]
+    cache = get_cache()
+    if cache is not None:
+        cache.set(timeline_key(user_id), entries, timeout=settings.TIMELINE_CACHE_TIMEOUT)
+    return entries
+
+
+def get_entries(user_id):
+    cache = get_cache()
+    entries = cache.get(timeline_key(user_id)) if cache is not None else None
+    if entries is None:
+        entries = rebuild(user_id)
+    return entries
+
+
+def read(user_id, before=None, limit=20):
+    # Up to limit photo ids older than before, newest first
+    entries = get_entries(user_id)
+    # Entries are in descending id order; find the first one below before
+    start = 0
+    if before is not None:
+        start = bisect.bisect_left(entries, -before, key=lambda entry: -entry[0])
+        if start < len(entries) and entries[start][0] == before:
+            start += 1
+    ids = [photo_id for photo_id, _ in entries[start:start + limit]]
+
+    authors = pulled_authors(user_id)
+    if authors:
+        pulled = Photo.objects.visible().filter(user_id__in=authors)
+        if before is not None:
+            pulled = pulled.filter(pk__lt=before)
+        pulled_ids = list(pulled.order_by("-id").values_list("pk", flat=True)[:limit])
+        # An author who crossed the limit lately is both fanned out and pulled
+        merged = dict.fromkeys(heapq.merge(ids, pulled_ids, reverse=True))
+        ids = list(merged)[:limit]
+    return ids
+
+
+def insert(user_id, photo_id, author_id):
+    # Adds one photo to a timeline, keeping it sorted and capped; a timeline
+    # that is not cached is left to be rebuilt on its next read
+    cache = get_cache()
+    if cache is None:
+        return
+    key = timeline_key(user_id)
+    with locked(user_id):
+        entries = cache.get(key)
+        if entries is None:
+            return
+        position = bisect.bisect_left(entries, -photo_id, key=lambda entry: -entry[0])
+        if position < len(entries) and entries[position][0] == photo_id:
+            return
+        entries.insert(position, [photo_id, author_id])
+        cache.set(key, entries[:settings.TIMELINE_SIZE], timeout=settings.TIMELINE_CACHE_TIMEOUT)
+
+
+def fan_out(photo_id, author_id):
+    # Pushes a photo to its author and, unless they are pulled at read time,
+    # to every follower of the author
+    insert(author_id, photo_id, author_id)
+    if Profile.objects.filter(user_id=author_id, followers_count__gt=settings.TIMELINE_FANOUT_LIMIT).exists():
+        return
+    followers = Follow.objects.filter(followee_id=author_id).values_list("follower_id", flat=True)
+    for follower_id in followers.iterator():
+        insert(follower_id, photo_id, author_id)
+
+
+def follow(user_id, followee_id):
+    # Merges the newest photos of a newly followed user into the timeline
+    cache = get_cache()
+    if cache is None:
+        return
+    key = timeline_key(user_id)
+    with locked(user_id):
+        entries = cache.get(key)
+        if entries is None:
+            return
+        photos = (
+            Photo.objects.visible().filter(user_id=followee_id).order_by("-id")
+            .values_list("pk", "user_id")[:settings.TIMELINE_SIZE]
+        )
+        known = {photo_id for photo_id, _ in entries}
+        added = [list(entry) for entry in photos if entry[0] not in known]
+        entries = list(heapq.merge(entries, added, key=lambda entry: -entry[0]))
+        cache.set(key, entries[:settings.TIMELINE_SIZE], timeout=settings.TIMELINE_CACHE_TIMEOUT)
+
+
+def unfollow(user_id, followee_id):
+    # Drops the photos of an unfollowed user from the timeline
+    cache = get_cache()
+    if cache is None:
+        return
+    key = timeline_key(user_id)
+    with locked(user_id):
+        entries = cache.get(key)
+        if entries is None:
+            return
+        cache.set(
+            key, [entry for entry in entries if entry[1] != followee_id], timeout=settings.TIMELINE_CACHE_TIMEOUT
+        )
+
+
+def run_fan_out(photo_id, author_id):
+    # Entry point for pool threads, which need their own DB connection
+    close_old_connections()
+    try:
+        fan_out(photo_id, author_id)
+    except Exception:
+        logger.exception("Fan-out of photo %s failed", photo_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.TIMELINE_WORKERS, thread_name_prefix="timeline")
+        return _executor
+
+
+def enqueue_fan_out(photo):
+    # Runs after commit so followers' feeds never reference an uncommitted photo.
+    # Without a timeline cache there is nothing to fan out into.
+    if get_cache() is None:
+        return
+    photo_id, author_id = photo.pk, photo.user_id
+
+    def submit():
+        if settings.TIMELINE_WORKERS == 0:
+            fan_out(photo_id, author_id)
+        else:
+            get_executor().submit(run_fan_out, photo_id, author_id)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,56 @@
+import math
+import time
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Exp, Greatest
+
+from .models import Photo
+
+
+# Trending scores.
+#
+# A photo's score is the sum of its likes and comments, each weighted and
+# decayed exponentially by age with a half-life of TRENDING_HALF_LIFE seconds.
+# Photo.trending_score holds that sum as of Photo.trending_at (unix seconds).
+# Every like or comment decays the stored score to now and adds its weight in
+# a single UPDATE, so no history is ever re-read. The decay_trending_scores
+# command periodically decays every score to the same moment, which keeps the
+# scores of photos nobody touches comparable with freshly updated ones; between
+# runs the ordering can lag by at most the run interval.
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+
+# Scores decayed below this are zeroed and drop out of the trending listing
+MIN_SCORE = 0.01
+
+
+def decay_rate():
+    # Per-second exponent, so that weight * exp(-age * rate) halves every half-life
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def decayed_score(now):
+    # trending_score carried forward from trending_at to now. Updates must set
+    # trending_score before trending_at: MySQL evaluates SET clauses in order.
+    return F("trending_score") * Exp((F("trending_at") - Value(now)) * Value(decay_rate()))
+
+
+def add(photo_id, weight, created_at=None):
+    # Adds an interaction to a photo's score. Removing one passes a negative
+    # weight and its creation time, so only what is left of it is taken off.
+    now = time.time()
+    if created_at is not None:
+        weight *= math.exp(-(now - created_at.timestamp()) * decay_rate())
+    Photo.objects.filter(pk=photo_id).update(
+        trending_score=Greatest(decayed_score(now) + Value(weight), Value(0.0)),
+        trending_at=Value(now),
+    )
+
+
+def decay(queryset, now=None):
+    # Decays the scores of queryset's photos to now; returns how many changed
+    now = time.time() if now is None else now
+    updated = queryset.filter(trending_score__gt=0).update(trending_score=decayed_score(now), trending_at=Value(now))
+    queryset.filter(trending_score__gt=0, trending_score__lt=MIN_SCORE).update(trending_score=0.0)
+    return updated
@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cloudinary.uploader
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from . import imaging
+from .models import ImageAsset, Photo, PhotoVariant, UploadJob, UploadStatus
+
+logger = logging.getLogger(__name__)
+
+
+# Upload pipeline.
+#
+# Views only write the incoming file to UPLOAD_STAGING_DIR and record an
+# UploadJob, so the request returns as soon as the bytes are on local disk. Once
+# the transaction commits, the job goes to a thread pool that pushes the file to
+# the storage backend (retrying with exponential backoff), attaches the result to
+# the photo or profile and deletes the staged file. Photos are also measured and
+# rendered into PhotoVariant derivatives (core/imaging.py) that are stored
+# alongside the original. Staged files are hashed as they are written, and a
+# photo whose bytes were already stored reuses that photo's image and variants
+# without touching storage at all. With UPLOAD_WORKERS = 0 jobs
+# run inline, which is what the tests use. Jobs left unfinished by a restart are
+# picked up again by "manage.py process_uploads".
+
+
+# Storage backends: store(path) returns the value to put in the CloudinaryField,
+# url(stored) the address it is served from
+class CloudinaryUploadStorage:
+    def store(self, path):
+        return cloudinary.uploader.upload_resource(path, type="upload", resource_type="image")
+
+    def url(self, stored):
+        return stored.build_url(secure=True)
+
+
+# Offline stand-in that copies files under MEDIA_ROOT instead of uploading them
+class LocalUploadStorage:
+    def store(self, path):
+        directory = Path(settings.UPLOAD_LOCAL_STORAGE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, directory / Path(path).name)
+        return Path(os.path.relpath(directory / Path(path).name, settings.MEDIA_ROOT)).as_posix()
+
+    def url(self, stored):
+        return f"{settings.MEDIA_URL}{stored}"
+
+
+def get_storage():
+    return import_string(settings.UPLOAD_STORAGE_BACKEND)()
+
+
+def staged_file_path(filename):
+    # New, unique path in the staging directory keeping filename's extension
+    directory = Path(settings.UPLOAD_STAGING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{uuid.uuid4().hex}{Path(filename).suffix.lower()}"
+
+
+def stage_file(uploaded_file):
+    # Streams the upload to disk chunk by chunk, hashing it on the way, and
+    # returns the staged path and the SHA-256 of its contents
+    path = staged_file_path(uploaded_file.name)
+    digest = hashlib.sha256()
+    with open(path, "wb") as destination:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            destination.write(chunk)
+    return str(path), digest.hexdigest()
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+# Read size for request bodies streamed to disk; a chunk is never held in memory whole
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def write_chunk(path, stream, length):
+    # Copies length bytes of stream into a new part file next to the staged file
+    # at path and returns the part's path, how many bytes arrived and their
+    # SHA-256 digest. append_chunk() adds an accepted part to the staged file;
+    # either way the caller removes the part with discard_staged_file().
+    part = f"{path}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    written = 0
+    with open(part, "wb") as destination:
+        while written < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            digest.update(block)
+            destination.write(block)
+            written += len(block)
+    return part, written, digest.digest()
+
+
+def append_chunk(path, part, offset):
+    # Writes a part received by write_chunk() into the staged file at offset
+    with open(part, "rb") as source, open(path, "r+b") as destination:
+        destination.seek(offset)
+        shutil.copyfileobj(source, destination, STREAM_BLOCK_SIZE)
+        destination.truncate()
+
+
+def discard_staged_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def process_upload(job_id):
+    job = UploadJob.objects.select_related("photo", "user__profile").get(pk=job_id)
+    if job.status != UploadStatus.PROCESSING:
+        return job
+
+    metadata = {}
+    variants = []
+    if job.kind == UploadJob.KIND_PHOTO:
+        if not job.sha256:
+            # Staged before uploads were hashed
+            job.sha256 = hash_file(job.staged_path)
+        original = find_duplicate(job)
+        if original is not None:
+            reuse_upload(job, original)
+            return job
+
+        try:
+            metadata = imaging.prepare_image(job.staged_path)
+            variants = metadata.pop("variants")
+            phash = metadata.pop("phash")
+        except imaging.InvalidImage as e:
+            # Retrying will not make the file decodable
+            job.attempts += 1
+            job.error = str(e)
+            fail_upload(job)
+            return job
+
+    storage = get_storage()
+    while True:
+        job.attempts += 1
+        try:
+            stored = storage.store(job.staged_path)
+            stored_variants = [(variant, storage.url(storage.store(variant["path"]))) for variant in variants]
+            break
+        except Exception as e:
+            logger.warning("Upload %s attempt %s failed: %s", job.pk, job.attempts, e)
+            job.error = str(e)
+            if job.attempts >= settings.UPLOAD_MAX_ATTEMPTS:
+                fail_upload(job, variants)
+                return job
+            job.save(update_fields=["attempts", "error", "updated_at"])
+            time.sleep(settings.UPLOAD_RETRY_DELAY * 2 ** (job.attempts - 1))
+
+    with transaction.atomic():
+        if job.kind == UploadJob.KIND_PHOTO:
+            # A concurrent upload of the same bytes may have created the asset first.
+            # One left without photos (by a delete racing its last one) takes the
+            # image just stored, as its own may be gone from storage.
+            fields = {"phash": phash, "image": stored, "size": os.path.getsize(job.staged_path)}
+            asset, created = ImageAsset.objects.select_for_update().get_or_create(sha256=job.sha256, defaults=fields)
+            if not created and not asset.photos.exists():
+                for field, value in fields.items():
+                    setattr(asset, field, value)
+                asset.save(update_fields=list(fields))
+            variant_fields = [
+                {**{field: variant[field] for field in ("name", "format", "width", "height", "size")}, "url": url}
+                for variant, url in stored_variants
+            ]
+            attach_photo_image(job.photo, {**metadata, "image": stored, "asset": asset}, variant_fields)
+        else:
+            profile = job.user.profile
+            profile.profile_photo = stored
+            profile.save(update_fields=["profile_photo"])
+        finish_upload(job)
+
+    discard_staged_files(job, variants)
+    return job
+
+
+# Photo fields copied from an earlier photo of the same image
+REUSED_PHOTO_FIELDS = ("image", "asset", "width", "height", "dominant_color", "blurhash")
+
+
+def find_duplicate(job):
+    # A ready photo whose stored original has exactly the staged bytes
+    return (
+        Photo.objects.filter(asset__sha256=job.sha256, status=UploadStatus.READY)
+        .exclude(pk=job.photo_id)
+        .prefetch_related("variants")
+        .order_by("pk")
+        .first()
+    )
+
+
+def reuse_upload(job, original):
+    variant_fields = [
+        {field: getattr(variant, field) for field in ("name", "format", "url", "width", "height", "size")}
+        for variant in original.variants.all()
+    ]
+    with transaction.atomic():
+        attach_photo_image(
+            job.photo, {field: getattr(original, field) for field in REUSED_PHOTO_FIELDS}, variant_fields
+        )
+        finish_upload(job)
+    logger.info("Upload %s reused the image of photo %s", job.pk, original.pk)
+    discard_staged_file(job.staged_path)
+
+
+def attach_photo_image(photo, fields, variant_fields):
+    photo.variants.all().delete()
+    PhotoVariant.objects.bulk_create([PhotoVariant(photo=photo, **variant) for variant in variant_fields])
+    for field, value in fields.items():
+        setattr(photo, field, value)
+    photo.status = UploadStatus.READY
+    photo.save(update_fields=["status", *fields])
+
+
+def finish_upload(job):
+    job.status = UploadStatus.READY
+    job.error = ""
+    job.save(update_fields=["status", "attempts", "error", "sha256", "updated_at"])
+
+
+def fail_upload(job, variants=()):
+    with transaction.atomic():
+        job.status = UploadStatus.FAILED
+        job.save(update_fields=["status", "attempts", "error", "updated_at"])
+        if job.photo is not None:
+            job.photo.status = UploadStatus.FAILED
+            job.photo.save(update_fields=["status"])
+    discard_staged_files(job, variants)
+
+
+def discard_staged_files(job, variants):
+    discard_staged_file(job.staged_path)
+    for variant in variants:
+        discard_staged_file(variant["path"])
+
+
+def run_upload(job_id):
+    # Entry point for pool threads, which need their own DB connection
+    close_old_connections()
+    try:
+        process_upload(job_id)
+    except Exception:
+        logger.exception("Upload %s crashed", job_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_WORKERS, thread_name_prefix="upload")
+        return _executor
+
+
+def enqueue(job):
+    # Runs after commit so the worker is guaranteed to see the job and its photo
+    def submit():
+        if settings.UPLOAD_WORKERS == 0:
+            process_upload(job.pk)
+        else:
+            get_executor().submit(run_upload, job.pk)
+
+    transaction.on_commit(submit)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     delete_profile_photo,
@@ -5,12 +6,30 @@ from .views import (
     photo_list_create,
     photo_detail,
     comment_create,
+    photo_comments,
     comment_delete,
     like_toggle,
+    photo_like,
+    photo_likers,
     photo_update_delete, current_user_profile, password_reset_request, password_reset_confirm, photo_feed, change_password,
     save_toggle,
+    photo_save,
     saved_photos,
+    cache_stats,
     update_profile_photo,
+    upload_status,
+    chunked_upload_create,
+    chunked_upload_detail,
+    chunked_upload_finalize,
+    home_feed,
+    trending_photos,
+    photo_search,
+    tag_photos,
+    photo_batch,
+    user_follow,
+    photo_feed_async,
+    photo_detail_async,
+    saved_photos_async,
 )
 
 urlpatterns = [
@@ -19,18 +38,27 @@ urlpatterns = [
     path('password-reset-confirm/<uidb64>/<token>/', password_reset_confirm, name='password_reset_confirm'),
     path('password-reset/', password_reset_request, name='password_reset'),
     
-    # photos
+    # photos (async versions of the hottest reads under ASYNC_READ_VIEWS; they
+    # only pay off under ASGI)
     path("photos/", photo_list_create, name="photo-list-create"),
-    path("photos/feed/", photo_feed, name="photo-feed"),
-    path("photos/<int:pk>/", photo_detail, name="photo-detail"),
+    path("photos/feed/", photo_feed_async if settings.ASYNC_READ_VIEWS else photo_feed, name="photo-feed"),
+    path("photos/home/", home_feed, name="home-feed"),
+    path("photos/trending/", trending_photos, name="trending-photos"),
+    path("photos/search/", photo_search, name="photo-search"),
+    path("photos/batch/", photo_batch, name="photo-batch"),
+    path("tags/<str:name>/", tag_photos, name="tag-photos"),
+    path("photos/<int:pk>/", photo_detail_async if settings.ASYNC_READ_VIEWS else photo_detail, name="photo-detail"),
     path("photos/<int:pk>/edit/", photo_update_delete, name="photo-update-delete"),
     
     # comments
+    path("photos/<int:photo_id>/comments/", photo_comments, name="photo-comments"),
     path("comments/", comment_create, name="comment-create"),
     path("comments/<int:pk>/", comment_delete, name="comment-delete"),
     
     # likes
     path("photos/<int:photo_id>/like-toggle/", like_toggle, name="like-toggle"),
+    path("photos/<int:photo_id>/like/", photo_like, name="photo-like"),
+    path("photos/<int:photo_id>/likes/", photo_likers, name="photo-likers"),
     
     # profile
     path('profile/me/', current_user_profile, name="current-user-profile"), 
@@ -38,7 +66,20 @@ urlpatterns = [
     path('profile/update-photo/', update_profile_photo, name='update_profile_photo'),
     path('profile/delete-photo/', delete_profile_photo, name='delete_profile_photo'),
 
+    # follows
+    path("users/<int:user_id>/follow/", user_follow, name="user-follow"),
+
+    # uploads
+    path("uploads/<int:pk>/", upload_status, name="upload-status"),
+    path("uploads/chunked/", chunked_upload_create, name="chunked-upload-create"),
+    path("uploads/chunked/<int:pk>/", chunked_upload_detail, name="chunked-upload-detail"),
+    path("uploads/chunked/<int:pk>/finalize/", chunked_upload_finalize, name="chunked-upload-finalize"),
+
     # bookmarks
     path("photos/<int:photo_id>/save-toggle/", save_toggle, name="save-toggle"),
-    path("photos/saved/", saved_photos, name="saved-photos"),
+    path("photos/<int:photo_id>/save/", photo_save, name="photo-save"),
+    path("photos/saved/", saved_photos_async if settings.ASYNC_READ_VIEWS else saved_photos, name="saved-photos"),
+
+    # monitoring
+    path("cache/stats/", cache_stats, name="cache-stats"),
 ]
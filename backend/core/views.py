@@ -1,22 +1,37 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
+import base64
+import binascii
+
+from asgiref.sync import sync_to_async
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.pagination import LimitOffsetPagination
 from django.contrib.auth.models import User
-from .models import Bookmark, Photo, Comment, Like
-from .serializers import ProfileSerializer, UserSerializer, PhotoSerializer, CommentSerializer, UserProfileSerializer
-from django.db.models import Count
+from .models import Bookmark, Follow, OutboxEmail, Photo, Profile, Comment, Like, Tag, UploadJob, UploadSession, UploadStatus
+from .pagination import IdListPagination, KeysetPagination
+from .async_api import async_api_view
+from .routers import replica_reads
+from . import authentication, caching, outbox, search, tags, timeline, trending, uploads
+from .throttling import CommentThrottle, PasswordResetEmailThrottle, PasswordResetThrottle, RegisterThrottle, ToggleThrottle
+from .serializers import ProfileSerializer, UserSerializer, PhotoSerializer, CommentSerializer, LikeSerializer, UploadJobSerializer, UploadSessionSerializer, UserProfileSerializer, aserialize_cached_page, aserialize_photos, serialize_cached_page, serialize_photos
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.encoding import force_bytes, force_str
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.core.mail import send_mail
+from django.utils import timezone
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 from django.conf import settings
 from django.http import JsonResponse
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 
 # Register user
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterThrottle])
 def register_user(request):
     serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
@@ -25,17 +40,104 @@ def register_user(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Phot Feed with pagination
+# Uses keyset pagination on (created_at, id) by default; clients that still send
+# ?offset= get the old limit/offset pages.
+# Anonymous pages are served from the response cache.
+@replica_reads
+@vary_on_headers('Authorization')
+@condition(etag_func=caching.feed_etag, last_modified_func=caching.feed_last_modified)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def photo_feed(request):
-    photos = Photo.objects.all().order_by('-created_at')
-    paginator = LimitOffsetPagination()
-    paginated_photos = paginator.paginate_queryset(photos, request)
-    serializer = PhotoSerializer(paginated_photos, many=True)
-    return paginator.get_paginated_response(serializer.data)
+    cache_key, data = get_cached_feed(request)
+    if data is not None:
+        return Response(serialize_cached_page(data, request), headers={'X-Cache': 'HIT'})
 
+    photos, paginator = feed_photos(request, cache_key)
+    return feed_response(request, paginator, paginator.paginate_queryset(photos, request), cache_key)
+
+
+# photo_feed as an async view, served instead of it when ASYNC_READ_VIEWS is set
+@replica_reads
+@vary_on_headers('Authorization')
+@caching.async_condition(caching.feed_state)
+@async_api_view
+@permission_classes([AllowAny])
+async def photo_feed_async(request):
+    cache_key, data = await aget_cached_feed(request)
+    if data is not None:
+        return Response(await aserialize_cached_page(data, request), headers={'X-Cache': 'HIT'})
+
+    photos, paginator = feed_photos(request, cache_key)
+    if isinstance(paginator, KeysetPagination):
+        paginated_photos = await paginator.apaginate_queryset(photos, request)
+    else:
+        # Counts the rows, in a thread; the async ORM has no such paginator
+        paginated_photos = await sync_to_async(paginator.paginate_queryset)(photos, request)
+    return await afeed_response(request, paginator, paginated_photos, cache_key)
+
+
+# Parts of photo_feed shared with photo_feed_async, which runs the ones that
+# touch the cache or the database in a thread
+
+def get_cached_feed(request):
+    # The cache key and cached page of an anonymous request, (None, None) when
+    # the response is not cached
+    if not request.user.is_anonymous:
+        return None, None
+    return caching.get_cached_feed(request)
+
+
+def feed_photos(request, cache_key):
+    # The feed's photos and their paginator: keyset pagination on (created_at, id),
+    # limit/offset for clients that still send ?offset=. A page that is going to
+    # be cached is read from the primary (see core/routers.py).
+    photos = Photo.objects.visible().with_owner().with_viewer_state(request.user).order_by('-created_at', '-id')
+    if cache_key:
+        photos = photos.using(DEFAULT_DB_ALIAS)
+    paginator = LimitOffsetPagination() if 'offset' in request.query_params else KeysetPagination()
+    return photos, paginator
+
+
+def feed_response(request, paginator, photos, cache_key):
+    # Renders a page of the feed and caches it under cache_key, if any
+    response = paginator.get_paginated_response(serialize_photos(photos, request))
+    if cache_key:
+        caching.set_validators(response, caching.set_cached_feed(cache_key, response.data))
+        response['X-Cache'] = 'MISS'
+    return response
+
+
+aget_cached_feed = sync_to_async(get_cached_feed)
+afeed_response = sync_to_async(feed_response)
+
+
+# Home timeline: photos of the user and of everyone they follow, newest first.
+# The page of ids comes from the user's precomputed timeline (core/timeline.py),
+# the photos themselves from one primary-key lookup.
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def home_feed(request):
+    paginator = IdListPagination()
+    ids = paginator.paginate_ids(
+        lambda before, limit: timeline.read(request.user.pk, before, limit), request
+    )
+    photos = Photo.objects.visible().with_owner().with_viewer_state(request.user).in_bulk(ids)
+    ordered = [photos[pk] for pk in ids if pk in photos]
+    return paginator.get_paginated_response(serialize_photos(ordered, request))
+
+
+# Keyset orderings for photo_list_create's sort_by parameter
+PHOTO_LIST_ORDERINGS = {
+    'recent': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'popular': ('-like_count', '-created_at', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
 
 # Photo feed with filtering and sorting and post creation
+@replica_reads
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def photo_list_create(request):
@@ -43,42 +145,183 @@ def photo_list_create(request):
         user_id = request.GET.get('user_id')
         sort_by = request.GET.get('sort_by', 'recent')  
 
+        photos = Photo.objects.visible().with_owner().with_viewer_state(request.user)
         if user_id:
-            photos = Photo.objects.filter(user__id=user_id)
-        else:
-            photos = Photo.objects.all()
+            photos = photos.filter(user__id=user_id)
 
-        # Sorting logic
-        if sort_by == 'recent':
-            photos = photos.order_by('-created_at')
-        elif sort_by == 'oldest':
-            photos = photos.order_by('created_at')
-        elif sort_by == 'popular':
-            photos = photos.annotate(like_count=Count('likes')).order_by('-like_count', '-created_at')
-
-        serializer = PhotoSerializer(photos, many=True)
-        return Response(serializer.data)
+        # Sorting logic, each ordering is backed by an index on Photo
+        ordering = PHOTO_LIST_ORDERINGS.get(sort_by, PHOTO_LIST_ORDERINGS['recent'])
+        paginator = KeysetPagination(ordering=ordering)
+        paginated_photos = paginator.paginate_queryset(photos, request)
+        return paginator.get_paginated_response(serialize_photos(paginated_photos, request))
 
     elif request.method == 'POST':
-        serializer = PhotoSerializer(data=request.data)
-        if serializer.is_valid():
+        serializer = PhotoSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # An image given as a Cloudinary URL/public id is saved as is. An uploaded
+        # file is staged and handed to the upload pipeline, and the photo stays
+        # in "processing" until it has been stored. Photo.image may only be blank
+        # while the pipeline is storing the file.
+        if 'image' not in request.FILES:
+            image = request.data.get('image')
+            if not isinstance(image, str) or not image.strip():
+                return Response({"image": ["This field is required."]}, status=status.HTTP_400_BAD_REQUEST)
             serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        staged_path, sha256 = uploads.stage_file(request.FILES['image'])
+        job = queue_photo_upload(request, serializer, staged_path, sha256)
+        return Response({**serializer.data, 'upload_id': job.pk}, status=status.HTTP_202_ACCEPTED)
+
+# Creates the photo for a staged file in "processing" and queues its upload job
+def queue_photo_upload(request, serializer, staged_path, sha256):
+    with transaction.atomic():
+        photo = serializer.save(user=request.user, image='', status=UploadStatus.PROCESSING)
+        job = UploadJob.objects.create(
+            user=request.user, photo=photo, kind=UploadJob.KIND_PHOTO, staged_path=staged_path, sha256=sha256
+        )
+        uploads.enqueue(job)
+    return job
+
+# Trending photos: highest time-decayed like/comment score first, read straight
+# off the photo_trending_idx index
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def trending_photos(request):
+    photos = Photo.objects.visible().filter(trending_score__gt=0).with_owner().with_viewer_state(request.user)
+    paginator = KeysetPagination(ordering=PHOTO_LIST_ORDERINGS['trending'])
+    paginated_photos = paginator.paginate_queryset(photos, request)
+    return paginator.get_paginated_response(serialize_photos(paginated_photos, request))
+
+# Photo search over captions, comments and usernames, best match first
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def photo_search(request):
+    query = request.GET.get('q', '')
+    if not search.query_terms(query):
+        return Response({"error": "Search query is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    photos = search.search_photos(query).with_owner().with_viewer_state(request.user)
+    paginator = KeysetPagination(ordering=('-search_rank', '-id'))
+    paginated_photos = paginator.paginate_queryset(photos, request)
+    return paginator.get_paginated_response(serialize_photos(paginated_photos, request))
+
+# Photos tagged with a hashtag, newest first, along with the tag's photo count
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def tag_photos(request, name):
+    try:
+        tag = Tag.objects.get(name=tags.normalize_tag(name))
+    except Tag.DoesNotExist:
+        return Response({"error": "Tag not found"}, status=404)
+
+    photos = Photo.objects.visible().filter(photo_tags__tag=tag).with_owner().with_viewer_state(request.user)
+    paginator = KeysetPagination(ordering=('-id',))
+    paginated_photos = paginator.paginate_queryset(photos, request)
+    response = paginator.get_paginated_response(serialize_photos(paginated_photos, request))
+    response.data.update({'name': tag.name, 'photo_count': tag.photo_count})
+    return response
 
 # Photo detail
+# Anonymous requests are served from the response cache.
+@replica_reads
+@vary_on_headers('Authorization')
+@condition(etag_func=caching.photo_etag, last_modified_func=caching.photo_last_modified)
 @api_view(['GET'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def photo_detail(request, pk):
+    cache_key, data = get_cached_photo(request, pk)
+    if data is not None:
+        return Response(data, headers={'X-Cache': 'HIT'})
+
     try:
-        photo = Photo.objects.get(pk=pk)
+        photo = detail_photos(request, cache_key).get(pk=pk)
     except Photo.DoesNotExist:
         return Response({"error": "Photo not found"}, status=404)
-    
-    serializer = PhotoSerializer(photo, context={'request': request})
-    return Response(serializer.data)
+    return photo_response(request, photo, cache_key)
 
 
+# photo_detail as an async view (see photo_feed_async)
+@replica_reads
+@vary_on_headers('Authorization')
+@caching.async_condition(caching.photo_state)
+@async_api_view
+@permission_classes([IsAuthenticatedOrReadOnly])
+async def photo_detail_async(request, pk):
+    cache_key, data = await aget_cached_photo(request, pk)
+    if data is not None:
+        return Response(data, headers={'X-Cache': 'HIT'})
+
+    try:
+        photo = await detail_photos(request, cache_key).aget(pk=pk)
+    except Photo.DoesNotExist:
+        return Response({"error": "Photo not found"}, status=404)
+    return await aphoto_response(request, photo, cache_key)
+
+
+# Parts of photo_detail shared with photo_detail_async
+
+def get_cached_photo(request, pk):
+    if not request.user.is_anonymous:
+        return None, None
+    return caching.get_cached_photo(pk)
+
+
+def detail_photos(request, cache_key):
+    # Owners can poll their own photo while it is processing. A photo that is
+    # going to be cached is read from the primary, as in feed_photos.
+    photos = Photo.objects.visible_to(request.user).with_owner().with_viewer_state(request.user)
+    return photos.using(DEFAULT_DB_ALIAS) if cache_key else photos
+
+
+def photo_response(request, photo, cache_key):
+    response = Response(serialize_photos([photo], request)[0])
+    if cache_key:
+        caching.set_cached(cache_key, response.data)
+        response['X-Cache'] = 'MISS'
+    return response
+
+
+aget_cached_photo = sync_to_async(get_cached_photo)
+aphoto_response = sync_to_async(photo_response)
+
+
+# Most ids photo_batch accepts in one request
+PHOTO_BATCH_MAX_IDS = 100
+
+# Largest value of a BigAutoField primary key
+MAX_PHOTO_ID = 2 ** 63 - 1
+
+# Several photos by id (?ids=3,1,2), in the order asked for, in a fixed number
+# of queries however many ids are given. Ids with no photo, or with one that is
+# still processing or failed to upload, are listed in "missing".
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def photo_batch(request):
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()))
+        if not all(0 < pk <= MAX_PHOTO_ID for pk in ids):
+            raise ValueError
+    except ValueError:
+        return Response({"error": "ids must be a comma-separated list of photo ids"}, status=status.HTTP_400_BAD_REQUEST)
+    if not ids:
+        return Response({"error": "ids is required"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > PHOTO_BATCH_MAX_IDS:
+        return Response({"error": f"At most {PHOTO_BATCH_MAX_IDS} ids per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+    photos = Photo.objects.visible().with_owner().with_viewer_state(request.user).in_bulk(ids)
+    found = [photos[pk] for pk in ids if pk in photos]
+    return Response({
+        'results': serialize_photos(found, request),
+        'missing': [pk for pk in ids if pk not in photos],
+    })
+
 # Photo update & delete
 @api_view(['PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
@@ -92,7 +335,7 @@ def photo_update_delete(request, pk):
         return Response({"error": "You can only modify your own posts"}, status=403)
 
     if request.method == 'PATCH':
-        serializer = PhotoSerializer(photo, data=request.data, partial=True)
+        serializer = PhotoSerializer(photo, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
@@ -102,13 +345,39 @@ def photo_update_delete(request, pk):
         photo.delete()
         return Response(status=204)
 
+# Comments on a photo, newest first
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def photo_comments(request, photo_id):
+    if not Photo.objects.visible_to(request.user).filter(pk=photo_id).exists():
+        return Response({"error": "Photo not found"}, status=404)
+
+    comments = Comment.objects.filter(photo_id=photo_id).select_related('user__profile')
+    paginator = KeysetPagination()
+    paginated_comments = paginator.paginate_queryset(comments, request)
+    serializer = CommentSerializer(paginated_comments, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+# Response cache hit/miss counters
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(caching.cache_stats())
+
 # Create comment
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([CommentThrottle])
 def comment_create(request):
     serializer = CommentSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save(user=request.user)
+        if not Photo.objects.visible_to(request.user).filter(pk=serializer.validated_data['photo'].pk).exists():
+            return Response({"error": "Photo not found"}, status=404)
+        with transaction.atomic():
+            comment = serializer.save(user=request.user)
+            Photo.objects.filter(pk=comment.photo_id).update(comment_count=F('comment_count') + 1)
+            trending.add(comment.photo_id, trending.COMMENT_WEIGHT)
         return Response(serializer.data, status=201)
     return Response(serializer.errors, status=400)
 
@@ -126,48 +395,156 @@ def comment_delete(request, pk):
     if comment.user != request.user and comment.photo.user != request.user:
         return Response({"error": "You can only delete your own comments or comments on your photos"}, status=403)
 
-    comment.delete()
+    with transaction.atomic():
+        # Only the request that actually deleted the row moves the counters
+        deleted = Comment.objects.filter(pk=comment.pk).delete()[1].get(Comment._meta.label, 0)
+        if not deleted:
+            return Response({"error": "Comment not found"}, status=404)
+        Photo.objects.filter(pk=comment.photo_id).update(comment_count=F('comment_count') - 1)
+        trending.add(comment.photo_id, -trending.COMMENT_WEIGHT, comment.created_at)
     return Response(status=204)
 
 
+# Sets or clears a user's like/bookmark on a photo without loading the photo.
+# The insert relies on the unique (user, photo) constraint instead of a prior
+# lookup, so concurrent calls cannot both succeed, and the counter only moves
+# when a row was actually inserted or deleted. A trending_weight also moves the
+# photo's trending score. Returns (changed, new_count) and raises
+# Photo.DoesNotExist, undoing the change, if the photo is gone or not visible.
+def set_photo_flag(model, counter, user, photo_id, value, trending_weight=0):
+    with transaction.atomic():
+        created_at = None
+        if value:
+            try:
+                with transaction.atomic():
+                    model.objects.create(user=user, photo_id=photo_id)
+                changed = True
+            except IntegrityError:
+                # Already set, or the photo does not exist (checked below)
+                changed = False
+        else:
+            flags = model.objects.filter(user=user, photo_id=photo_id)
+            if trending_weight:
+                created_at = flags.values_list('created_at', flat=True).first()
+            changed = flags.delete()[0] > 0
+
+        if changed:
+            delta = 1 if value else -1
+            Photo.objects.filter(pk=photo_id).update(**{counter: F(counter) + delta})
+            if trending_weight:
+                trending.add(photo_id, delta * trending_weight, created_at)
+        count = Photo.objects.visible().filter(pk=photo_id).values_list(counter, flat=True).get()
+    return changed, count
+
+
+def toggle_photo_flag(model, counter, user, photo_id, trending_weight=0):
+    with transaction.atomic():
+        removed, count = set_photo_flag(model, counter, user, photo_id, False, trending_weight)
+        if removed:
+            return False, count
+        _, count = set_photo_flag(model, counter, user, photo_id, True, trending_weight)
+        return True, count
+
+
+def like_response(liked, count):
+    return Response({"status": "liked" if liked else "unliked", "liked": liked, "likes_count": count})
+
+
+def save_response(saved, count):
+    return Response({"status": "saved" if saved else "unsaved", "saved": saved, "bookmarks_count": count})
+
+
 # Like/Unlike toggle
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ToggleThrottle])
 def like_toggle(request, photo_id):
     try:
-        photo = Photo.objects.get(id=photo_id)
+        liked, count = toggle_photo_flag(Like, 'like_count', request.user, photo_id, trending.LIKE_WEIGHT)
     except Photo.DoesNotExist:
         return Response({"error": "Photo not found"}, status=404)
-    
-    like, created = Like.objects.get_or_create(user=request.user, photo=photo)
-    if not created:
-        like.delete()
-        return Response({"status": "unliked"})
-    return Response({"status": "liked"})
+    return like_response(liked, count)
+
+# Idempotent like (PUT) and unlike (DELETE)
+@api_view(['PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ToggleThrottle])
+def photo_like(request, photo_id):
+    liked = request.method == 'PUT'
+    try:
+        _, count = set_photo_flag(Like, 'like_count', request.user, photo_id, liked, trending.LIKE_WEIGHT)
+    except Photo.DoesNotExist:
+        return Response({"error": "Photo not found"}, status=404)
+    return like_response(liked, count)
+
+# Users who liked a photo, newest first
+@replica_reads
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def photo_likers(request, photo_id):
+    if not Photo.objects.visible_to(request.user).filter(pk=photo_id).exists():
+        return Response({"error": "Photo not found"}, status=404)
+
+    likes = Like.objects.filter(photo_id=photo_id).select_related('user__profile')
+    paginator = KeysetPagination()
+    paginated_likes = paginator.paginate_queryset(likes, request)
+    serializer = LikeSerializer(paginated_likes, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+# Follow (PUT) and unfollow (DELETE) a user, idempotently. As with likes, the
+# unique constraint decides whether anything changed and only then are the
+# profile counters and the follower's timeline updated.
+@api_view(['PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ToggleThrottle])
+def user_follow(request, user_id):
+    if user_id == request.user.pk:
+        return Response({"error": "You cannot follow yourself"}, status=400)
+    if not User.objects.filter(pk=user_id).exists():
+        return Response({"error": "User not found"}, status=404)
+
+    following = request.method == 'PUT'
+    with transaction.atomic():
+        if following:
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(follower=request.user, followee_id=user_id)
+                changed = True
+            except IntegrityError:
+                changed = False
+        else:
+            changed = Follow.objects.filter(follower=request.user, followee_id=user_id).delete()[0] > 0
+
+        if changed:
+            delta = 1 if following else -1
+            Profile.objects.filter(user_id=user_id).update(followers_count=F('followers_count') + delta)
+            Profile.objects.filter(user=request.user).update(following_count=F('following_count') + delta)
+            # The counters were updated in place, so drop both cached profiles by hand
+            authentication.invalidate_user(user_id)
+            authentication.invalidate_user(request.user.pk)
+            update = timeline.follow if following else timeline.unfollow
+            transaction.on_commit(lambda: update(request.user.pk, user_id))
+        count = Profile.objects.filter(user_id=user_id).values_list('followers_count', flat=True).get()
+
+    return Response({"following": following, "followers_count": count})
 
 # Password reset request 
 @api_view(['POST'])
 @permission_classes([AllowAny])  
+@throttle_classes([PasswordResetThrottle, PasswordResetEmailThrottle])
 def password_reset_request(request):
     email = request.data.get('email')
-    if not email:
+    if not email or not isinstance(email, str):
         return JsonResponse({'error': 'Email is required'}, status=400)
-
+    email = email.strip()
     try:
-        user = User.objects.get(email=email)
-        uid = urlsafe_base64_encode(force_bytes(user.pk))
-        token = default_token_generator.make_token(user)
-        frontend_base = "http://localhost:5173"  
-        reset_url = f"{frontend_base}/reset-password/{uid}/{token}/"
-
-        send_mail(
-            subject='Password Reset Request',
-            message=f"Click the link to reset your password:\n{reset_url}",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-        )
-    except User.DoesNotExist:
-        pass  
+        validate_email(email)
+    except ValidationError:
+        return JsonResponse({'error': 'Enter a valid email address'}, status=400)
+
+    # Queued whether or not an account uses the address, so the response takes the
+    # same time either way; the sender looks the user up (see core/outbox.py)
+    outbox.queue_email(OutboxEmail.KIND_PASSWORD_RESET, email)
 
     return JsonResponse({'message': 'If an account with that email exists, a reset link has been sent.'})
 
@@ -204,52 +581,92 @@ def current_user_profile(request):
         return Response(serializer.data)
 
     elif request.method in ['PUT', 'PATCH']:
-        serializer = UserProfileSerializer(user, data=request.data, partial=True)
+        with transaction.atomic():
+            serializer = UserProfileSerializer(get_user_for_update(request), data=request.data, partial=True)
 
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+            if serializer.is_valid():
+                serializer.save()
+                return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+def get_user_for_update(request):
+    # The request's user and profile read again from the primary and locked.
+    # request.user can come from the authentication cache (core/authentication.py)
+    # and be older than the database, so it is never saved back.
+    return User.objects.select_related('profile').select_for_update().get(pk=request.user.pk)
+
 # Change password in Profile Page 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def change_password(request):
-    user = request.user
     data = request.data
     current_password = data.get("current_password")
     new_password = data.get("new_password")
 
-    if not user.check_password(current_password):
-        return Response({"detail": "Current password is incorrect"}, status=400)
+    with transaction.atomic():
+        user = get_user_for_update(request)
+        if not user.check_password(current_password):
+            return Response({"detail": "Current password is incorrect"}, status=400)
 
-    user.set_password(new_password)
-    user.save()
+        user.set_password(new_password)
+        user.save(update_fields=['password'])
     return Response({"detail": "Password updated successfully"})
 
 # Save/Unsaved photos
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ToggleThrottle])
 def save_toggle(request, photo_id):
     try:
-        photo = Photo.objects.get(id=photo_id)
+        saved, count = toggle_photo_flag(Bookmark, 'bookmark_count', request.user, photo_id)
     except Photo.DoesNotExist:
         return Response({"error": "Photo not found"}, status=404)
-    
-    bookmark, created = Bookmark.objects.get_or_create(user=request.user, photo=photo)
-    if not created:
-        bookmark.delete()
-        return Response({"status": "unsaved"})
-    return Response({"status": "saved"})
+    return save_response(saved, count)
+
+# Idempotent save (PUT) and unsave (DELETE)
+@api_view(['PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ToggleThrottle])
+def photo_save(request, photo_id):
+    saved = request.method == 'PUT'
+    try:
+        _, count = set_photo_flag(Bookmark, 'bookmark_count', request.user, photo_id, saved)
+    except Photo.DoesNotExist:
+        return Response({"error": "Photo not found"}, status=404)
+    return save_response(saved, count)
 
 # Get saved photos
+# Most recently saved first, keyset-paginated on the bookmark's (created_at, id),
+# which bookmark_user_created_idx covers.
+@replica_reads
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def saved_photos(request):
-    saved = Bookmark.objects.filter(user=request.user).select_related('photo')
-    photos = [bookmark.photo for bookmark in saved]
-    serializer = PhotoSerializer(photos, many=True, context={"request": request})
-    return Response(serializer.data)
+    photos, paginator = saved_photos_page(request)
+    paginated_photos = paginator.paginate_queryset(photos, request)
+    return paginator.get_paginated_response(serialize_photos(paginated_photos, request))
+
+# saved_photos as an async view (see photo_feed_async)
+@replica_reads
+@async_api_view
+@permission_classes([IsAuthenticated])
+async def saved_photos_async(request):
+    photos, paginator = saved_photos_page(request)
+    paginated_photos = await paginator.apaginate_queryset(photos, request)
+    return paginator.get_paginated_response(await aserialize_photos(paginated_photos, request))
+
+
+def saved_photos_page(request):
+    # The user's saved photos and their paginator, shared by saved_photos and
+    # saved_photos_async
+    photos = (
+        Photo.objects.visible_to(request.user).filter(bookmarks__user=request.user)
+        .annotate(saved_at=F('bookmarks__created_at'), bookmark_id=F('bookmarks__id'))
+        .with_owner()
+        .with_viewer_state(request.user)
+    )
+    return photos, KeysetPagination(ordering=('-saved_at', '-bookmark_id'))
 
 # Update profile photo
 @api_view(['POST'])
@@ -258,18 +675,154 @@ def update_profile_photo(request):
     if 'profile_photo' not in request.FILES:
         return Response({'error': 'No photo provided'}, status=400)
     
+    # The file is stored by the upload pipeline; poll upload-status for the result
+    staged_path, sha256 = uploads.stage_file(request.FILES['profile_photo'])
+    with transaction.atomic():
+        job = UploadJob.objects.create(
+            user=request.user, kind=UploadJob.KIND_PROFILE_PHOTO, staged_path=staged_path, sha256=sha256
+        )
+        uploads.enqueue(job)
+
+    return Response({
+        'message': 'Profile photo upload started',
+        'upload_id': job.pk,
+        'status': job.status,
+    }, status=status.HTTP_202_ACCEPTED)
+
+# Upload status
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def upload_status(request, pk):
     try:
-        profile = request.user.profile
-        profile.profile_photo = request.FILES['profile_photo']
-        profile.save()
-        
-        return Response({
-            'message': 'Profile photo updated successfully',
-            'profile_photo': profile.profile_photo.url
-        })
-    except Exception as e:
-        print('Error:', str(e))  # For debugging
-        return Response({'error': str(e)}, status=400)
+        job = UploadJob.objects.select_related('photo', 'user__profile').get(pk=pk, user=request.user)
+    except UploadJob.DoesNotExist:
+        return Response({"error": "Upload not found"}, status=404)
+
+    serializer = UploadJobSerializer(job)
+    return Response(serializer.data)
+
+# Start a chunked upload
+# Resumable uploads for large files: POST the file's name and size here, PUT the
+# bytes in order to chunked-upload-detail, then finalize to create the photo.
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def chunked_upload_create(request):
+    serializer = UploadSessionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    staged_path = uploads.staged_file_path(serializer.validated_data['filename'])
+    staged_path.touch()
+    serializer.save(user=request.user, staged_path=str(staged_path))
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+# Chunked upload status and chunks
+# GET reports the offset to resume from. PUT appends the raw request body at the
+# offset given in the Upload-Offset header; the Upload-Checksum header
+# ("sha256 <base64 digest>") must match the chunk, otherwise it is discarded.
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def chunked_upload_detail(request, pk):
+    if request.method == 'GET':
+        try:
+            session = UploadSession.objects.get(pk=pk, user=request.user)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload not found"}, status=404)
+        return Response(UploadSessionSerializer(session).data)
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        algorithm, expected = request.headers['Upload-Checksum'].split(' ', 1)
+        expected = base64.b64decode(expected, validate=True)
+        length = int(request.headers.get('Content-Length') or 0)
+    except (KeyError, ValueError, binascii.Error):
+        return Response(
+            {"error": "Upload-Offset and Upload-Checksum (sha256 <base64 digest>) headers are required"},
+            status=400,
+        )
+    if algorithm != 'sha256':
+        return Response({"error": "Only sha256 checksums are supported"}, status=400)
+    if not 0 < length <= settings.UPLOAD_CHUNK_MAX_SIZE:
+        return Response({"error": f"Chunks must be 1 to {settings.UPLOAD_CHUNK_MAX_SIZE} bytes"}, status=400)
+
+    try:
+        session = UploadSession.objects.get(pk=pk, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({"error": "Upload not found"}, status=404)
+    error = chunk_conflict(session, offset)
+    if error:
+        return error
+    if offset + length > session.size:
+        return Response({"error": "Chunk extends past the end of the file"}, status=400)
+
+    # The body is streamed to a part file with no transaction or lock held, and
+    # only added to the file if the offset did not move in the meantime, so
+    # concurrent PUTs for one session cannot interleave
+    part, written, digest = uploads.write_chunk(session.staged_path, request.stream, length)
+    try:
+        if written != length or digest != expected:
+            return Response({"error": "Chunk checksum mismatch", "offset": offset}, status=400)
+        with transaction.atomic():
+            advanced = UploadSession.objects.filter(pk=session.pk, offset=offset, job__isnull=True).update(
+                offset=F('offset') + written, updated_at=timezone.now()
+            )
+            if not advanced:
+                session.refresh_from_db(fields=['offset', 'job'])
+                return chunk_conflict(session, offset)
+            uploads.append_chunk(session.staged_path, part, offset)
+    finally:
+        uploads.discard_staged_file(part)
+
+    session.offset += written
+    return Response(UploadSessionSerializer(session).data)
+
+
+def chunk_conflict(session, offset):
+    # The 409 response for a chunk at offset that the session cannot take next
+    if session.job_id is not None:
+        return Response({"error": "Upload already finalized"}, status=409)
+    if offset != session.offset:
+        return Response({"error": "Offset does not match", "offset": session.offset}, status=409)
+    return None
+
+# Finalize a chunked upload
+# Creates the photo from the complete file, which then goes through the same
+# upload pipeline as a regular multipart upload.
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def chunked_upload_finalize(request, pk):
+    session, error = get_finalizable_session(request, pk)
+    if error:
+        return error
+    # A complete file takes no more chunks, so it is hashed before the row lock
+    # is taken instead of holding the lock for the whole file
+    sha256 = uploads.hash_file(session.staged_path)
+
+    with transaction.atomic():
+        session, error = get_finalizable_session(request, pk, lock=True)
+        if error:
+            return error
+        serializer = PhotoSerializer(data={'caption': request.data.get('caption', '')}, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        session.job = queue_photo_upload(request, serializer, session.staged_path, sha256)
+        session.save(update_fields=['job', 'updated_at'])
+    return Response({**serializer.data, 'upload_id': session.job_id}, status=status.HTTP_202_ACCEPTED)
+
+
+def get_finalizable_session(request, pk, lock=False):
+    # The user's upload session if it is complete and not finalized yet, else
+    # the error response
+    sessions = UploadSession.objects.select_for_update() if lock else UploadSession.objects
+    try:
+        session = sessions.get(pk=pk, user=request.user)
+    except UploadSession.DoesNotExist:
+        return None, Response({"error": "Upload not found"}, status=404)
+    if session.job_id is not None:
+        return None, Response({"error": "Upload already finalized"}, status=409)
+    if session.offset != session.size:
+        return None, Response({"error": "Upload is incomplete", "offset": session.offset}, status=409)
+    return session, None
 
 # Delete profile photo
 @api_view(['DELETE'])
@@ -278,7 +831,7 @@ def delete_profile_photo(request):
     try:
         profile = request.user.profile
         profile.profile_photo = None
-        profile.save()
+        profile.save(update_fields=['profile_photo'])
         return Response({'message': 'Profile photo removed successfully'})
     except Exception as e:
         return Response({'error': str(e)}, status=400)
\ No newline at end of file
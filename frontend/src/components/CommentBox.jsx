@@ -3,8 +3,41 @@ import axios from '../api/axios';
 import { motion } from 'framer-motion';
 import { Send } from 'lucide-react';
 
+// This component loads the next page of older comments for a photo.
+// cursor comes from the photo's comments_cursor or the previous page.
+export const EarlierCommentsButton = ({ photoId, cursor, onLoad }) => {
+  const [loading, setLoading] = useState(false);
+
+  if (!cursor) return null;
+
+  const handleLoad = async () => {
+    setLoading(true);
+    try {
+      const res = await axios.get(`/photos/${photoId}/comments/`, {
+        params: { cursor },
+      });
+      // Pages come newest first, the list is shown oldest first
+      onLoad([...res.data.results].reverse(), res.data.next_cursor);
+    } catch (err) {
+      console.error('Failed to load comments:', err);
+    }
+    setLoading(false);
+  };
+
+  return (
+    <button
+      type="button"
+      onClick={handleLoad}
+      disabled={loading}
+      className="text-sm font-medium text-gray-500 hover:text-pink-600 transition-colors duration-200"
+    >
+      {loading ? 'Loading...' : 'View earlier comments'}
+    </button>
+  );
+};
+
 // This component allows users to add comments to a photo. 
-const CommentBox = ({ photoId, onNewComment }) => {
+const CommentBox = ({ photoId, onNewComment, nextCursor, onOlderComments }) => {
   const [text, setText] = useState('');
   const [loading, setLoading] = useState(false);
 
@@ -42,6 +75,15 @@ const CommentBox = ({ photoId, onNewComment }) => {
       animate={{ opacity: 1, y: 0 }}
       className="mt-4 relative"
     >
+      {onOlderComments && (
+        <div className="mb-2">
+          <EarlierCommentsButton
+            photoId={photoId}
+            cursor={nextCursor}
+            onLoad={onOlderComments}
+          />
+        </div>
+      )}
       <div className="flex items-center gap-2 bg-gray-50 p-2 rounded-xl border border-gray-200">
         <input
           type="text"
@@ -7,23 +7,18 @@ import { formatLikeCount } from '../utils/formatLikeCount';
 const LikeButton = ({ photoId, isLiked, likeCount, onLikeChange }) => {
   const token = localStorage.getItem('access_token');
 
+  // PUT likes and DELETE unlikes, so repeated taps cannot flip the state back
   const handleToggleLike = async () => {
     try {
-      const response = await axios.post(
-        `http://localhost:8000/api/photos/${photoId}/like-toggle/`,
-        {},
-        {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        }
-      );
+      const response = await axios({
+        method: isLiked ? 'delete' : 'put',
+        url: `http://localhost:8000/api/photos/${photoId}/like/`,
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
 
-      if (response.data.status === 'liked') {
-        onLikeChange(true);
-      } else {
-        onLikeChange(false);
-      }
+      onLikeChange(response.data.liked, response.data.likes_count);
     } catch (error) {
       console.error('Failed to toggle like', error);
     }
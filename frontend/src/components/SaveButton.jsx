@@ -6,23 +6,18 @@ import { motion } from 'framer-motion';
 const SaveButton = ({ photoId, isSaved, onSaveChange }) => {
   const token = localStorage.getItem('access_token');
 
+  // PUT saves and DELETE unsaves, so repeated taps cannot flip the state back
   const handleToggleSave = async () => {
     try {
-      const response = await axios.post(
-        `http://localhost:8000/api/photos/${photoId}/save-toggle/`,
-        {},
-        {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        }
-      );
+      const response = await axios({
+        method: isSaved ? 'delete' : 'put',
+        url: `http://localhost:8000/api/photos/${photoId}/save/`,
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
 
-      if (response.data.status === 'saved') {
-        onSaveChange(true);
-      } else {
-        onSaveChange(false);
-      }
+      onSaveChange(response.data.saved, response.data.bookmarks_count);
     } catch (error) {
       console.error('Failed to toggle save', error);
     }
@@ -2,10 +2,13 @@ import { useEffect, useState, useRef } from 'react';
 import axios from '../api/axios';
 import { Heart } from 'lucide-react';
 import { useNavigate } from 'react-router-dom';
-import { getCurrentUserId } from '../utils/auth';
 import FeedSkeleton from '../components/skeletons/FeedSkeleton';
 import { DefaultAvatar } from '../components/DefaultAvatar';
 
+// Width of one feed column (matches the columns-* classes of the feed grid)
+const FEED_IMAGE_SIZES =
+  '(min-width: 1024px) 25vw, (min-width: 768px) 33vw, (min-width: 640px) 50vw, 100vw';
+
 // This component displays a photo card with user info and likes
 export const PhotoCard = ({ photo, onClick }) => {
   const DEFAULT_PROFILE_PHOTO =
@@ -13,9 +16,7 @@ export const PhotoCard = ({ photo, onClick }) => {
   const CLOUDINARY_BASE_URL = 'https://res.cloudinary.com/daz3cgmrp';
 
   const [hovered, setHovered] = useState(false);
-  const currentUserId = getCurrentUserId();
-  const isLikedByCurrentUser =
-    currentUserId && photo.likes.includes(currentUserId);
+  const isLikedByCurrentUser = photo.liked_by_me;
 
   const getProfilePhotoUrl = (photoUrl) => {
     if (!photoUrl) return DEFAULT_PROFILE_PHOTO;
@@ -43,11 +44,33 @@ export const PhotoCard = ({ photo, onClick }) => {
       onMouseLeave={() => setHovered(false)}
       onClick={onClick}
     >
-      <img
-        src={photo.image.replace(/^image\/upload\//, '')}
-        alt={photo.caption}
-        className="w-full h-auto object-cover transition-transform duration-300 group-hover:scale-105"
-      />
+      <picture>
+        {/* Processed uploads come with resized variants; browsers pick the
+            smallest one that fills a feed column, in the best format they decode */}
+        {['avif', 'webp']
+          .filter((format) => photo.srcset?.[format])
+          .map((format) => (
+            <source
+              key={format}
+              type={`image/${format}`}
+              srcSet={photo.srcset[format]}
+              sizes={FEED_IMAGE_SIZES}
+            />
+          ))}
+        <img
+          src={photo.image.replace(/^image\/upload\//, '')}
+          srcSet={photo.srcset?.jpeg}
+          sizes={FEED_IMAGE_SIZES}
+          alt={photo.caption}
+          loading="lazy"
+          // Reserve the image's box and fill it with its dominant color until it loads
+          style={{
+            aspectRatio: photo.width ? `${photo.width} / ${photo.height}` : undefined,
+            backgroundColor: photo.dominant_color || undefined,
+          }}
+          className="w-full h-auto object-cover transition-transform duration-300 group-hover:scale-105"
+        />
+      </picture>
 
       {/* Always visible overlay with user info and likes */}
       <div className="absolute bottom-0 left-0 right-0 p-4 bg-gradient-to-t from-black/80 to-transparent">
@@ -98,13 +121,13 @@ export default function Feed() {
   const SCROLL_LIMIT = 6;
   const [photos, setPhotos] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
-  const [offset, setOffset] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   const [hasMore, setHasMore] = useState(true);
   const [isFetchingMore, setIsFetchingMore] = useState(false);
   const loaderRef = useRef(null);
   const navigate = useNavigate();
 
-  const fetchPhotos = async (currentOffset, isInitialLoad = false) => {
+  const fetchPhotos = async (cursor, isInitialLoad = false) => {
     if (isFetchingMore) {
       return;
     }
@@ -113,8 +136,16 @@ export default function Feed() {
       setIsFetchingMore(true);
       const limit = isInitialLoad ? INITIAL_LIMIT : SCROLL_LIMIT;
 
+      const params = new URLSearchParams({ limit });
+      if (cursor) {
+        params.set('cursor', cursor);
+      }
+
+      // Send the token when logged in so liked_by_me reflects the viewer
+      const token = localStorage.getItem('access_token');
       const res = await axios.get(
-        `http://localhost:8000/api/photos/feed/?limit=${limit}&offset=${currentOffset}`
+        `http://localhost:8000/api/photos/feed/?${params.toString()}`,
+        token ? { headers: { Authorization: `Bearer ${token}` } } : {}
       );
       const newPhotos = res.data.results;
 
@@ -124,9 +155,9 @@ export default function Feed() {
         return [...prevPhotos, ...filtered];
       });
 
-      // Update hasMore based on whether we got fewer photos than requested
-      const hasMorePhotos = newPhotos.length >= limit;
-      setHasMore(hasMorePhotos);
+      // The server only returns a cursor when there is another page
+      setNextCursor(res.data.next_cursor);
+      setHasMore(Boolean(res.data.next_cursor));
     } catch (err) {
       console.error('Failed to fetch photos:', err);
     } finally {
@@ -137,7 +168,7 @@ export default function Feed() {
 
   // Initial load
   useEffect(() => {
-    fetchPhotos(0, true);
+    fetchPhotos(null, true);
   }, []);
 
   // Intersection Observer for infinite scroll
@@ -146,11 +177,7 @@ export default function Feed() {
       (entries) => {
         const firstEntry = entries[0];
         if (firstEntry.isIntersecting && hasMore && !isFetchingMore) {
-          setOffset((prevOffset) => {
-            const newOffset = prevOffset + SCROLL_LIMIT;
-            fetchPhotos(newOffset, false);
-            return newOffset;
-          });
+          fetchPhotos(nextCursor, false);
         }
       },
       {
@@ -168,7 +195,7 @@ export default function Feed() {
         observer.unobserve(loaderRef.current);
       }
     };
-  }, [hasMore, isFetchingMore]);
+  }, [hasMore, isFetchingMore, nextCursor]);
 
   if (isLoading && photos.length === 0) {
     return <FeedSkeleton />;
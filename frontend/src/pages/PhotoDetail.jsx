@@ -15,6 +15,7 @@ import { getCurrentUserId } from '../utils/auth';
 import { PhotoCard } from './Feed';
 import LikeButton from '../components/LikeButton';
 import SaveButton from '../components/SaveButton';
+import { EarlierCommentsButton } from '../components/CommentBox';
 import { motion } from 'framer-motion';
 import { DefaultAvatar } from '../components/DefaultAvatar';
 
@@ -71,7 +72,7 @@ const formatRelativeTime = (dateString) => {
 };
 
 // Comment component for displaying individual comments
-const Comment = ({ comment, comments, setComments, postUserId }) => {
+const Comment = ({ comment, comments, setComments, postUserId, onDelete }) => {
   const [isLiked, setIsLiked] = useState(false);
   const currentUserId = getCurrentUserId();
 
@@ -89,6 +90,7 @@ const Comment = ({ comment, comments, setComments, postUserId }) => {
         },
       });
       setComments(comments.filter((comment) => comment.id !== commentId));
+      onDelete();
     } catch (error) {
       console.error('Error deleting comment:', error);
       alert('Failed to delete comment.');
@@ -312,6 +314,7 @@ const PhotoDetail = () => {
 
   const [post, setPost] = useState(null);
   const [comments, setComments] = useState([]);
+  const [commentsCursor, setCommentsCursor] = useState(null);
   const [commentText, setCommentText] = useState('');
   const [showComments, setShowComments] = useState(true);
   const [loading, setLoading] = useState(true);
@@ -332,8 +335,8 @@ const PhotoDetail = () => {
 
   useEffect(() => {
     if (post) {
-      setIsLiked(post.liked);
-      setIsSaved(post.saved_by_user); 
+      setIsLiked(post.liked_by_me);
+      setIsSaved(post.saved_by_me);
       setLikeCount(post.likes_count);
     }
   }, [post]);
@@ -353,7 +356,7 @@ const PhotoDetail = () => {
             },
           }
         );
-        setPhotos(res.data);
+        setPhotos(res.data.results);
       } catch (err) {
         console.error('Failed to fetch user photos:', err);
       }
@@ -366,11 +369,14 @@ const PhotoDetail = () => {
   useEffect(() => {
     const fetchPost = async () => {
       try {
-        const res = await axios.get(`http://localhost:8000/api/photos/${id}/`);
+        const token = localStorage.getItem('access_token');
+        const res = await axios.get(
+          `http://localhost:8000/api/photos/${id}/`,
+          token ? { headers: { Authorization: `Bearer ${token}` } } : {}
+        );
         setPost(res.data);
-        setIsLiked(res.data.liked_by_user);
-        setIsSaved(res.data.saved_by_user); // new line for bookmark
         setComments(res.data.comments || []);
+        setCommentsCursor(res.data.comments_cursor);
       } catch (err) {
         console.error('Failed to fetch post', err);
       } finally {
@@ -397,8 +403,8 @@ const PhotoDetail = () => {
   if (!post)
     return <div className="pt-20 pl-16 md:pl-64 px-4">Post not found.</div>;
 
-  const isPostLiked = post.likes.includes(currentUserId);
-  const isPostSaved = post.bookmarks.includes(currentUserId);
+  const isPostLiked = post.liked_by_me;
+  const isPostSaved = post.saved_by_me;
 
   const handlePostComment = async () => {
     if (!commentText.trim()) return;
@@ -421,6 +427,7 @@ const PhotoDetail = () => {
 
       // Add the new comment to the list
       setComments((prev) => [...prev, res.data]);
+      setPost((prev) => ({ ...prev, comments_count: prev.comments_count + 1 }));
       setCommentText('');
     } catch (error) {
       console.error('Error posting comment:', error);
@@ -666,12 +673,13 @@ const PhotoDetail = () => {
                           photoId={post.id}
                           isLiked={isPostLiked}
                           likeCount={post.likes_count}
-                          onLikeChange={async () => {
-                            const res = await axios.get(
-                              `http://localhost:8000/api/photos/${post.id}/`
-                            );
-                            setPost(res.data);
-                          }}
+                          onLikeChange={(liked, likesCount) =>
+                            setPost((prev) => ({
+                              ...prev,
+                              liked_by_me: liked,
+                              likes_count: likesCount,
+                            }))
+                          }
                         />
                         <button
                           className="p-2 hover:bg-gray-100 rounded-full transition-colors duration-200"
@@ -690,12 +698,13 @@ const PhotoDetail = () => {
                         <SaveButton
                           photoId={post.id}
                           isSaved={isPostSaved}
-                          onSaveChange={async () => {
-                            const res = await axios.get(
-                              `http://localhost:8000/api/photos/${post.id}/`
-                            );
-                            setPost(res.data);
-                          }}
+                          onSaveChange={(saved, bookmarksCount) =>
+                            setPost((prev) => ({
+                              ...prev,
+                              saved_by_me: saved,
+                              bookmarks_count: bookmarksCount,
+                            }))
+                          }
                         />
                         <motion.button
                           onClick={() =>
@@ -725,8 +734,8 @@ const PhotoDetail = () => {
                     <div className="absolute bottom-0 left-0 w-full h-2 bg-pink-500 opacity-30 transform -rotate-1"></div>
                   </h3>
                   <span className="text-sm text-gray-500">
-                    {comments.length}{' '}
-                    {comments.length === 1 ? 'comment' : 'comments'}
+                    {post.comments_count}{' '}
+                    {post.comments_count === 1 ? 'comment' : 'comments'}
                   </span>
                 </div>
 
@@ -766,6 +775,14 @@ const PhotoDetail = () => {
 
                 {/* Comments List */}
                 <div className="space-y-6">
+                  <EarlierCommentsButton
+                    photoId={post.id}
+                    cursor={commentsCursor}
+                    onLoad={(olderComments, nextCursor) => {
+                      setComments((prev) => [...olderComments, ...prev]);
+                      setCommentsCursor(nextCursor);
+                    }}
+                  />
                   {comments.map((comment) => (
                     <Comment
                       key={comment.id}
@@ -773,6 +790,12 @@ const PhotoDetail = () => {
                       setComments={setComments}
                       comment={comment}
                       postUserId={post.user.id}
+                      onDelete={() =>
+                        setPost((prev) => ({
+                          ...prev,
+                          comments_count: prev.comments_count - 1,
+                        }))
+                      }
                     />
                   ))}
                   {comments.length === 0 && (
@@ -25,6 +25,7 @@ export default function ProfilePage() {
   const [fieldErrors, setFieldErrors] = useState({});
   const [fieldValues, setFieldValues] = useState({});
   const [photos, setPhotos] = useState([]);
+  const [nextPhotosUrl, setNextPhotosUrl] = useState(null);
   const [sortOption, setSortOption] = useState(
     () => localStorage.getItem('sortOption') || 'recent'
   );
@@ -35,6 +36,7 @@ export default function ProfilePage() {
   const [passwordError, setPasswordError] = useState('');
   const [passwordSuccess, setPasswordSuccess] = useState('');
   const [savedPhotos, setSavedPhotos] = useState([]);
+  const [nextSavedUrl, setNextSavedUrl] = useState(null);
   const [savedSortOption, setSavedSortOption] = useState('recent');
   const [searchParams, setSearchParams] = useSearchParams();
   const defaultTab = searchParams.get('tab') || 'uploaded';
@@ -52,18 +54,26 @@ export default function ProfilePage() {
     setSearchParams({ tab }); 
   };
 
-  useEffect(() => {
-    const fetchSavedPhotos = async () => {
-      try {
-        const token = localStorage.getItem('access_token');
-        const res = await axios.get('http://localhost:8000/api/photos/saved/', {
+  // Loads the newest saved photos, or the page at pageUrl when loading more
+  const fetchSavedPhotos = async (pageUrl = null) => {
+    try {
+      const token = localStorage.getItem('access_token');
+      const res = await axios.get(
+        pageUrl || 'http://localhost:8000/api/photos/saved/',
+        {
           headers: { Authorization: `Bearer ${token}` },
-        });
-        setSavedPhotos(res.data);
-      } catch (err) {
-        console.error('Failed to load saved photos', err);
-      }
-    };
+        }
+      );
+      setSavedPhotos((prevPhotos) =>
+        pageUrl ? [...prevPhotos, ...res.data.results] : res.data.results
+      );
+      setNextSavedUrl(res.data.next);
+    } catch (err) {
+      console.error('Failed to load saved photos', err);
+    }
+  };
+
+  useEffect(() => {
     if (activeTab === 'saved') fetchSavedPhotos();
   }, [activeTab]);
 
@@ -102,19 +112,26 @@ export default function ProfilePage() {
     fetchUserData();
   }, []);
 
-  const fetchPhotos = async () => {
-    setIsPhotoLoading(true);
+  // Loads the first page, or the page at pageUrl when loading more
+  const fetchPhotos = async (pageUrl = null) => {
+    if (!pageUrl) setIsPhotoLoading(true);
     try {
       const token = localStorage.getItem('access_token');
       const response = await axios.get(
-        `http://localhost:8000/api/photos/?user_id=${userData?.id}&sort_by=${sortOption}`,
+        pageUrl ||
+          `http://localhost:8000/api/photos/?user_id=${userData?.id}&sort_by=${sortOption}`,
         {
           headers: {
             Authorization: `Bearer ${token}`,
           },
         }
       );
-      setPhotos(response.data);
+      setPhotos((prevPhotos) =>
+        pageUrl
+          ? [...prevPhotos, ...response.data.results]
+          : response.data.results
+      );
+      setNextPhotosUrl(response.data.next);
     } catch (error) {
       console.error('Failed to fetch photos', error);
     } finally {
@@ -245,25 +262,39 @@ export default function ProfilePage() {
     formData.append('profile_photo', file);
 
     try {
+      const headers = {
+        Authorization: `Bearer ${localStorage.getItem('access_token')}`,
+      };
       const response = await axios.post(
         'http://localhost:8000/api/profile/update-photo/',
         formData,
-        {
-          headers: {
-            Authorization: `Bearer ${localStorage.getItem('access_token')}`,
-            'Content-Type': 'multipart/form-data',
-          },
-        }
+        { headers: { ...headers, 'Content-Type': 'multipart/form-data' } }
       );
 
-      if (response.data.profile_photo) {
-        setUserData((prev) => ({
-          ...prev,
-          profile_photo: response.data.profile_photo,
-        }));
-        setPhotoSuccess(true);
-        setTimeout(() => setPhotoSuccess(false), 3000);
+      // The photo is stored in the background; poll the job until it settles
+      let job = response.data;
+      while (job.status === 'processing') {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const res = await axios.get(
+          `http://localhost:8000/api/uploads/${response.data.upload_id}/`,
+          { headers }
+        );
+        job = res.data;
+      }
+      if (job.status === 'failed') {
+        setPhotoError(job.error || 'Failed to upload photo');
+        return;
       }
+
+      const profile = await axios.get('http://localhost:8000/api/profile/me/', {
+        headers,
+      });
+      setUserData((prev) => ({
+        ...prev,
+        profile_photo: profile.data.profile_photo,
+      }));
+      setPhotoSuccess(true);
+      setTimeout(() => setPhotoSuccess(false), 3000);
     } catch (error) {
       console.error(
         'Error uploading photo:',
@@ -632,6 +663,23 @@ export default function ProfilePage() {
                 </div>
               )}
             </div>
+
+            {(activeTab === 'uploaded' ? nextPhotosUrl : nextSavedUrl) && (
+              <div className="text-center mt-8">
+                <button
+                  onClick={() =>
+                    activeTab === 'uploaded'
+                      ? fetchPhotos(nextPhotosUrl)
+                      : fetchSavedPhotos(nextSavedUrl)
+                  }
+                  className="bg-white text-pink-600 px-8 py-3 rounded-full font-semibold
+                           hover:bg-gray-100 transition-colors duration-200
+                           shadow-md hover:shadow-lg"
+                >
+                  Load more
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>